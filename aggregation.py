@@ -0,0 +1,210 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+import logging
+import pandas as pd
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup, LatestAQI
+from src.models.aqi_repository import ROLLUP_GRANULARITIES, filter_by_location, merge_rollup_stats, rollup_bucket_start
+from src.models.parquet_archive import AQI_DATASET, parquet_available, archived_until, read_archive
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AGGREGATION_BUCKETS = ('hour', 'day', 'week', 'month')
+MAX_PERCENTILES = 5
+
+# Percentiles stored by the rollups, also the default
+ROLLUP_PERCENTILES = (95,)
+DEFAULT_PERCENTILES = ROLLUP_PERCENTILES
+
+# Readings are aggregated on these columns, named like their rollup statistics
+AGGREGATED_VALUES = {'pollutant': 'pollutant_avg', 'aqi': 'aqi_value'}
+
+def aggregate_aqi(city: str,
+                  state: Optional[str] = None,
+                  match: str = 'exact',
+                  pollutants: Optional[Sequence[str]] = None,
+                  bucket: str = 'day',
+                  start: Optional[datetime] = None,
+                  end: Optional[datetime] = None,
+                  percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> pd.DataFrame:
+    """
+    Compute per-bucket statistics of the AQI readings of a location
+    
+    Hour, day and month buckets are read from the precomputed rollups when
+    only the percentiles they store are requested; their p95 is exact for
+    hours and approximated from the hourly rollups for days and months.
+    Week buckets and other percentiles are computed from the raw readings,
+    so percentiles are exact: days already exported to the Parquet archive
+    are read from it (raw rows older than the retention period are only kept
+    there), newer days from the database. Only the four columns needed are
+    loaded, and the grouping runs vectorized in pandas.
+    
+    Args:
+        city: City name
+        state: State name
+        match: How city and state are matched, one of LOCATION_MATCH_MODES
+        pollutants: Pollutants to aggregate (defaults to all)
+        bucket: One of AGGREGATION_BUCKETS, weeks start on Monday
+        start: Only readings at or after this time
+        end: Only readings at or before this time
+        percentiles: Percentiles to compute, between 0 and 100
+    
+    Returns:
+        DataFrame with one row per bucket and pollutant, ordered by bucket
+    """
+    if bucket not in AGGREGATION_BUCKETS:
+        raise ValueError(f"Invalid bucket '{bucket}'. Use one of: {', '.join(AGGREGATION_BUCKETS)}")
+    if len(percentiles) > MAX_PERCENTILES or any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError(f'Use at most {MAX_PERCENTILES} percentiles between 0 and 100')
+    
+    if bucket in ROLLUP_GRANULARITIES and set(percentiles) <= set(ROLLUP_PERCENTILES):
+        stats = _rollup_stats(city, state, match, pollutants, bucket, start, end)
+    else:
+        stats = _reading_stats(city, state, match, pollutants, bucket, start, end, percentiles)
+    if stats.empty:
+        return pd.DataFrame(columns=aggregate_fields(percentiles))
+    
+    # Same fields as an AQIData row, so charts can plot buckets directly
+    stats['last_update'] = stats['bucket_start']
+    stats['pollutant_avg'] = stats['pollutant_mean']
+    # Buckets without any AQI value keep a missing aqi_value
+    stats['aqi_value'] = stats['aqi_mean'].round().astype('Int64')
+    
+    return stats[aggregate_fields(percentiles)]
+
+def aggregate_fields(percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> List[str]:
+    """Column names of aggregate_aqi() results"""
+    fields = ['bucket_start', 'pollutant_id', 'reading_count']
+    for prefix in AGGREGATED_VALUES:
+        fields += [f'{prefix}_min', f'{prefix}_max', f'{prefix}_mean']
+        fields += [f'{prefix}_{_percentile_name(p)}' for p in percentiles]
+    return fields + ['last_update', 'pollutant_avg', 'aqi_value']
+
+def to_records(stats: pd.DataFrame) -> List[Dict]:
+    """Convert aggregate_aqi() results to JSON-ready dicts"""
+    stats = stats.astype(object).where(stats.notna(), None)
+    records = stats.to_dict('records')
+    for record in records:
+        for field in ('bucket_start', 'last_update'):
+            record[field] = pd.Timestamp(record[field]).isoformat()
+    return records
+
+def _rollup_stats(city: str, state: Optional[str], match: str, pollutants: Optional[Sequence[str]],
+                  bucket: str, start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    """
+    Read per-bucket statistics from the rollups of one granularity
+    
+    Rollups are kept per city, so the rows of every matching city are
+    merged into one row per bucket and pollutant.
+    """
+    columns = ['bucket_start', 'pollutant_id', 'reading_count'] + [
+        f'{prefix}_{stat}' for prefix in AGGREGATED_VALUES for stat in ('min', 'max', 'mean', 'p95')
+    ]
+    
+    query = filter_by_location(select(*[getattr(AQIRollup, name) for name in columns]), AQIRollup, city, state, match)
+    query = query.where(AQIRollup.granularity == bucket)
+    if pollutants:
+        query = query.where(AQIRollup.pollutant_id.in_(pollutants))
+    if start:
+        query = query.where(AQIRollup.bucket_start >= rollup_bucket_start(start, bucket))
+    if end:
+        query = query.where(AQIRollup.bucket_start <= end)
+    
+    frame = pd.DataFrame(db.session.execute(query).all(), columns=columns)
+    if frame.empty:
+        return frame
+    
+    frame[columns[3:]] = frame[columns[3:]].astype(float)
+    return merge_rollup_stats(frame, ['bucket_start', 'pollutant_id']).sort_index().reset_index()
+
+def _reading_stats(city: str, state: Optional[str], match: str, pollutants: Optional[Sequence[str]],
+                   bucket: str, start: Optional[datetime], end: Optional[datetime],
+                   percentiles: Sequence[float]) -> pd.DataFrame:
+    """Compute per-bucket statistics from the raw readings"""
+    readings = _load_readings(city, state, match, pollutants, start, end)
+    readings = readings[readings['pollutant_avg'].notna()]
+    if readings.empty:
+        return pd.DataFrame()
+    
+    timestamps = pd.to_datetime(readings['last_update'])
+    if bucket in ('week', 'month'):
+        bucket_start = timestamps.dt.to_period('W-SUN' if bucket == 'week' else 'M').dt.start_time
+    else:
+        bucket_start = timestamps.dt.floor('h' if bucket == 'hour' else 'D')
+    
+    frame = pd.DataFrame({
+        'bucket_start': bucket_start,
+        'pollutant_id': readings['pollutant_id'],
+        'pollutant_avg': readings['pollutant_avg'].astype(float),
+        'aqi_value': readings['aqi_value'].astype(float)
+    })
+    grouped = frame.groupby(['bucket_start', 'pollutant_id'], sort=True)
+    
+    stats = grouped.agg(reading_count=('pollutant_avg', 'size'))
+    for prefix, column in AGGREGATED_VALUES.items():
+        stats[f'{prefix}_min'] = grouped[column].min()
+        stats[f'{prefix}_max'] = grouped[column].max()
+        stats[f'{prefix}_mean'] = grouped[column].mean()
+        if percentiles:
+            # One pass computing every percentile, unstacked to a column each
+            quantiles = grouped[column].quantile([p / 100 for p in percentiles]).unstack()
+            for p, q in zip(percentiles, quantiles.columns):
+                stats[f'{prefix}_{_percentile_name(p)}'] = quantiles[q]
+    
+    return stats.reset_index()
+
+def _load_readings(city: str, state: Optional[str], match: str, pollutants: Optional[Sequence[str]],
+                   start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    """Read the raw readings of a location from the archive and the database"""
+    columns = ['pollutant_id', 'last_update', 'pollutant_avg', 'aqi_value']
+    
+    boundary = archived_until(AQI_DATASET) if parquet_available() else None
+    frames = []
+    if boundary is not None and (start is None or start < boundary):
+        frames.append(_archived_readings(city, state, match, pollutants, columns, start,
+                                         min(end, boundary) if end else boundary))
+        start = max(start, boundary) if start else boundary
+    
+    query = filter_by_location(select(*[getattr(AQIData, name) for name in columns]), AQIData, city, state, match)
+    if pollutants:
+        query = query.where(AQIData.pollutant_id.in_(pollutants))
+    if start:
+        query = query.where(AQIData.last_update >= start)
+    if end:
+        query = query.where(AQIData.last_update <= end)
+    frames.append(pd.DataFrame(db.session.execute(query).all(), columns=columns))
+    
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+def _archived_readings(city: str, state: Optional[str], match: str, pollutants: Optional[Sequence[str]],
+                       columns: List[str], start: Optional[datetime], end: datetime) -> pd.DataFrame:
+    """
+    Read archived readings of a location
+    
+    The archive stores names as ingested, so the matching names are looked
+    up among the current stations and pushed down as an 'in' filter.
+    """
+    names = db.session.execute(
+        filter_by_location(select(LatestAQI.city, LatestAQI.state).distinct(), LatestAQI, city, state, match)
+    ).all()
+    if not names:
+        return pd.DataFrame(columns=columns)
+    
+    filters = [('city', 'in', sorted({name for name, _ in names}))]
+    if pollutants:
+        filters.append(('pollutant_id', 'in', list(pollutants)))
+    
+    frame = read_archive(AQI_DATASET, columns + ['city', 'state'], start, end, filters)
+    pairs = pd.MultiIndex.from_tuples([tuple(name) for name in names])
+    frame = frame[pd.MultiIndex.from_frame(frame[['city', 'state']]).isin(pairs)]
+    return frame[columns]
+
+def _percentile_name(percentile: float) -> str:
+    return f"p{percentile:g}".replace('.', '_')
@@ -79,6 +79,14 @@ class APIClient {
         return this.get('/aqi/historical', params);
     }
 
+    async getAggregatedAQI(params = {}) {
+        return this.get('/aqi/aggregate', params);
+    }
+
+    async getMapSnapshot(params = {}) {
+        return this.get('/aqi/map-snapshot', params);
+    }
+
     async getAQIForecast(params = {}) {
         return this.get('/aqi/forecast', params);
     }
@@ -2,28 +2,129 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from src.models.user import db
 
+def normalize_location_key(value) -> str:
+    """Lookup key of a city or state name: trimmed and lowercased"""
+    return (value or '').strip().lower()
+
+def _location_key_default(column: str):
+    """Column default deriving a lookup key from the row's city or state"""
+    def default(context):
+        return normalize_location_key(context.get_current_parameters().get(column))
+    return default
+
+# Values of the coded columns. Codes are list positions, so only ever
+# append to these lists.
+POLLUTANTS = ('PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'OZONE', 'NH3')
+AQI_CATEGORY_NAMES = ('Good', 'Satisfactory', 'Moderate', 'Poor', 'Very Poor', 'Severe', 'Unknown')
+
+# Version of forecasts stored without one
+DEFAULT_MODEL_VERSION = 'default'
+
+class CodedString(db.TypeDecorator):
+    """
+    String column stored as a small integer code
+    
+    Values are encoded on write and decoded on read, so queries, inserts
+    and to_dict() keep working with the string values.
+    """
+    impl = db.SmallInteger
+    cache_ok = True
+    
+    def __init__(self, values, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = tuple(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self.codes[value]
+        except KeyError:
+            raise ValueError(f"Unknown value '{value}'. Expected one of: {', '.join(self.values)}")
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.values[int(value)]
+
+class Location(db.Model):
+    """City dimension referenced by weather and forecast rows"""
+    __tablename__ = 'location'
+    __table_args__ = (
+        db.UniqueConstraint('city_key', 'state_key', name='uq_location_city_state'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(100), nullable=False)
+    city_key = db.Column(db.String(100), nullable=False, default=_location_key_default('city'))
+    state_key = db.Column(db.String(100), nullable=False, default=_location_key_default('state'))
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Location {self.city}-{self.state}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'city': self.city,
+            'state': self.state,
+            'latitude': self.latitude,
+            'longitude': self.longitude
+        }
+
+class LocatedMixin:
+    """City, state and coordinates of rows referencing a Location"""
+    
+    @property
+    def city(self):
+        return self.location.city if self.location else None
+    
+    @property
+    def state(self):
+        return self.location.state if self.location else None
+    
+    @property
+    def latitude(self):
+        return self.location.latitude if self.location else None
+    
+    @property
+    def longitude(self):
+        return self.location.longitude if self.location else None
+
 class AQIData(db.Model):
     __tablename__ = 'aqi_data'
+    __table_args__ = (
+        db.UniqueConstraint('station', 'pollutant_id', 'last_update', name='uq_aqi_data_station_pollutant_update'),
+        db.Index('ix_aqi_data_city_state_update', 'city_key', 'state_key', 'last_update'),
+        db.Index('ix_aqi_data_city_pollutant_update', 'city_key', 'pollutant_id', 'last_update'),
+        db.Index('ix_aqi_data_last_update', 'last_update'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     country = db.Column(db.String(100), nullable=False)
     state = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False)
+    city_key = db.Column(db.String(100), nullable=False, default=_location_key_default('city'))  # Lowercased city for indexed lookups
+    state_key = db.Column(db.String(100), nullable=False, default=_location_key_default('state'))
     station = db.Column(db.String(200), nullable=False)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
-    pollutant_id = db.Column(db.String(20), nullable=False)  # PM10, PM2.5, NO2, SO2, CO, OZONE, NH3
+    pollutant_id = db.Column(CodedString(POLLUTANTS), nullable=False)  # PM10, PM2.5, NO2, SO2, CO, OZONE, NH3
     pollutant_min = db.Column(db.Float, nullable=True)
     pollutant_max = db.Column(db.Float, nullable=True)
     pollutant_avg = db.Column(db.Float, nullable=True)
     aqi_value = db.Column(db.Integer, nullable=True)
-    aqi_category = db.Column(db.String(50), nullable=True)  # Good, Satisfactory, Moderate, Poor, Very Poor, Severe
+    aqi_category = db.Column(CodedString(AQI_CATEGORY_NAMES), nullable=True)  # Good, Satisfactory, Moderate, Poor, Very Poor, Severe
     last_update = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-
+    
     def __repr__(self):
         return f'<AQIData {self.city}-{self.station}-{self.pollutant_id}>'
-
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -43,14 +144,92 @@ class AQIData(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class WeatherData(db.Model):
-    __tablename__ = 'weather_data'
+class LatestAQI(db.Model):
+    """Most recent observation of every (station, pollutant), maintained on ingest"""
+    __tablename__ = 'latest_aqi'
+    __table_args__ = (
+        db.UniqueConstraint('station', 'pollutant_id', name='uq_latest_aqi_station_pollutant'),
+        db.Index('ix_latest_aqi_city_state', 'city_key', 'state_key'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    country = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False)
+    city_key = db.Column(db.String(100), nullable=False, default=_location_key_default('city'))
+    state_key = db.Column(db.String(100), nullable=False, default=_location_key_default('state'))
+    station = db.Column(db.String(200), nullable=False)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    pollutant_id = db.Column(CodedString(POLLUTANTS), nullable=False)
+    pollutant_min = db.Column(db.Float, nullable=True)
+    pollutant_max = db.Column(db.Float, nullable=True)
+    pollutant_avg = db.Column(db.Float, nullable=True)
+    aqi_value = db.Column(db.Integer, nullable=True)
+    aqi_category = db.Column(CodedString(AQI_CATEGORY_NAMES), nullable=True)
+    last_update = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LatestAQI {self.city}-{self.station}-{self.pollutant_id}>'
+    
+    def to_dict(self):
+        # Same shape as AQIData rows, so /aqi/realtime responses are unchanged
+        return AQIData.to_dict(self)
+
+class StationSnapshot(db.Model):
+    """
+    Map record of every station, maintained on ingest
+    
+    The latest sub-index and concentration of every pollutant of the
+    station are pivoted into one row, with the overall AQI (the highest
+    sub-index) and the pollutant it comes from.
+    """
+    __tablename__ = 'station_snapshot'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    station = db.Column(db.String(200), nullable=False, unique=True)
+    country = db.Column(db.String(100), nullable=False)
     state = db.Column(db.String(100), nullable=False)
+    city = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    aqi_value = db.Column(db.Integer, nullable=True)
+    aqi_category = db.Column(CodedString(AQI_CATEGORY_NAMES), nullable=True)
+    dominant_pollutant = db.Column(CodedString(POLLUTANTS), nullable=True)
+    sub_indices = db.Column(db.JSON, nullable=False)  # pollutant -> AQI sub-index
+    concentrations = db.Column(db.JSON, nullable=False)  # pollutant -> average concentration
+    last_update = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StationSnapshot {self.city}-{self.station}>'
+    
+    def to_dict(self):
+        return {
+            'station': self.station,
+            'city': self.city,
+            'state': self.state,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'aqi_value': self.aqi_value,
+            'aqi_category': self.aqi_category,
+            'dominant_pollutant': self.dominant_pollutant,
+            'sub_indices': self.sub_indices,
+            'concentrations': self.concentrations,
+            'last_update': self.last_update.isoformat() if self.last_update else None
+        }
+
+class WeatherData(LocatedMixin, db.Model):
+    __tablename__ = 'weather_data'
+    __table_args__ = (
+        db.Index('ix_weather_data_location_recorded', 'location_id', 'recorded_at'),
+        db.Index('ix_weather_data_recorded_at', 'recorded_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    location = db.relationship(Location, lazy='joined')
     temperature = db.Column(db.Float, nullable=True)  # in Celsius
     humidity = db.Column(db.Float, nullable=True)  # in percentage
     wind_speed = db.Column(db.Float, nullable=True)  # in km/h
@@ -59,10 +238,10 @@ class WeatherData(db.Model):
     visibility = db.Column(db.Float, nullable=True)  # in km
     recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-
+    
     def __repr__(self):
         return f'<WeatherData {self.city}-{self.state}>'
-
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -80,24 +259,29 @@ class WeatherData(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class AQIForecast(db.Model):
+class AQIForecast(LocatedMixin, db.Model):
     __tablename__ = 'aqi_forecast'
+    __table_args__ = (
+        # One forecast per location, day and model version. forecast_date is
+        # truncated to midnight, so regenerating a day updates its row.
+        db.UniqueConstraint('location_id', 'forecast_date', 'model_version',
+                            name='uq_aqi_forecast_location_date_version'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    city = db.Column(db.String(100), nullable=False)
-    state = db.Column(db.String(100), nullable=False)
-    latitude = db.Column(db.Float, nullable=True)
-    longitude = db.Column(db.Float, nullable=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    location = db.relationship(Location, lazy='joined')
     forecast_date = db.Column(db.DateTime, nullable=False)
     predicted_aqi = db.Column(db.Integer, nullable=False)
-    predicted_category = db.Column(db.String(50), nullable=False)
+    predicted_category = db.Column(CodedString(AQI_CATEGORY_NAMES), nullable=False)
     confidence_score = db.Column(db.Float, nullable=True)
-    model_version = db.Column(db.String(50), nullable=True)
+    # Part of the unique key, where NULLs never collide, so it is always set
+    model_version = db.Column(db.String(50), nullable=False, default=DEFAULT_MODEL_VERSION)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-
+    
     def __repr__(self):
         return f'<AQIForecast {self.city}-{self.forecast_date}>'
-
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -113,3 +297,90 @@ class AQIForecast(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class AQIRollup(db.Model):
+    __tablename__ = 'aqi_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'city_key', 'state_key', 'pollutant_id', 'bucket_start',
+                            name='uq_aqi_rollup_bucket'),
+        db.Index('ix_aqi_rollup_city_state_bucket', 'granularity', 'city_key', 'state_key', 'bucket_start'),
+        db.Index('ix_aqi_rollup_granularity_bucket', 'granularity', 'bucket_start'),  # Retention scans
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day, month
+    city = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(100), nullable=False)
+    city_key = db.Column(db.String(100), nullable=False)
+    state_key = db.Column(db.String(100), nullable=False)
+    pollutant_id = db.Column(CodedString(POLLUTANTS), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False)  # Readings with a pollutant_avg value
+    pollutant_min = db.Column(db.Float, nullable=True)
+    pollutant_max = db.Column(db.Float, nullable=True)
+    pollutant_mean = db.Column(db.Float, nullable=True)
+    pollutant_p95 = db.Column(db.Float, nullable=True)
+    aqi_min = db.Column(db.Float, nullable=True)
+    aqi_max = db.Column(db.Float, nullable=True)
+    aqi_mean = db.Column(db.Float, nullable=True)
+    aqi_p95 = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AQIRollup {self.granularity}-{self.city}-{self.pollutant_id}-{self.bucket_start}>'
+    
+    def to_dict(self):
+        return {
+            'granularity': self.granularity,
+            'city': self.city,
+            'state': self.state,
+            'pollutant_id': self.pollutant_id,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'reading_count': self.reading_count,
+            'pollutant_min': self.pollutant_min,
+            'pollutant_max': self.pollutant_max,
+            'pollutant_mean': self.pollutant_mean,
+            'pollutant_p95': self.pollutant_p95,
+            'aqi_min': self.aqi_min,
+            'aqi_max': self.aqi_max,
+            'aqi_mean': self.aqi_mean,
+            'aqi_p95': self.aqi_p95,
+            # Same fields as an AQIData row, so charts can plot buckets directly
+            'last_update': self.bucket_start.isoformat() if self.bucket_start else None,
+            'pollutant_avg': self.pollutant_mean,
+            'aqi_value': int(round(self.aqi_mean)) if self.aqi_mean is not None else None
+        }
+
+class SchemaVersion(db.Model):
+    """One row per migration run, the highest version is the current one"""
+    __tablename__ = 'schema_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    migrated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+class IngestionWatermark(db.Model):
+    __tablename__ = 'ingestion_watermark'
+    __table_args__ = (
+        db.UniqueConstraint('source', 'city', name='uq_ingestion_watermark_source_city'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)  # cpcb, openweather
+    city = db.Column(db.String(100), nullable=False)
+    high_water_mark = db.Column(db.DateTime, nullable=False)  # Latest observation time stored
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<IngestionWatermark {self.source}-{self.city}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'city': self.city,
+            'high_water_mark': self.high_water_mark.isoformat() if self.high_water_mark else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
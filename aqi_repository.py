@@ -0,0 +1,1076 @@
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import UniqueConstraint, and_, case, func, inspect, or_, select, text
+from sqlalchemy.sql import sqltypes
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.aqi_data import (
+    AQIData, LatestAQI, StationSnapshot, WeatherData, AQIForecast, AQIRollup, IngestionWatermark, Location,
+    SchemaVersion, CodedString, DEFAULT_MODEL_VERSION, POLLUTANTS, normalize_location_key
+)
+from src.data_ingestion.cpcb_ingestion import AQIRecordBatch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Natural key of an AQI observation
+AQI_NATURAL_KEY = ('station', 'pollutant_id', 'last_update')
+
+DEFAULT_BATCH_SIZE = 500
+
+# How city and state filters are matched against the lookup keys.
+# 'exact' and 'prefix' use the (city_key, state_key, ...) indexes,
+# 'contains' is a substring scan kept as an explicit fallback.
+LOCATION_MATCH_MODES = ('exact', 'prefix', 'contains')
+
+# Layout version of the tables. Bump it whenever upgrade_schema learns a
+# new change, so migrate() runs again on databases of the previous version.
+SCHEMA_VERSION = 1
+
+# Key of the PostgreSQL advisory lock serializing concurrent migrations
+MIGRATION_LOCK_KEY = 720_115_001
+
+# Tables rebuilt by upgrade_schema when they predate the current layout
+UPGRADED_MODELS = (AQIData, LatestAQI, AQIRollup, WeatherData, AQIForecast)
+
+# Rollup granularities, finest first. Hours are computed from raw rows and
+# every coarser level is merged from the level before it.
+ROLLUP_GRANULARITIES = ('hour', 'day', 'month')
+ROLLUP_KEY = ('city_key', 'state_key', 'pollutant_id', 'bucket_start')
+
+# Number of (city, time range) conditions per rollup source query
+ROLLUP_QUERY_CHUNK = 50
+
+def upsert_aqi_records(records: Union[AQIRecordBatch, Iterable[Dict]], batch_size: int = DEFAULT_BATCH_SIZE,
+                       update_rollups: bool = True) -> int:
+    """
+    Insert or update processed AQI records in bulk
+    
+    Rows are keyed on (station, pollutant_id, last_update), so writing the
+    same snapshot twice updates the existing rows instead of duplicating
+    them. The latest_aqi snapshot, the station_snapshot map records of the
+    stations and the hourly, daily and monthly rollups of every bucket the
+    records fall into are updated in the same transaction. The caller is
+    responsible for committing the session.
+    
+    Refreshing the rollups takes most of the time of a write. Ingestion
+    jobs pass update_rollups=False, collect aqi_rollup_buckets of what they
+    wrote and call refresh_deferred_rollups once after committing, so the
+    write transaction stays short and every bucket is refreshed once a run.
+    
+    Args:
+        records: Columnar batch (see CPCBDataIngestion.process_aqi_batch) or
+            processed AQI records (see CPCBDataIngestion.process_aqi_records)
+        batch_size: Number of rows per INSERT ... ON CONFLICT statement
+        update_rollups: Whether to refresh the rollups in this transaction
+            (see above, bulk loads call rebuild_aqi_rollups afterwards)
+    
+    Returns:
+        Number of distinct rows written
+    """
+    if isinstance(records, AQIRecordBatch):
+        # Deduplicate on the dictionary codes before any row is materialized
+        rows = records.deduplicate(AQI_NATURAL_KEY).to_rows()
+    else:
+        rows = _dedupe_by_key(records, AQI_NATURAL_KEY)
+    
+    known = [row for row in rows if row['pollutant_id'] in POLLUTANTS]
+    if len(known) < len(rows):
+        logger.warning(f"Skipped {len(rows) - len(known)} records with an unknown pollutant")
+        rows = known
+    if not rows:
+        return 0
+    
+    insert = _dialect_insert(AQIData.__table__)
+    update_columns = {
+        column.name: insert.excluded[column.name]
+        for column in AQIData.__table__.columns
+        if column.name not in AQI_NATURAL_KEY and column.name not in ('id', 'created_at')
+    }
+    statement = insert.on_conflict_do_update(
+        index_elements=list(AQI_NATURAL_KEY),
+        set_=update_columns
+    )
+    
+    for batch in _batched(rows, batch_size):
+        db.session.execute(statement, batch)
+    
+    _upsert_latest_aqi(rows, batch_size)
+    refresh_station_snapshots({row['station'] for row in rows}, batch_size)
+    
+    if update_rollups:
+        refresh_aqi_rollups(aqi_rollup_buckets(rows))
+    
+    logger.info(f"Upserted {len(rows)} AQI records")
+    return len(rows)
+
+def insert_weather_records(records: Iterable[Dict], batch_size: int = DEFAULT_BATCH_SIZE,
+                           skip_existing: bool = False) -> int:
+    """
+    Insert processed weather records in bulk
+    
+    City and state are stored once in the location table and every row
+    references its location by id.
+    
+    Args:
+        records: Processed weather records (see WeatherDataIngestion)
+        batch_size: Number of rows per INSERT statement
+        skip_existing: Skip records whose location already has a row
+            recorded at the same time (used by archive replays)
+    
+    Returns:
+        Number of rows written
+    """
+    records = [record for record in records if record.get('recorded_at') is not None]
+    location_ids = resolve_location_ids(records)
+    
+    columns = set(WeatherData.__table__.columns.keys())
+    rows = []
+    for record in records:
+        location_id = location_ids.get(_location_key(record))
+        if location_id is None:
+            continue
+        row = {name: value for name, value in record.items() if name in columns}
+        row['location_id'] = location_id
+        rows.append(row)
+    
+    if len(rows) < len(records):
+        logger.warning(f"Skipped {len(records) - len(rows)} weather records without a city and state")
+    if rows and skip_existing:
+        rows = _without_stored_weather(_dedupe_by_key(rows, ('location_id', 'recorded_at')))
+    if not rows:
+        return 0
+    
+    statement = WeatherData.__table__.insert()
+    for batch in _batched(rows, batch_size):
+        db.session.execute(statement, batch)
+    
+    logger.info(f"Inserted {len(rows)} weather records")
+    return len(rows)
+
+def _without_stored_weather(rows: List[Dict]) -> List[Dict]:
+    """Drop the rows whose (location_id, recorded_at) is already stored"""
+    times = [row['recorded_at'] for row in rows]
+    stored = set(
+        db.session.query(WeatherData.location_id, WeatherData.recorded_at)
+        .filter(WeatherData.location_id.in_({row['location_id'] for row in rows}),
+                WeatherData.recorded_at.between(min(times), max(times)))
+    )
+    
+    new_rows = [row for row in rows if (row['location_id'], row['recorded_at']) not in stored]
+    if len(new_rows) < len(rows):
+        logger.info(f"Skipped {len(rows) - len(new_rows)} weather records already stored")
+    return new_rows
+
+def upsert_forecasts(records: Iterable[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Insert or update AQI forecasts in bulk
+    
+    Forecast dates are truncated to the day and rows are keyed on
+    (location, forecast_date, model_version), so regenerating forecasts
+    replaces the previous prediction for the same day. Forecasts without a
+    model version get DEFAULT_MODEL_VERSION. The caller is
+    responsible for committing the session.
+    
+    Args:
+        records: Dictionaries with 'city', 'state', optional 'latitude' and
+            'longitude', and the AQIForecast prediction columns
+        batch_size: Number of rows per INSERT ... ON CONFLICT statement
+    
+    Returns:
+        Number of distinct forecasts written
+    """
+    records = list(records)
+    location_ids = resolve_location_ids(records)
+    
+    columns = set(AQIForecast.__table__.columns.keys()) - {'id'}
+    key_columns = ('location_id', 'forecast_date', 'model_version')
+    rows = {}
+    for record in records:
+        location_id = location_ids.get(_location_key(record))
+        if location_id is None or record.get('forecast_date') is None:
+            continue
+        row = {name: record.get(name) for name in columns}
+        row['location_id'] = location_id
+        row['forecast_date'] = rollup_bucket_start(record['forecast_date'], 'day')
+        row['model_version'] = row['model_version'] or DEFAULT_MODEL_VERSION
+        row['created_at'] = row['created_at'] or datetime.utcnow()
+        rows[tuple(row.get(name) for name in key_columns)] = row
+    if not rows:
+        return 0
+    
+    insert = _dialect_insert(AQIForecast.__table__)
+    statement = insert.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={
+            name: insert.excluded[name]
+            for name in ('predicted_aqi', 'predicted_category', 'confidence_score', 'created_at')
+        }
+    )
+    
+    rows = list(rows.values())
+    for batch in _batched(rows, batch_size):
+        db.session.execute(statement, batch)
+    
+    logger.info(f"Upserted {len(rows)} forecasts")
+    return len(rows)
+
+def get_watermarks(source: str) -> Dict[str, datetime]:
+    """
+    Get the per-city high-water marks of an ingestion source
+    
+    Returns:
+        Dictionary mapping city name to the latest observation time stored
+    """
+    marks = db.session.query(IngestionWatermark.city, IngestionWatermark.high_water_mark).filter(
+        IngestionWatermark.source == source
+    ).all()
+    return {city: high_water_mark for city, high_water_mark in marks}
+
+def advance_watermarks(source: str, marks: Dict[str, datetime]) -> None:
+    """
+    Move per-city high-water marks forward
+    
+    A mark is only replaced by a later one, so replaying older data never
+    moves it back. The caller is responsible for committing the session.
+    """
+    rows = [
+        {'source': source, 'city': city, 'high_water_mark': mark, 'updated_at': datetime.utcnow()}
+        for city, mark in marks.items() if mark is not None
+    ]
+    if not rows:
+        return
+    
+    table = IngestionWatermark.__table__
+    insert = _dialect_insert(table)
+    statement = insert.on_conflict_do_update(
+        index_elements=['source', 'city'],
+        set_={
+            'high_water_mark': insert.excluded.high_water_mark,
+            'updated_at': insert.excluded.updated_at
+        },
+        where=insert.excluded.high_water_mark > table.c.high_water_mark
+    )
+    db.session.execute(statement, rows)
+
+def resolve_location_ids(records: Iterable[Dict]) -> Dict[Tuple[str, str], int]:
+    """
+    Get the location ids of the cities in the given records, adding new ones
+    
+    Coordinates of a new location are taken from its first record with
+    any. The caller is responsible for committing the session.
+    
+    Args:
+        records: Dictionaries with 'city', 'state' and optionally 'latitude' and 'longitude'
+    
+    Returns:
+        Dictionary mapping (city_key, state_key) to the location id
+    """
+    locations = {}
+    for record in records:
+        key = _location_key(record)
+        if key is None:
+            continue
+        location = locations.get(key)
+        if location is None:
+            locations[key] = {
+                'city': record['city'].strip(),
+                'state': record['state'].strip(),
+                'city_key': key[0],
+                'state_key': key[1],
+                'latitude': record.get('latitude'),
+                'longitude': record.get('longitude'),
+                'created_at': datetime.utcnow()
+            }
+        elif location['latitude'] is None and record.get('latitude') is not None:
+            location['latitude'] = record['latitude']
+            location['longitude'] = record.get('longitude')
+    if not locations:
+        return {}
+    
+    _insert_locations(db.session, list(locations.values()))
+    
+    ids = {}
+    city_keys = sorted({city_key for city_key, _ in locations})
+    for start in range(0, len(city_keys), DEFAULT_BATCH_SIZE):
+        rows = db.session.query(Location.id, Location.city_key, Location.state_key).filter(
+            Location.city_key.in_(city_keys[start:start + DEFAULT_BATCH_SIZE])
+        )
+        for location_id, city_key, state_key in rows:
+            if (city_key, state_key) in locations:
+                ids[(city_key, state_key)] = location_id
+    
+    return ids
+
+def filter_by_location(query, model, city: Optional[str] = None, state: Optional[str] = None,
+                       match: str = 'exact'):
+    """
+    Filter a query on city and state through the lookup key columns
+    
+    Models referencing the location table are filtered on the ids of the
+    matching locations.
+    
+    Args:
+        query: Query over a model with city_key and state_key or location_id columns
+        model: AQIData, LatestAQI, AQIRollup, WeatherData, AQIForecast or Location
+        city: City name (ignored if empty)
+        state: State name (ignored if empty)
+        match: One of LOCATION_MATCH_MODES
+    
+    Returns:
+        Filtered query
+    """
+    if match not in LOCATION_MATCH_MODES:
+        raise ValueError(f"Invalid match mode '{match}'. Use one of: {', '.join(LOCATION_MATCH_MODES)}")
+    
+    if hasattr(model, 'location_id'):
+        if not normalize_location_key(city) and not normalize_location_key(state):
+            return query
+        locations = filter_by_location(select(Location.id), Location, city, state, match)
+        return query.filter(model.location_id.in_(locations))
+    
+    for column, value in ((model.city_key, city), (model.state_key, state)):
+        key = normalize_location_key(value)
+        if not key:
+            continue
+        
+        if match == 'exact':
+            query = query.filter(column == key)
+        elif match == 'prefix':
+            # A range instead of LIKE, so the index is used on every backend
+            query = query.filter(column >= key, column < key[:-1] + chr(ord(key[-1]) + 1))
+        else:
+            query = query.filter(column.contains(key, autoescape=True))
+    
+    return query
+
+def migrate() -> bool:
+    """
+    Create missing tables and bring the database up to SCHEMA_VERSION
+    
+    Run once per deployment with `python -m src.models.aqi_repository migrate`
+    before the web workers start; the application never migrates on start.
+    A database already at SCHEMA_VERSION is left untouched, so the command
+    can be repeated. On PostgreSQL an advisory lock makes concurrent runs
+    wait for each other, and the version is checked once the lock is held.
+    Derived tables added by the upgrade (latest_aqi, station_snapshot) are
+    filled from the stored readings.
+    
+    Returns:
+        Whether the database was migrated (False if it was up to date)
+    """
+    with db.engine.connect() as lock:
+        locked = lock.dialect.name == 'postgresql'
+        if locked:
+            lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        
+        try:
+            current = schema_version()
+            if current is not None and current >= SCHEMA_VERSION:
+                logger.info(f"Database schema is up to date (version {current})")
+                return False
+            
+            db.create_all()
+            upgrade_schema()
+            ensure_latest_aqi()
+            ensure_station_snapshots()
+            
+            db.session.add(SchemaVersion(version=SCHEMA_VERSION))
+            db.session.commit()
+            logger.info(f"Migrated database schema from version {current} to {SCHEMA_VERSION}")
+            return True
+        finally:
+            if locked:
+                lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+def schema_version() -> Optional[int]:
+    """Schema version the database was migrated to, None if it never was"""
+    if not inspect(db.engine).has_table(SchemaVersion.__tablename__):
+        return None
+    return db.session.query(func.max(SchemaVersion.version)).scalar()
+
+def upgrade_schema() -> None:
+    """
+    Bring tables created by older versions up to the current layout
+    
+    db.create_all() does not alter existing tables. A table missing any
+    column or unique key, still storing pollutants and categories as text,
+    or allowing NULLs in a column that now has a default, is rebuilt: rows
+    are copied into a new table with the codes, lookup keys, location ids
+    and defaults filled in, and the old table is dropped.
+    Rows with a pollutant outside POLLUTANTS are not copied, unknown
+    categories become 'Unknown', and only the newest row of duplicates of
+    a unique key is kept. Run through migrate(), after db.create_all().
+    """
+    inspector = inspect(db.engine)
+    
+    with db.engine.begin() as connection:
+        for model in UPGRADED_MODELS:
+            table = model.__table__
+            if not inspector.has_table(table.name):
+                continue
+            
+            columns = inspector.get_columns(table.name)
+            existing = {column['name']: column['type'] for column in columns}
+            nullable = {column['name'] for column in columns if column['nullable']}
+            unique_keys = {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+            outdated = [
+                column.name for column in table.columns
+                if column.name not in existing
+                or (isinstance(column.type, CodedString) and not isinstance(existing[column.name], sqltypes.Integer))
+                or (column.name in nullable and _scalar_default(column) is not None)
+            ] + [
+                constraint.name for constraint in table.constraints
+                if isinstance(constraint, UniqueConstraint) and constraint.name not in unique_keys
+            ]
+            if outdated:
+                logger.info(f"Rebuilding {table.name} for {', '.join(outdated)}")
+                _rebuild_table(connection, inspector, table, existing)
+            
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def _rebuild_table(connection, inspector, table, existing: Dict) -> None:
+    """Copy an outdated table into the current layout and replace it"""
+    legacy = db.table(table.name, *[db.column(name) for name in existing])
+    # Tables already keyed on a location have no city and state left to derive keys from
+    located = 'location_id' in existing
+    city_key = state_key = None
+    if not located:
+        city_key = legacy.c.city_key if 'city_key' in existing else func.lower(func.trim(legacy.c.city))
+        state_key = legacy.c.state_key if 'state_key' in existing else func.lower(func.trim(legacy.c.state))
+    
+    # The new table's indexes and constraints reuse the old names
+    for index in inspector.get_indexes(table.name):
+        if not index.get('duplicates_constraint'):
+            connection.execute(text(f"DROP INDEX {index['name']}"))
+    if connection.dialect.name != 'sqlite':
+        for constraint in inspector.get_unique_constraints(table.name):
+            connection.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {constraint['name']}"))
+    
+    if 'location_id' in table.columns and 'location_id' not in existing:
+        coordinates = [
+            func.max(legacy.c[name]).label(name) if name in existing else db.null().label(name)
+            for name in ('latitude', 'longitude')
+        ]
+        locations = connection.execute(
+            select(city_key.label('city_key'), state_key.label('state_key'),
+                   func.min(legacy.c.city).label('city'), func.min(legacy.c.state).label('state'), *coordinates)
+            .group_by(city_key, state_key)
+        ).mappings().all()
+        now = datetime.utcnow()
+        _insert_locations(connection, [dict(location, created_at=now) for location in locations])
+    
+    location = Location.__table__
+    columns = []
+    values = []
+    criteria = []
+    for column in table.columns:
+        if column.name == 'id':
+            continue
+        
+        if column.name == 'location_id' and column.name not in existing:
+            value = location.c.id
+        elif column.name == 'city_key' and column.name not in existing:
+            value = city_key
+        elif column.name == 'state_key' and column.name not in existing:
+            value = state_key
+        elif isinstance(column.type, CodedString) and not isinstance(existing[column.name], sqltypes.Integer):
+            codes = column.type.codes
+            if 'Unknown' in codes:
+                value = case(codes, value=legacy.c[column.name], else_=codes['Unknown'])
+            else:
+                value = case(codes, value=legacy.c[column.name])
+                criteria.append(legacy.c[column.name].in_(list(codes)))
+        elif column.name in existing and _scalar_default(column) is not None:
+            value = func.coalesce(legacy.c[column.name], _scalar_default(column))
+        elif column.name in existing:
+            value = legacy.c[column.name]
+        else:
+            continue
+        
+        columns.append(column.name)
+        values.append(value)
+    
+    rows = legacy
+    if 'location_id' in columns and not located:
+        rows = legacy.join(location, and_(location.c.city_key == city_key, location.c.state_key == state_key))
+    
+    # Keep the newest row of rows that would collide on a unique key
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            key = [values[columns.index(column.name)] for column in constraint.columns]
+            newest = select(func.max(legacy.c.id)).select_from(rows).group_by(*key).correlate(None)
+            criteria.append(legacy.c.id.in_(newest))
+    
+    source = select(*values).select_from(rows).where(*criteria)
+    
+    # A copy of the table under another name, so the old one stays readable until the end
+    staging = table.to_metadata(db.MetaData(), name=f'{table.name}_new')
+    if 'location_id' in table.columns:
+        location.to_metadata(staging.metadata)
+    staging.create(connection)
+    
+    copied = connection.execute(staging.insert().from_select(columns, source)).rowcount
+    total = connection.execute(select(func.count()).select_from(legacy)).scalar()
+    
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {staging.name} RENAME TO {table.name}"))
+    
+    if copied < total:
+        logger.warning(f"Dropped {total - copied} {table.name} rows with an unknown pollutant or location, or duplicates")
+    logger.info(f"Rebuilt {table.name} with {copied} rows")
+
+def _scalar_default(column):
+    """Constant default of a NOT NULL column, None if it has none"""
+    if column.nullable or column.default is None or not column.default.is_scalar:
+        return None
+    return column.default.arg
+
+def rebuild_latest_aqi(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Fill the latest_aqi snapshot from the full aqi_data history
+    
+    Returns:
+        Number of (station, pollutant) rows written
+    """
+    newest = db.session.query(
+        AQIData.station,
+        AQIData.pollutant_id,
+        func.max(AQIData.last_update).label('last_update')
+    ).group_by(AQIData.station, AQIData.pollutant_id).subquery()
+    
+    columns = [column for column in AQIData.__table__.columns if column.name not in ('id', 'created_at')]
+    query = db.session.query(*columns).join(newest, and_(
+        AQIData.station == newest.c.station,
+        AQIData.pollutant_id == newest.c.pollutant_id,
+        AQIData.last_update == newest.c.last_update
+    ))
+    
+    written = 0
+    batch = []
+    for row in query.yield_per(batch_size):
+        batch.append(dict(row._mapping))
+        if len(batch) >= batch_size:
+            written += _upsert_latest_aqi(batch, batch_size)
+            batch = []
+    written += _upsert_latest_aqi(batch, batch_size)
+    db.session.commit()
+    
+    logger.info(f"Rebuilt {written} latest AQI rows")
+    return written
+
+def ensure_latest_aqi() -> None:
+    """Fill latest_aqi on the first migration after it was added"""
+    if db.session.query(LatestAQI.id).first() is None and db.session.query(AQIData.id).first() is not None:
+        rebuild_latest_aqi()
+
+def refresh_station_snapshots(stations: Optional[Iterable[str]] = None,
+                              batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Pivot the latest_aqi rows of stations into their station_snapshot records
+    
+    The caller is responsible for committing the session.
+    
+    Args:
+        stations: Station names (defaults to every station)
+        batch_size: Number of stations read and written per statement
+    
+    Returns:
+        Number of station records written
+    """
+    columns = (LatestAQI.station, LatestAQI.country, LatestAQI.state, LatestAQI.city, LatestAQI.latitude,
+               LatestAQI.longitude, LatestAQI.pollutant_id, LatestAQI.pollutant_avg, LatestAQI.aqi_value,
+               LatestAQI.aqi_category, LatestAQI.last_update)
+    if stations is None:
+        chunks = [db.session.query(*columns).all()]
+    else:
+        stations = sorted(stations)
+        chunks = (
+            db.session.query(*columns).filter(LatestAQI.station.in_(stations[start:start + batch_size])).all()
+            for start in range(0, len(stations), batch_size)
+        )
+    
+    snapshots = {}
+    for rows in chunks:
+        for row in rows:
+            snapshot = snapshots.setdefault(row.station, {
+                'station': row.station,
+                'country': row.country,
+                'state': row.state,
+                'city': row.city,
+                'latitude': row.latitude,
+                'longitude': row.longitude,
+                'aqi_value': None,
+                'aqi_category': None,
+                'dominant_pollutant': None,
+                'sub_indices': {},
+                'concentrations': {},
+                'last_update': row.last_update
+            })
+            snapshot['latitude'] = snapshot['latitude'] if snapshot['latitude'] is not None else row.latitude
+            snapshot['longitude'] = snapshot['longitude'] if snapshot['longitude'] is not None else row.longitude
+            snapshot['last_update'] = max(snapshot['last_update'], row.last_update)
+            snapshot['sub_indices'][row.pollutant_id] = row.aqi_value
+            snapshot['concentrations'][row.pollutant_id] = row.pollutant_avg
+            
+            # The overall AQI is the highest sub-index
+            if row.aqi_value is not None and (snapshot['aqi_value'] is None or row.aqi_value > snapshot['aqi_value']):
+                snapshot['aqi_value'] = row.aqi_value
+                snapshot['aqi_category'] = row.aqi_category
+                snapshot['dominant_pollutant'] = row.pollutant_id
+    if not snapshots:
+        return 0
+    
+    now = datetime.utcnow()
+    for snapshot in snapshots.values():
+        snapshot['updated_at'] = now
+    
+    table = StationSnapshot.__table__
+    insert = _dialect_insert(table)
+    statement = insert.on_conflict_do_update(
+        index_elements=['station'],
+        set_={column.name: insert.excluded[column.name] for column in table.columns if column.name not in ('id', 'station')}
+    )
+    
+    for batch in _batched(list(snapshots.values()), batch_size):
+        db.session.execute(statement, batch)
+    
+    return len(snapshots)
+
+def ensure_station_snapshots() -> None:
+    """Fill station_snapshot on the first migration after it was added"""
+    if db.session.query(StationSnapshot.id).first() is None and db.session.query(LatestAQI.id).first() is not None:
+        written = refresh_station_snapshots()
+        db.session.commit()
+        logger.info(f"Built {written} station snapshots")
+
+def _upsert_latest_aqi(rows: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Move the latest_aqi snapshot forward to the newest of the given rows"""
+    latest = {}
+    for row in rows:
+        key = (row['station'], row['pollutant_id'])
+        if key not in latest or row['last_update'] >= latest[key]['last_update']:
+            latest[key] = row
+    if not latest:
+        return 0
+    
+    table = LatestAQI.__table__
+    insert = _dialect_insert(table)
+    statement = insert.on_conflict_do_update(
+        index_elements=['station', 'pollutant_id'],
+        set_={
+            column.name: insert.excluded[column.name]
+            for column in table.columns
+            if column.name not in ('id', 'station', 'pollutant_id', 'created_at')
+        },
+        # Replaying or backfilling older data never moves the snapshot back
+        where=insert.excluded.last_update >= table.c.last_update
+    )
+    
+    for batch in _batched(list(latest.values()), batch_size):
+        db.session.execute(statement, batch)
+    
+    return len(latest)
+
+def rollup_bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hour, day or month bucket"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'month':
+        return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(ROLLUP_GRANULARITIES)}")
+
+def aqi_rollup_buckets(records: Union[AQIRecordBatch, Iterable[Dict]]) -> Set[Tuple[str, str, str, datetime]]:
+    """
+    Hourly rollup buckets processed AQI records fall into
+    
+    Returns:
+        Set of (city_key, state_key, pollutant_id, hour) to pass to
+        refresh_aqi_rollups or refresh_deferred_rollups
+    """
+    rows = records.to_rows() if isinstance(records, AQIRecordBatch) else records
+    return {
+        (normalize_location_key(row.get('city')), normalize_location_key(row.get('state')),
+         row['pollutant_id'], rollup_bucket_start(row['last_update'], 'hour'))
+        for row in rows
+        if row.get('pollutant_id') in POLLUTANTS and row.get('last_update') is not None
+    }
+
+def refresh_deferred_rollups(touched: Set[Tuple[str, str, str, datetime]]) -> int:
+    """
+    Refresh the rollups of records committed with update_rollups=False
+    
+    Runs in a transaction of its own and commits it. A failure is logged
+    and rolled back without touching the committed readings; the buckets
+    stay stale until the next write to them or rebuild-rollups.
+    
+    Args:
+        touched: Buckets collected with aqi_rollup_buckets
+    
+    Returns:
+        Number of rollup rows written
+    """
+    if not touched:
+        return 0
+    
+    try:
+        written = refresh_aqi_rollups(touched)
+        db.session.commit()
+        return written
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error refreshing {len(touched)} AQI rollup buckets (run rebuild-rollups to repair): {e}")
+        return 0
+
+def refresh_aqi_rollups(touched: Iterable[Tuple[str, str, str, datetime]]) -> int:
+    """
+    Recompute the rollup buckets containing the given observations
+    
+    Hourly buckets are computed from the raw AQIData rows, daily buckets
+    from the hourly ones and monthly buckets from the daily ones, so a
+    refresh only reads the touched hours of raw data. Counts, minimums,
+    maximums and means are exact at every level. The p95 of daily and
+    monthly buckets is the reading-weighted 95th percentile of the finer
+    buckets' p95 values. The caller is responsible for committing the session.
+    
+    Args:
+        touched: Tuples of (city_key, state_key, pollutant_id, observation time)
+    
+    Returns:
+        Number of rollup rows written
+    """
+    buckets = {
+        (city_key, state_key, pollutant_id, rollup_bucket_start(timestamp, 'hour'))
+        for city_key, state_key, pollutant_id, timestamp in touched
+        if timestamp is not None
+    }
+    if not buckets:
+        return 0
+    
+    written = _write_rollups('hour', _hourly_rollups(buckets))
+    
+    for child, parent in zip(ROLLUP_GRANULARITIES, ROLLUP_GRANULARITIES[1:]):
+        buckets = {
+            (city_key, state_key, pollutant_id, rollup_bucket_start(start, parent))
+            for city_key, state_key, pollutant_id, start in buckets
+        }
+        written += _write_rollups(parent, _merged_rollups(buckets, child, parent))
+    
+    return written
+
+def rebuild_aqi_rollups(start: Optional[datetime] = None,
+                        end: Optional[datetime] = None,
+                        chunk_size: int = 50000) -> int:
+    """
+    Recompute all rollups of the observations in a time range
+    
+    Used to backfill rollups for data loaded before they existed or with
+    update_rollups=False. Commits after every chunk of observations.
+    
+    Returns:
+        Number of rollup rows written
+    """
+    query = db.session.query(AQIData.city_key, AQIData.state_key, AQIData.pollutant_id, AQIData.last_update)
+    if start:
+        query = query.filter(AQIData.last_update >= start)
+    if end:
+        query = query.filter(AQIData.last_update <= end)
+    
+    written = 0
+    chunk = set()
+    for city_key, state_key, pollutant_id, last_update in query.order_by(AQIData.last_update).yield_per(chunk_size):
+        chunk.add((city_key, state_key, pollutant_id, rollup_bucket_start(last_update, 'hour')))
+        if len(chunk) >= chunk_size:
+            written += refresh_aqi_rollups(chunk)
+            db.session.commit()
+            chunk = set()
+    
+    written += refresh_aqi_rollups(chunk)
+    db.session.commit()
+    
+    logger.info(f"Rebuilt {written} AQI rollup rows")
+    return written
+
+def _hourly_rollups(buckets: Set[Tuple]) -> pd.DataFrame:
+    """Compute hourly rollups of the given buckets from the raw observations"""
+    columns = (AQIData.city, AQIData.state, AQIData.city_key, AQIData.state_key, AQIData.pollutant_id,
+               AQIData.last_update, AQIData.pollutant_avg, AQIData.aqi_value)
+    frame = _read_bucket_sources(buckets, 'hour', AQIData, columns, AQIData.last_update)
+    
+    frame = frame[frame['pollutant_avg'].notna()]
+    if frame.empty:
+        return frame
+    
+    frame['bucket_start'] = pd.to_datetime(frame['last_update']).dt.floor('h')
+    frame = _only_buckets(frame, buckets)
+    frame['aqi_value'] = frame['aqi_value'].astype(float)
+    
+    grouped = frame.groupby(list(ROLLUP_KEY), sort=False)
+    rollups = grouped.agg(
+        city=('city', 'last'),
+        state=('state', 'last'),
+        reading_count=('pollutant_avg', 'size'),
+        pollutant_min=('pollutant_avg', 'min'),
+        pollutant_max=('pollutant_avg', 'max'),
+        pollutant_mean=('pollutant_avg', 'mean'),
+        aqi_min=('aqi_value', 'min'),
+        aqi_max=('aqi_value', 'max'),
+        aqi_mean=('aqi_value', 'mean')
+    )
+    rollups['pollutant_p95'] = grouped['pollutant_avg'].quantile(0.95)
+    rollups['aqi_p95'] = grouped['aqi_value'].quantile(0.95)
+    
+    return rollups.reset_index()
+
+def merge_rollup_stats(frame: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Combine the statistics of the rollup rows sharing the same keys
+    
+    Counts add up and minimums and maximums combine exactly. Means are
+    weighted by reading count, and the p95 is the p95 of the merged p95
+    values weighted by reading count, an approximation.
+    
+    Args:
+        frame: Rollup rows with reading_count and the statistic columns
+        keys: Columns identifying a merged row
+    
+    Returns:
+        DataFrame of the merged statistics, indexed by the keys
+    """
+    grouped = frame.groupby(keys, sort=False)
+    rollups = grouped.agg(
+        reading_count=('reading_count', 'sum'),
+        pollutant_min=('pollutant_min', 'min'),
+        pollutant_max=('pollutant_max', 'max'),
+        aqi_min=('aqi_min', 'min'),
+        aqi_max=('aqi_max', 'max')
+    )
+    
+    for stat in ('pollutant', 'aqi'):
+        mean = frame[f'{stat}_mean']
+        weights = frame['reading_count'].where(mean.notna(), 0)
+        weighted = (mean.fillna(0) * weights).groupby([frame[key] for key in keys], sort=False).sum()
+        total = weights.groupby([frame[key] for key in keys], sort=False).sum()
+        rollups[f'{stat}_mean'] = (weighted / total.replace(0, np.nan)).reindex(rollups.index)
+        rollups[f'{stat}_p95'] = _weighted_quantile(frame, keys, f'{stat}_p95', 'reading_count', 0.95).reindex(rollups.index)
+    
+    return rollups
+
+def _merged_rollups(buckets: Set[Tuple], child: str, parent: str) -> pd.DataFrame:
+    """Merge the child-granularity rollups of the given parent buckets"""
+    frame = _read_bucket_sources(
+        buckets,
+        parent,
+        AQIRollup,
+        [AQIRollup.__table__.c[name] for name in AQIRollup.__table__.columns.keys()
+         if name not in ('id', 'granularity', 'updated_at')],
+        AQIRollup.bucket_start,
+        AQIRollup.granularity == child
+    )
+    if frame.empty:
+        return frame
+    
+    child_start = pd.to_datetime(frame['bucket_start'])
+    frame['bucket_start'] = child_start.dt.floor('D') if parent == 'day' else child_start.dt.to_period('M').dt.to_timestamp()
+    frame = _only_buckets(frame, buckets)
+    
+    keys = list(ROLLUP_KEY)
+    rollups = merge_rollup_stats(frame, keys)
+    rollups[['city', 'state']] = frame.groupby(keys, sort=False)[['city', 'state']].last()
+    
+    return rollups.reset_index()
+
+def _read_bucket_sources(buckets: Set[Tuple], granularity: str, model, columns, time_column,
+                         *criteria) -> pd.DataFrame:
+    """Read the rows covering the given buckets, one time range per city and state"""
+    ranges = {}
+    for city_key, state_key, _, start in buckets:
+        end = _bucket_end(start, granularity)
+        low, high = ranges.get((city_key, state_key), (start, end))
+        ranges[(city_key, state_key)] = (min(low, start), max(high, end))
+    
+    conditions = [
+        and_(model.city_key == city_key,
+             model.state_key == state_key,
+             time_column >= low,
+             time_column < high)
+        for (city_key, state_key), (low, high) in ranges.items()
+    ]
+    
+    rows = []
+    for start in range(0, len(conditions), ROLLUP_QUERY_CHUNK):
+        query = db.session.query(*columns).filter(or_(*conditions[start:start + ROLLUP_QUERY_CHUNK]), *criteria)
+        rows.extend(query.all())
+    
+    return pd.DataFrame(rows, columns=[column.key for column in columns])
+
+def _only_buckets(frame: pd.DataFrame, buckets: Set[Tuple]) -> pd.DataFrame:
+    """Keep the rows whose rollup key is one of the requested buckets"""
+    wanted = pd.MultiIndex.from_tuples(
+        [(city_key, state_key, pollutant_id, pd.Timestamp(start)) for city_key, state_key, pollutant_id, start in buckets],
+        names=list(ROLLUP_KEY)
+    )
+    return frame[pd.MultiIndex.from_frame(frame[list(ROLLUP_KEY)]).isin(wanted)]
+
+def _bucket_end(start: datetime, granularity: str) -> datetime:
+    if granularity == 'hour':
+        return start + timedelta(hours=1)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def _weighted_quantile(frame: pd.DataFrame, keys: List[str], value: str, weight: str,
+                       quantile: float) -> pd.Series:
+    """
+    Weighted quantile of a column within every group of rows, in one sort
+    
+    Rows are sorted by group and value, so each group is a contiguous run of
+    one running weight total, searched for every group at once.
+    
+    Args:
+        frame: Rows to aggregate
+        keys: Columns identifying a group
+        value: Column of values, unknown values are ignored
+        weight: Column of weights, rows without weight are ignored
+        quantile: Quantile between 0 and 1
+    
+    Returns:
+        Series indexed by the group keys, missing groups having no known value
+    """
+    known = frame[frame[value].notna() & (frame[weight] > 0)].sort_values(keys + [value], kind='mergesort')
+    values = known[value].to_numpy(dtype=float)
+    weights = known[weight].to_numpy(dtype=float)
+    
+    group = known.groupby(keys, sort=False).ngroup().to_numpy()
+    ends = np.flatnonzero(np.append(group[1:] != group[:-1], True)) if len(group) else np.array([], dtype=int)
+    starts = np.append(0, ends[:-1] + 1)[:len(ends)]
+    
+    cumulative = np.cumsum(weights)
+    before = cumulative[starts] - weights[starts]
+    targets = before + quantile * (cumulative[ends] - before)
+    positions = np.clip(np.searchsorted(cumulative, targets, side='left'), starts, ends)
+    
+    return pd.Series(values[positions], index=known.iloc[ends].set_index(keys).index, dtype=float)
+
+def _write_rollups(granularity: str, rollups: pd.DataFrame) -> int:
+    """Upsert computed rollups of one granularity"""
+    if rollups.empty:
+        return 0
+    
+    rollups = rollups.astype(object).where(rollups.notna(), None)
+    now = datetime.utcnow()
+    rows = []
+    for row in rollups.to_dict('records'):
+        row['granularity'] = granularity
+        row['bucket_start'] = pd.Timestamp(row['bucket_start']).to_pydatetime()
+        row['reading_count'] = int(row['reading_count'])
+        row['updated_at'] = now
+        rows.append(row)
+    
+    table = AQIRollup.__table__
+    insert = _dialect_insert(table)
+    key = ['granularity'] + list(ROLLUP_KEY)
+    statement = insert.on_conflict_do_update(
+        index_elements=key,
+        set_={name: insert.excluded[name] for name in rows[0] if name not in key}
+    )
+    for batch in _batched(rows, DEFAULT_BATCH_SIZE):
+        db.session.execute(statement, batch)
+    
+    return len(rows)
+
+def _location_key(record: Dict) -> Optional[Tuple[str, str]]:
+    city_key = normalize_location_key(record.get('city'))
+    state_key = normalize_location_key(record.get('state'))
+    if not city_key or not state_key:
+        return None
+    return city_key, state_key
+
+def _insert_locations(executor, rows: List[Dict]) -> None:
+    """Add locations missing from the location table and fill in missing coordinates"""
+    table = Location.__table__
+    insert = _dialect_insert(table, executor)
+    statement = insert.on_conflict_do_update(
+        index_elements=['city_key', 'state_key'],
+        set_={
+            'latitude': func.coalesce(table.c.latitude, insert.excluded.latitude),
+            'longitude': func.coalesce(table.c.longitude, insert.excluded.longitude)
+        },
+        where=and_(table.c.latitude.is_(None), insert.excluded.latitude.isnot(None))
+    )
+    for batch in _batched(rows, DEFAULT_BATCH_SIZE):
+        executor.execute(statement, batch)
+
+def _dedupe_by_key(records: Iterable[Dict], key_columns: Sequence[str]) -> List[Dict]:
+    """Drop rows without a complete key and keep the last row for each key"""
+    rows = {}
+    skipped = 0
+    
+    for record in records:
+        key = tuple(record.get(column) for column in key_columns)
+        if any(value is None or value == '' for value in key):
+            skipped += 1
+            continue
+        rows[key] = record
+    
+    if skipped:
+        logger.warning(f"Skipped {skipped} records without a complete {'/'.join(key_columns)} key")
+    
+    return list(rows.values())
+
+def _dialect_insert(table, executor=None):
+    """Build an INSERT supporting ON CONFLICT for the active database, or the executor's"""
+    bind = executor if executor is not None and hasattr(executor, 'dialect') else db.session.get_bind()
+    dialect = bind.dialect.name
+    
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    
+    raise NotImplementedError(f"Bulk upsert is not supported for the {dialect} dialect")
+
+def _batched(rows: List[Dict], batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate the database and maintain derived AQI tables')
+    parser.add_argument('command', choices=['migrate', 'rebuild-rollups', 'rebuild-latest', 'rebuild-snapshots'])
+    parser.add_argument('--start', help='Start time (ISO format)')
+    parser.add_argument('--end', help='End time (ISO format)')
+    args = parser.parse_args()
+    
+    from src.main import app
+    
+    with app.app_context():
+        if args.command == 'migrate':
+            migrated = migrate()
+            print("Schema version:", schema_version(), "(migrated)" if migrated else "(up to date)")
+            sys.exit(0)
+        
+        if args.command == 'rebuild-latest':
+            written = rebuild_latest_aqi()
+        elif args.command == 'rebuild-snapshots':
+            written = refresh_station_snapshots()
+            db.session.commit()
+        else:
+            written = rebuild_aqi_rollups(
+                start=datetime.fromisoformat(args.start) if args.start else None,
+                end=datetime.fromisoformat(args.end) if args.end else None
+            )
+    print("Rows written:", written)
@@ -1,12 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from werkzeug.utils import secure_filename
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_, desc
+from sqlalchemy import and_, or_, desc, select
 from typing import Dict, List, Optional
 from src.models.user import db
-from src.models.aqi_data import AQIData, WeatherData, AQIForecast
-from src.data_ingestion.cpcb_ingestion import CPCBDataIngestion
+from src.models.aqi_data import (
+    AQIData, LatestAQI, StationSnapshot, WeatherData, AQIForecast, AQIRollup, Location, POLLUTANTS
+)
+from src.models.aqi_repository import (
+    upsert_aqi_records, aqi_rollup_buckets, refresh_deferred_rollups, filter_by_location, rollup_bucket_start,
+    LOCATION_MATCH_MODES, ROLLUP_GRANULARITIES
+)
+from src.models.aggregation import (
+    aggregate_aqi, aggregate_fields, to_records, AGGREGATION_BUCKETS, DEFAULT_PERCENTILES
+)
+from src.data_ingestion.cpcb_ingestion import CPCBDataIngestion, CPCB_UTC_OFFSET
 from src.data_ingestion.weather_ingestion import WeatherDataIngestion
+from src.data_ingestion.raw_archive import RawResponseArchive
+from src.data_ingestion.http_client import ResilientHTTPClient
+from src.routes.pagination import paginate_keyset
+from src.routes.response_cache import cached_response, response_cache
+from src.routes.serialization import columnar, stream_export, RESPONSE_FORMATS, EXPORT_FORMATS, EXPORT_MIMETYPES
 import os
+import threading
 import logging
 
 # Configure logging
@@ -19,11 +36,64 @@ aqi_bp = Blueprint('aqi', __name__)
 # Note: In production, these API keys should be stored in environment variables
 CPCB_API_KEY = os.getenv('CPCB_API_KEY', '579b464db66ec23bdd000001cdd3946e44ce4aad7209ff7b23ac571b')
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '')  # Add your OpenWeatherMap API key
+CPCB_MAX_CONCURRENCY = int(os.getenv('CPCB_MAX_CONCURRENCY', 8))
+# Raw API responses are archived here for replays (set to an empty string to disable)
+RAW_ARCHIVE_DIR = os.getenv('RAW_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'raw_archive'))
 
-cpcb_ingestion = CPCBDataIngestion(CPCB_API_KEY)
-weather_ingestion = WeatherDataIngestion(OPENWEATHER_API_KEY)
+raw_archive = RawResponseArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None
+# One rate-limited, retrying HTTP client shared by both ingestion classes
+http_client = ResilientHTTPClient(pool_maxsize=max(CPCB_MAX_CONCURRENCY, 10))
+cpcb_ingestion = CPCBDataIngestion(CPCB_API_KEY, max_concurrency=CPCB_MAX_CONCURRENCY,
+                                   archive=raw_archive, http_client=http_client)
+weather_ingestion = WeatherDataIngestion(OPENWEATHER_API_KEY, archive=raw_archive, http_client=http_client)
+
+# Realtime data older than this is served as stale while it is refreshed in the background
+REALTIME_STALE_AFTER = timedelta(minutes=int(os.getenv('REALTIME_STALE_AFTER_MINUTES', 120)))
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='aqi-refresh')
+refreshes_in_flight = set()
+refreshes_lock = threading.Lock()
+
+# Rows fetched from the database cursor and encoded per chunk of an export
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 5000))
+
+# Largest page the paginated endpoints return
+MAX_LIMIT = int(os.getenv('API_MAX_LIMIT', 1000))
+
+# Fields of format=columnar responses, as (name, SQL expression). They match
+# the to_dict() keys, so clients can switch formats without renaming fields.
+AQI_FIELDS = ('id', 'country', 'state', 'city', 'station', 'latitude', 'longitude', 'pollutant_id',
+              'pollutant_min', 'pollutant_max', 'pollutant_avg', 'aqi_value', 'aqi_category',
+              'last_update', 'created_at')
+REALTIME_COLUMNS = [(name, getattr(LatestAQI, name)) for name in AQI_FIELDS]
+HISTORICAL_COLUMNS = [(name, getattr(AQIData, name)) for name in AQI_FIELDS]
+ROLLUP_COLUMNS = [
+    (name, getattr(AQIRollup, name)) for name in (
+        'id', 'granularity', 'city', 'state', 'pollutant_id', 'bucket_start', 'reading_count',
+        'pollutant_min', 'pollutant_max', 'pollutant_mean', 'pollutant_p95',
+        'aqi_min', 'aqi_max', 'aqi_mean', 'aqi_p95'
+    )
+] + [
+    ('last_update', AQIRollup.bucket_start.label('last_update')),
+    ('pollutant_avg', AQIRollup.pollutant_mean.label('pollutant_avg')),
+    # Rounded to an integer in Python, like AQIRollup.to_dict()
+    ('aqi_value', AQIRollup.aqi_mean.label('aqi_value'))
+]
+FORECAST_COLUMNS = [
+    ('id', AQIForecast.id),
+    ('city', Location.city),
+    ('state', Location.state),
+    ('latitude', Location.latitude),
+    ('longitude', Location.longitude),
+    ('forecast_date', AQIForecast.forecast_date),
+    ('predicted_aqi', AQIForecast.predicted_aqi),
+    ('predicted_category', AQIForecast.predicted_category),
+    ('confidence_score', AQIForecast.confidence_score),
+    ('model_version', AQIForecast.model_version),
+    ('created_at', AQIForecast.created_at)
+]
 
 @aqi_bp.route('/aqi/realtime', methods=['GET'])
+@cached_response(tables=('latest_aqi',))
 def get_realtime_aqi():
     """
     Get real-time AQI data for a specific location or all locations
@@ -31,63 +101,136 @@ def get_realtime_aqi():
     - state: Filter by state name
     - city: Filter by city name
     - pollutant: Filter by pollutant type
-    - limit: Maximum number of records (default: 50)
+    - match: How city and state are matched: exact, prefix or contains (default: exact)
+    - limit: Maximum number of records per page, up to MAX_LIMIT (default: 50)
+    - cursor: next_cursor of the previous page
+    - format: rows (one object per record, default) or columnar (one array per field)
     """
     try:
         state = request.args.get('state')
         city = request.args.get('city')
         pollutant = request.args.get('pollutant')
-        limit = int(request.args.get('limit', 50))
+        limit, limit_error = _parse_limit(50)
+        if limit_error:
+            return limit_error
+        cursor = request.args.get('cursor')
         
-        # Build query
-        query = AQIData.query
+        match_error = _validate_match_mode()
+        if match_error:
+            return match_error
+        
+        format_error = _validate_format()
+        if format_error:
+            return format_error
+        response_format = request.args.get('format', 'rows')
+        
+        pollutant_error = _validate_pollutant(pollutant)
+        if pollutant_error:
+            return pollutant_error
+        
+        # The snapshot table holds one row per station and pollutant, so the
+        # read cost does not grow with the length of the history
+        query = LatestAQI.query if response_format == 'rows' else _column_query(REALTIME_COLUMNS)
+        query = filter_by_location(query, LatestAQI, city, state, request.args.get('match', 'exact'))
         
-        if state:
-            query = query.filter(AQIData.state.ilike(f'%{state}%'))
-        if city:
-            query = query.filter(AQIData.city.ilike(f'%{city}%'))
         if pollutant:
-            query = query.filter(AQIData.pollutant_id == pollutant)
+            query = query.filter(LatestAQI.pollutant_id == pollutant)
         
         # Get most recent data for each station
-        recent_data = query.order_by(desc(AQIData.last_update)).limit(limit).all()
+        recent_data, next_cursor = paginate_keyset(query, LatestAQI.last_update, LatestAQI.id, limit, cursor)
+        
+        # Missing or old data is never fetched inside the request: the last
+        # known snapshot is returned right away, marked stale, and a refresh
+        # from the CPCB API is scheduled in the background
+        stale = False
+        refresh_scheduled = False
+        if city and not cursor:
+            newest_update = max((data.last_update for data in recent_data if data.last_update), default=None)
+            now_ist = datetime.utcnow() + CPCB_UTC_OFFSET
+            stale = newest_update is None or now_ist - newest_update > REALTIME_STALE_AFTER
+            if stale:
+                refresh_scheduled = schedule_realtime_refresh(state, city, limit)
         
-        # If no data in database, try to fetch from API
-        if not recent_data and city:
-            logger.info(f"No data found in database for {city}, fetching from API")
-            fresh_data = cpcb_ingestion.fetch_realtime_aqi(state=state, city=city, limit=limit)
-            
-            # Store fresh data in database
-            for record in fresh_data:
-                processed_record = cpcb_ingestion.process_aqi_record(record)
-                aqi_data = AQIData(**processed_record)
-                db.session.add(aqi_data)
-            
+        return jsonify({
+            'success': True,
+            'data': _serialize(recent_data, REALTIME_COLUMNS, response_format),
+            'count': len(recent_data),
+            'format': response_format,
+            'next_cursor': next_cursor,
+            'stale': stale,
+            'refresh_scheduled': refresh_scheduled,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in get_realtime_aqi: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@aqi_bp.route('/aqi/map-snapshot', methods=['GET'])
+@cached_response(tables=('station_snapshot',), compress=True)
+def get_map_snapshot():
+    """
+    Get one record per station for the map, with the sub-index and
+    concentration of every pollutant and the overall AQI
+    
+    The records are precomputed on ingest, so this is a single read of
+    one row per station. Responses are gzipped for clients accepting it.
+    Query parameters:
+    - bbox: Only stations inside west,south,east,north (longitudes and latitudes)
+    """
+    try:
+        query = StationSnapshot.query
+        
+        bbox = request.args.get('bbox')
+        if bbox:
             try:
-                db.session.commit()
-                # Re-query the database
-                recent_data = query.order_by(desc(AQIData.last_update)).limit(limit).all()
-            except Exception as e:
-                db.session.rollback()
-                logger.error(f"Error saving AQI data: {e}")
+                west, south, east, north = [float(value) for value in bbox.split(',')]
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid bbox parameter. Use west,south,east,north'
+                }), 400
+            if west > east or south > north:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid bbox parameter. West must not exceed east, nor south north'
+                }), 400
+            
+            query = query.filter(
+                StationSnapshot.longitude >= west,
+                StationSnapshot.longitude <= east,
+                StationSnapshot.latitude >= south,
+                StationSnapshot.latitude <= north
+            )
         
-        result = [data.to_dict() for data in recent_data]
+        stations = query.order_by(StationSnapshot.station).all()
+        newest_update = max((station.last_update for station in stations), default=None)
         
         return jsonify({
             'success': True,
-            'data': result,
-            'count': len(result),
+            'data': [station.to_dict() for station in stations],
+            'count': len(stations),
+            'last_update': newest_update.isoformat() if newest_update else None,
             'timestamp': datetime.utcnow().isoformat()
         })
-        
+    
     except Exception as e:
-        logger.error(f"Error in get_realtime_aqi: {e}")
+        logger.error(f"Error in get_map_snapshot: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @aqi_bp.route('/aqi/historical', methods=['GET'])
+@cached_response(tables=('aqi_data', 'aqi_rollup'))
 def get_historical_aqi():
     """
     Get historical AQI data for a specific location
@@ -97,7 +240,11 @@ def get_historical_aqi():
     - start_date: Start date (YYYY-MM-DD format)
     - end_date: End date (YYYY-MM-DD format)
     - pollutant: Filter by pollutant type
-    - limit: Maximum number of records (default: 100)
+    - match: How city and state are matched: exact, prefix or contains (default: exact)
+    - granularity: Return hour, day or month rollups instead of raw records
+    - limit: Maximum number of records per page, up to MAX_LIMIT (default: 100)
+    - cursor: next_cursor of the previous page
+    - format: rows (one object per record, default) or columnar (one array per field)
     """
     try:
         state = request.args.get('state')
@@ -105,7 +252,11 @@ def get_historical_aqi():
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
         pollutant = request.args.get('pollutant')
-        limit = int(request.args.get('limit', 100))
+        granularity = request.args.get('granularity')
+        limit, limit_error = _parse_limit(100)
+        if limit_error:
+            return limit_error
+        cursor = request.args.get('cursor')
         
         if not city:
             return jsonify({
@@ -113,61 +264,308 @@ def get_historical_aqi():
                 'error': 'City parameter is required'
             }), 400
         
-        # Parse dates
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)  # Default to last 30 days
+        if granularity and granularity not in ROLLUP_GRANULARITIES:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid granularity. Use one of: {', '.join(ROLLUP_GRANULARITIES)}"
+            }), 400
         
-        if start_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            except ValueError:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid start_date format. Use YYYY-MM-DD'
-                }), 400
+        match_error = _validate_match_mode()
+        if match_error:
+            return match_error
+        
+        format_error = _validate_format()
+        if format_error:
+            return format_error
+        response_format = request.args.get('format', 'rows')
+        
+        pollutant_error = _validate_pollutant(pollutant)
+        if pollutant_error:
+            return pollutant_error
+        
+        start_date, end_date, date_error = _parse_date_range(start_date_str, end_date_str)
+        if date_error:
+            return date_error
+        
+        if granularity:
+            # Precomputed buckets: a few hundred indexed rows even for a year
+            query = AQIRollup.query if response_format == 'rows' else _column_query(ROLLUP_COLUMNS)
+            query = filter_by_location(query, AQIRollup, city, state, request.args.get('match', 'exact')).filter(
+                AQIRollup.granularity == granularity,
+                AQIRollup.bucket_start >= rollup_bucket_start(start_date, granularity),
+                AQIRollup.bucket_start <= end_date
+            )
+            
+            if pollutant:
+                query = query.filter(AQIRollup.pollutant_id == pollutant)
+            
+            historical_data, next_cursor = paginate_keyset(query, AQIRollup.bucket_start, AQIRollup.id, limit, cursor)
+            columns = ROLLUP_COLUMNS
+        else:
+            # Build query
+            query = AQIData.query if response_format == 'rows' else _column_query(HISTORICAL_COLUMNS)
+            query = filter_by_location(query, AQIData, city, state, request.args.get('match', 'exact')).filter(
+                AQIData.last_update >= start_date,
+                AQIData.last_update <= end_date
+            )
+            
+            if pollutant:
+                query = query.filter(AQIData.pollutant_id == pollutant)
+            
+            historical_data, next_cursor = paginate_keyset(query, AQIData.last_update, AQIData.id, limit, cursor)
+            columns = HISTORICAL_COLUMNS
         
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-            except ValueError:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid end_date format. Use YYYY-MM-DD'
-                }), 400
+        data = _serialize(historical_data, columns, response_format)
+        if granularity and response_format == 'columnar':
+            data['aqi_value'] = [int(round(value)) if value is not None else None for value in data['aqi_value']]
         
-        # Build query
-        query = AQIData.query.filter(
-            AQIData.city.ilike(f'%{city}%'),
-            AQIData.last_update >= start_date,
-            AQIData.last_update <= end_date
-        )
+        return jsonify({
+            'success': True,
+            'data': data,
+            'count': len(historical_data),
+            'format': response_format,
+            'next_cursor': next_cursor,
+            'granularity': granularity or 'raw',
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in get_historical_aqi: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@aqi_bp.route('/aqi/aggregate', methods=['GET'])
+@cached_response(tables=('aqi_data', 'aqi_rollup', 'ingestion_watermark'))
+def get_aggregated_aqi():
+    """
+    Get per-bucket statistics of AQI readings for a specific location
+    Query parameters:
+    - state: State name
+    - city: City name (required)
+    - start_date: Start date (YYYY-MM-DD format)
+    - end_date: End date (YYYY-MM-DD format)
+    - pollutants: Comma-separated pollutants (default: all)
+    - bucket: hour, day, week or month (default: day)
+    - percentiles: Comma-separated percentiles between 0 and 100 (default: 95)
+    - match: How city and state are matched: exact, prefix or contains (default: exact)
+    - format: rows (one object per bucket, default) or columnar (one array per field)
+    """
+    try:
+        state = request.args.get('state')
+        city = request.args.get('city')
+        bucket = request.args.get('bucket', 'day')
+        pollutants = [p.strip() for p in request.args.get('pollutants', '').split(',') if p.strip()]
         
-        if state:
-            query = query.filter(AQIData.state.ilike(f'%{state}%'))
-        if pollutant:
-            query = query.filter(AQIData.pollutant_id == pollutant)
+        if not city:
+            return jsonify({
+                'success': False,
+                'error': 'City parameter is required'
+            }), 400
+        
+        if bucket not in AGGREGATION_BUCKETS:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid bucket. Use one of: {', '.join(AGGREGATION_BUCKETS)}"
+            }), 400
+        
+        try:
+            percentiles_arg = request.args.get('percentiles')
+            percentiles = DEFAULT_PERCENTILES if percentiles_arg is None else [
+                float(p) for p in percentiles_arg.split(',') if p.strip()
+            ]
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'Percentiles must be comma-separated numbers'
+            }), 400
+        
+        match_error = _validate_match_mode()
+        if match_error:
+            return match_error
+        
+        format_error = _validate_format()
+        if format_error:
+            return format_error
+        response_format = request.args.get('format', 'rows')
         
-        historical_data = query.order_by(desc(AQIData.last_update)).limit(limit).all()
+        for pollutant in pollutants:
+            pollutant_error = _validate_pollutant(pollutant)
+            if pollutant_error:
+                return pollutant_error
         
-        result = [data.to_dict() for data in historical_data]
+        start_date, end_date, date_error = _parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+        if date_error:
+            return date_error
+        
+        stats = aggregate_aqi(city, state, request.args.get('match', 'exact'), pollutants or None,
+                              bucket, start_date, end_date, percentiles)
+        
+        records = to_records(stats)
+        if response_format == 'columnar':
+            fields = aggregate_fields(percentiles)
+            data = columnar([[record[field] for field in fields] for record in records], fields)
+        else:
+            data = records
         
         return jsonify({
             'success': True,
-            'data': result,
-            'count': len(result),
+            'data': data,
+            'count': len(records),
+            'format': response_format,
+            'bucket': bucket,
             'start_date': start_date.isoformat(),
             'end_date': end_date.isoformat(),
             'timestamp': datetime.utcnow().isoformat()
         })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in get_aggregated_aqi: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@aqi_bp.route('/aqi/export', methods=['GET'])
+def export_aqi():
+    """
+    Stream AQI records of a location as NDJSON or CSV, oldest first
+    
+    Rows are read through a server-side cursor and written chunk by chunk,
+    so exports of any length run in constant memory and the first bytes
+    are sent immediately.
+    
+    Query parameters:
+    - state: State name
+    - city: City name (required)
+    - station: Filter by station name
+    - start_date: Start date (YYYY-MM-DD format, default: 30 days ago)
+    - end_date: End date (YYYY-MM-DD format, default: now)
+    - pollutant: Filter by pollutant type
+    - match: How city and state are matched: exact, prefix or contains (default: exact)
+    - granularity: Export hour, day or month rollups instead of raw records
+    - format: ndjson (default) or csv
+    - gzip: Whether to gzip the response (default: false)
+    """
+    try:
+        state = request.args.get('state')
+        city = request.args.get('city')
+        station = request.args.get('station')
+        pollutant = request.args.get('pollutant')
+        granularity = request.args.get('granularity')
+        export_format = request.args.get('format', 'ndjson')
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        
+        if not city:
+            return jsonify({
+                'success': False,
+                'error': 'City parameter is required'
+            }), 400
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid format parameter. Use one of: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        
+        if granularity and granularity not in ROLLUP_GRANULARITIES:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid granularity. Use one of: {', '.join(ROLLUP_GRANULARITIES)}"
+            }), 400
+        
+        if granularity and station:
+            return jsonify({
+                'success': False,
+                'error': 'Rollups are per city, station cannot be combined with granularity'
+            }), 400
+        
+        match_error = _validate_match_mode()
+        if match_error:
+            return match_error
+        
+        pollutant_error = _validate_pollutant(pollutant)
+        if pollutant_error:
+            return pollutant_error
+        
+        start_date, end_date, date_error = _parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+        if date_error:
+            return date_error
+        
+        if granularity:
+            model, columns, time_column = AQIRollup, ROLLUP_COLUMNS, AQIRollup.bucket_start
+            query = select(*[column for _, column in columns]).where(
+                AQIRollup.granularity == granularity,
+                AQIRollup.bucket_start >= rollup_bucket_start(start_date, granularity),
+                AQIRollup.bucket_start <= end_date
+            )
+        else:
+            model, columns, time_column = AQIData, HISTORICAL_COLUMNS, AQIData.last_update
+            query = select(*[column for _, column in columns]).where(
+                AQIData.last_update >= start_date,
+                AQIData.last_update <= end_date
+            )
+            if station:
+                query = query.where(AQIData.station == station)
+        
+        query = filter_by_location(query, model, city, state, request.args.get('match', 'exact'))
+        if pollutant:
+            query = query.where(model.pollutant_id == pollutant)
+        
+        # yield_per streams from a server-side cursor where the backend has one
+        query = query.order_by(time_column, model.id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+        fields = [name for name, _ in columns]
+        aqi_index = fields.index('aqi_value')
+        
+        def chunks():
+            try:
+                for rows in db.session.execute(query).partitions():
+                    if granularity:
+                        rows = [_round_rollup_aqi(row, aqi_index) for row in rows]
+                    yield rows
+            except Exception as e:
+                # Headers are already sent, the truncated body is the only signal left
+                logger.error(f"Error in export_aqi after the response started: {e}")
         
+        response = Response(
+            stream_with_context(stream_export(chunks(), fields, export_format, compress)),
+            mimetype=EXPORT_MIMETYPES[export_format]
+        )
+        filename = secure_filename(f"aqi_{city}_{granularity or 'raw'}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}")
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        # Keep reverse proxies from buffering the whole export
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error in get_historical_aqi: {e}")
+        logger.error(f"Error in export_aqi: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @aqi_bp.route('/aqi/forecast', methods=['GET'])
+@cached_response(tables=('aqi_forecast', 'location'))
 def get_aqi_forecast():
     """
     Get AQI forecast for a specific location
@@ -175,11 +573,19 @@ def get_aqi_forecast():
     - state: State name
     - city: City name (required)
     - days: Number of days to forecast (default: 3, max: 7)
+    - match: How city and state are matched: exact, prefix or contains (default: exact)
+    - limit: Maximum number of records per page, up to MAX_LIMIT (default: 100)
+    - cursor: next_cursor of the previous page
+    - format: rows (one object per record, default) or columnar (one array per field)
     """
     try:
         state = request.args.get('state')
         city = request.args.get('city')
         days = int(request.args.get('days', 3))
+        limit, limit_error = _parse_limit(100)
+        if limit_error:
+            return limit_error
+        cursor = request.args.get('cursor')
         
         if not city:
             return jsonify({
@@ -187,30 +593,38 @@ def get_aqi_forecast():
                 'error': 'City parameter is required'
             }), 400
         
+        match_error = _validate_match_mode()
+        if match_error:
+            return match_error
+        
+        format_error = _validate_format()
+        if format_error:
+            return format_error
+        response_format = request.args.get('format', 'rows')
+        
         if days > 7:
             days = 7
         
         # Get forecast data from database
         end_date = datetime.utcnow() + timedelta(days=days)
         
-        query = AQIForecast.query.filter(
-            AQIForecast.city.ilike(f'%{city}%'),
+        query = AQIForecast.query if response_format == 'rows' else _column_query(FORECAST_COLUMNS).select_from(AQIForecast).join(
+            Location, AQIForecast.location_id == Location.id
+        )
+        query = filter_by_location(query, AQIForecast, city, state, request.args.get('match', 'exact')).filter(
             AQIForecast.forecast_date >= datetime.utcnow(),
             AQIForecast.forecast_date <= end_date
         )
         
-        if state:
-            query = query.filter(AQIForecast.state.ilike(f'%{state}%'))
-        
-        forecast_data = query.order_by(AQIForecast.forecast_date).all()
-        
-        result = [data.to_dict() for data in forecast_data]
+        forecast_data, next_cursor = paginate_keyset(
+            query, AQIForecast.forecast_date, AQIForecast.id, limit, cursor, descending=False
+        )
         
         # If no forecast data available, return a placeholder message
-        if not result:
+        if not forecast_data:
             return jsonify({
                 'success': True,
-                'data': [],
+                'data': _serialize(forecast_data, FORECAST_COLUMNS, response_format),
                 'message': 'No forecast data available. ML model needs to be trained and run.',
                 'count': 0,
                 'timestamp': datetime.utcnow().isoformat()
@@ -218,12 +632,19 @@ def get_aqi_forecast():
         
         return jsonify({
             'success': True,
-            'data': result,
-            'count': len(result),
+            'data': _serialize(forecast_data, FORECAST_COLUMNS, response_format),
+            'count': len(forecast_data),
+            'format': response_format,
+            'next_cursor': next_cursor,
             'forecast_days': days,
             'timestamp': datetime.utcnow().isoformat()
         })
-        
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error in get_aqi_forecast: {e}")
         return jsonify({
@@ -267,7 +688,7 @@ def get_health_recommendations():
             'recommendations': recommendations,
             'timestamp': datetime.utcnow().isoformat()
         })
-        
+    
     except Exception as e:
         logger.error(f"Error in get_health_recommendations: {e}")
         return jsonify({
@@ -295,18 +716,17 @@ def refresh_aqi_data():
         
         refreshed_count = 0
         errors = []
+        touched = set()
         
-        for city in cities:
+        # Fetch all cities concurrently and store each one as it completes
+        for city, fresh_aqi_data in cpcb_ingestion.fetch_many(cities, limit=50):
             try:
-                # Fetch fresh AQI data
-                fresh_aqi_data = cpcb_ingestion.fetch_realtime_aqi(city=city, limit=50)
-                
-                for record in fresh_aqi_data:
-                    processed_record = cpcb_ingestion.process_aqi_record(record)
-                    aqi_data = AQIData(**processed_record)
-                    db.session.add(aqi_data)
-                    refreshed_count += 1
-                
+                batch = cpcb_ingestion.process_aqi_batch(fresh_aqi_data)
+                # A savepoint per city, so a failed city leaves the others' rows to commit
+                with db.session.begin_nested():
+                    refreshed_count += upsert_aqi_records(batch, update_rollups=False)
+                touched |= aqi_rollup_buckets(batch)
+            
             except Exception as e:
                 errors.append(f"Error refreshing data for {city}: {str(e)}")
                 logger.error(f"Error refreshing data for {city}: {e}")
@@ -320,6 +740,8 @@ def refresh_aqi_data():
                 'error': f'Error saving refreshed data: {str(e)}'
             }), 500
         
+        refresh_deferred_rollups(touched)
+        
         return jsonify({
             'success': True,
             'refreshed_records': refreshed_count,
@@ -327,7 +749,7 @@ def refresh_aqi_data():
             'errors': errors,
             'timestamp': datetime.utcnow().isoformat()
         })
-        
+    
     except Exception as e:
         logger.error(f"Error in refresh_aqi_data: {e}")
         return jsonify({
@@ -335,6 +757,166 @@ def refresh_aqi_data():
             'error': str(e)
         }), 500
 
+@aqi_bp.route('/aqi/ingestion-stats', methods=['GET'])
+def get_ingestion_stats():
+    """
+    Get request, throttling and retry counters of the external API client
+    and the hit counters of the response cache
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'http_stats': http_client.stats(),
+            'response_cache_stats': dict(response_cache.stats),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in get_ingestion_stats: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _validate_match_mode():
+    """Return a 400 response if the match query parameter is invalid, else None"""
+    match = request.args.get('match', 'exact')
+    if match not in LOCATION_MATCH_MODES:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid match parameter. Use one of: {', '.join(LOCATION_MATCH_MODES)}"
+        }), 400
+    return None
+
+def _validate_format():
+    """Return a 400 response if the format query parameter is invalid, else None"""
+    response_format = request.args.get('format', 'rows')
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid format parameter. Use one of: {', '.join(RESPONSE_FORMATS)}"
+        }), 400
+    return None
+
+def _parse_limit(default: int):
+    """
+    Parse the limit query parameter
+    
+    Returns:
+        Tuple of (limit, 400 response or None)
+    """
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        limit = None
+    
+    if limit is None or not 1 <= limit <= MAX_LIMIT:
+        return None, (jsonify({
+            'success': False,
+            'error': f'Invalid limit. Use an integer between 1 and {MAX_LIMIT}'
+        }), 400)
+    return limit, None
+
+def _column_query(columns):
+    """Query selecting plain column tuples, skipping ORM object construction"""
+    return db.session.query(*[column for _, column in columns])
+
+def _serialize(rows, columns, response_format: str):
+    """Serialize a page as a list of record dicts or, for columnar, one list per field"""
+    if response_format == 'columnar':
+        return columnar(rows, [name for name, _ in columns])
+    return [row.to_dict() for row in rows]
+
+def _parse_date_range(start_date_str: Optional[str], end_date_str: Optional[str]):
+    """
+    Parse the start_date and end_date query parameters
+    
+    Returns:
+        Tuple of (start date, end date, 400 response or None), defaulting to the last 30 days
+    """
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=30)  # Default to last 30 days
+    
+    if start_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        except ValueError:
+            return None, None, (jsonify({
+                'success': False,
+                'error': 'Invalid start_date format. Use YYYY-MM-DD'
+            }), 400)
+    
+    if end_date_str:
+        try:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+        except ValueError:
+            return None, None, (jsonify({
+                'success': False,
+                'error': 'Invalid end_date format. Use YYYY-MM-DD'
+            }), 400)
+    
+    return start_date, end_date, None
+
+def _round_rollup_aqi(row, index: int) -> tuple:
+    """Round the aqi_value of a ROLLUP_COLUMNS row to an integer, like AQIRollup.to_dict()"""
+    row = list(row)
+    if row[index] is not None:
+        row[index] = int(round(row[index]))
+    return tuple(row)
+
+def _validate_pollutant(pollutant: Optional[str]):
+    """Return a 400 response if the pollutant query parameter is invalid, else None"""
+    if pollutant and pollutant not in POLLUTANTS:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid pollutant parameter. Use one of: {', '.join(POLLUTANTS)}"
+        }), 400
+    return None
+
+def schedule_realtime_refresh(state: Optional[str], city: str, limit: int) -> bool:
+    """
+    Refresh a city's realtime data from the CPCB API in the background
+    
+    Only one refresh per city runs at a time, and none is started while the
+    circuit breaker holds the CPCB API open.
+    
+    Returns:
+        Whether a refresh for the city is scheduled or already running
+    """
+    if not http_client.is_available(cpcb_ingestion.base_url):
+        logger.info(f"CPCB API circuit is open, serving stale data for {city}")
+        return False
+    
+    key = ((state or '').lower(), city.lower())
+    with refreshes_lock:
+        if key in refreshes_in_flight:
+            return True
+        refreshes_in_flight.add(key)
+    
+    app = current_app._get_current_object()
+    refresh_executor.submit(_refresh_realtime_aqi, app, key, state, city, limit)
+    return True
+
+def _refresh_realtime_aqi(app, key, state: Optional[str], city: str, limit: int):
+    try:
+        with app.app_context():
+            logger.info(f"Refreshing realtime AQI data for {city} from API")
+            fresh_data = cpcb_ingestion.fetch_realtime_aqi(state=state, city=city, limit=limit)
+            
+            try:
+                batch = cpcb_ingestion.process_aqi_batch(fresh_data)
+                upsert_aqi_records(batch, update_rollups=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error saving AQI data: {e}")
+                return
+            
+            refresh_deferred_rollups(aqi_rollup_buckets(batch))
+    finally:
+        with refreshes_lock:
+            refreshes_in_flight.discard(key)
+
 def get_aqi_category(aqi_value: int) -> str:
     """Get AQI category based on AQI value"""
     if aqi_value <= 50:
@@ -357,7 +939,7 @@ def get_health_recommendations_for_aqi(aqi_value: int, sensitive_group: bool = F
     Args:
         aqi_value: Current AQI value
         sensitive_group: Whether user belongs to sensitive group
-        
+    
     Returns:
         Dictionary containing health recommendations
     """
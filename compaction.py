@@ -0,0 +1,321 @@
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, or_
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup, WeatherData
+from src.models.aqi_repository import refresh_aqi_rollups, rollup_bucket_start
+from src.models.parquet_archive import AQI_DATASET, parquet_available, archived_until
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Retention tiers: raw observations, then hourly aggregates, then daily aggregates forever
+RAW_RETENTION_DAYS = int(os.getenv('RETENTION_RAW_DAYS', 30))
+HOURLY_RETENTION_DAYS = int(os.getenv('RETENTION_HOURLY_DAYS', 365))
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Statements deleting rows by id are split into chunks of this many ids
+DELETE_CHUNK = 500
+
+WEATHER_MEASUREMENTS = ('temperature', 'humidity', 'wind_speed', 'pressure', 'visibility')
+
+# SQLite has no date_trunc(), timestamps are truncated by formatting them
+SQLITE_TRUNCATE_FORMATS = {'second': '%Y-%m-%d %H:%M:%S', 'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d 00:00:00'}
+
+def compact_observations(raw_days: int = RAW_RETENTION_DAYS,
+                         hourly_days: int = HOURLY_RETENTION_DAYS,
+                         batch_size: int = DEFAULT_BATCH_SIZE,
+                         max_batches: Optional[int] = None,
+                         now: Optional[datetime] = None) -> Dict:
+    """
+    Apply the retention tiers to the observation tables
+    
+    AQI readings older than raw_days are deleted once their hourly rollups
+    exist and their day was exported to the Parquet archive, so the archive
+    keeps the full raw history. Without pyarrow, or before the first
+    export, raw readings are kept. Hourly rollups older than hourly_days are deleted, leaving
+    the daily and monthly ones. Weather rows older than raw_days are
+    replaced by one averaged row per location and hour, and those older
+    than hourly_days by one row per location and day.
+    
+    Every step works through bounded batches of whole buckets and commits
+    after each one, so writers are never blocked for long and an
+    interrupted run resumes where it stopped.
+    
+    Must be called inside a Flask application context.
+    
+    Args:
+        raw_days: Days raw observations are kept
+        hourly_days: Days hourly aggregates are kept
+        batch_size: Maximum number of rows read per batch (a single bucket
+            larger than this is still processed in one batch)
+        max_batches: Stop each step after this many batches (None runs to completion)
+        now: Reference time of the cutoffs (defaults to now)
+    
+    Returns:
+        Dictionary with the rows reclaimed per step and in total
+    """
+    if hourly_days < raw_days:
+        raise ValueError('hourly_days must not be shorter than raw_days')
+    
+    now = now or datetime.utcnow()
+    raw_cutoff = rollup_bucket_start(now - timedelta(days=raw_days), 'day')
+    hourly_cutoff = rollup_bucket_start(now - timedelta(days=hourly_days), 'day')
+    
+    exported_until = archived_until(AQI_DATASET) if parquet_available() else None
+    if exported_until is None:
+        logger.warning("Keeping raw AQI readings, none were exported to the Parquet archive")
+    
+    stats = {
+        'aqi_data': purge_raw_aqi(min(raw_cutoff, exported_until), batch_size, max_batches) if exported_until else 0,
+        'aqi_rollup_hour': purge_hourly_rollups(hourly_cutoff, batch_size, max_batches),
+        'weather_data_hour': downsample_weather('hour', raw_cutoff, batch_size, max_batches),
+        'weather_data_day': downsample_weather('day', hourly_cutoff, batch_size, max_batches)
+    }
+    stats['rows_reclaimed'] = sum(stats.values())
+    
+    logger.info(f"Compaction reclaimed {stats['rows_reclaimed']} rows: {stats}")
+    return stats
+
+def purge_raw_aqi(cutoff: datetime, batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """
+    Delete AQI readings older than cutoff, oldest hours first
+    
+    Hours are deleted whole, after computing any hourly rollup missing
+    for them, so the rollups never lose readings. Late readings for an
+    hour older than the raw retention recompute that hour from themselves
+    alone, so do not replay archives further back than the retention.
+    
+    Returns:
+        Number of rows deleted
+    """
+    columns = (AQIData.id, AQIData.city_key, AQIData.state_key, AQIData.pollutant_id, AQIData.last_update)
+    deleted = 0
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        rows = _whole_bucket_batch(
+            db.session.query(*columns).filter(AQIData.last_update < cutoff),
+            AQIData.last_update, AQIData.id, 'hour', batch_size
+        )
+        if not rows:
+            break
+        
+        _ensure_hourly_rollups({
+            (row.city_key, row.state_key, row.pollutant_id, rollup_bucket_start(row.last_update, 'hour'))
+            for row in rows
+        })
+        deleted += _delete_ids(AQIData, [row.id for row in rows])
+        db.session.commit()
+        batches += 1
+    
+    if deleted:
+        logger.info(f"Deleted {deleted} AQI readings older than {cutoff}")
+    return deleted
+
+def purge_hourly_rollups(cutoff: datetime, batch_size: int = DEFAULT_BATCH_SIZE,
+                         max_batches: Optional[int] = None) -> int:
+    """
+    Delete hourly rollups older than cutoff, keeping the daily and monthly ones
+    
+    Returns:
+        Number of rows deleted
+    """
+    deleted = 0
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        ids = [
+            row_id for row_id, in db.session.query(AQIRollup.id).filter(
+                AQIRollup.granularity == 'hour',
+                AQIRollup.bucket_start < cutoff
+            ).order_by(AQIRollup.bucket_start).limit(batch_size)
+        ]
+        if not ids:
+            break
+        
+        deleted += _delete_ids(AQIRollup, ids)
+        db.session.commit()
+        batches += 1
+    
+    if deleted:
+        logger.info(f"Deleted {deleted} hourly AQI rollups older than {cutoff}")
+    return deleted
+
+def downsample_weather(granularity: str, cutoff: datetime, batch_size: int = DEFAULT_BATCH_SIZE,
+                       max_batches: Optional[int] = None) -> int:
+    """
+    Replace weather rows older than cutoff by one averaged row per location and bucket
+    
+    Buckets to compact are found from the data: those holding several rows
+    or a row recorded after the bucket start. Compacted buckets are skipped
+    on later runs, and a late row stored into one gets it compacted again.
+    The averaged row is stamped with the start of its bucket. Wind direction
+    is averaged as a vector, the other measurements arithmetically.
+    
+    Args:
+        granularity: 'hour' or 'day'
+        cutoff: Rows recorded before this time are downsampled
+    
+    Returns:
+        Number of rows reclaimed (rows deleted minus rows inserted)
+    """
+    cutoff = rollup_bucket_start(cutoff, granularity)
+    columns = [WeatherData.__table__.c[name] for name in
+               ('id', 'location_id', 'recorded_at', 'wind_direction') + WEATHER_MEASUREMENTS]
+    reclaimed = 0
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        buckets = _uncompacted_weather_buckets(granularity, cutoff, batch_size)
+        if not buckets:
+            break
+        
+        conditions = [
+            and_(WeatherData.location_id == location_id,
+                 WeatherData.recorded_at >= start,
+                 WeatherData.recorded_at < _next_bucket(start, granularity))
+            for location_id, start in buckets
+        ]
+        rows = []
+        for start in range(0, len(conditions), DELETE_CHUNK):
+            rows.extend(db.session.query(*columns).filter(or_(*conditions[start:start + DELETE_CHUNK])).all())
+        
+        frame = pd.DataFrame(rows, columns=[column.key for column in columns])
+        frame['recorded_at'] = pd.to_datetime(frame['recorded_at'])
+        frame['bucket_start'] = frame['recorded_at'].dt.floor('h' if granularity == 'hour' else 'D')
+        
+        averaged = _average_weather(frame)
+        _delete_ids(WeatherData, frame['id'].tolist())
+        db.session.execute(WeatherData.__table__.insert(), averaged)
+        reclaimed += len(frame) - len(averaged)
+        db.session.commit()
+        batches += 1
+    
+    if reclaimed:
+        logger.info(f"Downsampled weather older than {cutoff} to {granularity}s, reclaimed {reclaimed} rows")
+    return reclaimed
+
+def _uncompacted_weather_buckets(granularity: str, cutoff: datetime, batch_size: int) -> List[Tuple[int, datetime]]:
+    """
+    Find the oldest weather buckets holding several rows or a row recorded after their start
+    
+    Buckets are returned until they add up to batch_size rows, at least one.
+    Offsets below a second are ignored, a single row is compact enough.
+    """
+    bucket = _truncate(WeatherData.recorded_at, granularity)
+    rows = func.count(WeatherData.id)
+    query = db.session.query(WeatherData.location_id, bucket, rows).filter(
+        WeatherData.recorded_at < cutoff
+    ).group_by(WeatherData.location_id, bucket).having(
+        or_(rows > 1, _truncate(func.min(WeatherData.recorded_at), 'second') != bucket)
+    ).order_by(bucket, WeatherData.location_id).limit(batch_size)
+    
+    buckets = []
+    total = 0
+    for location_id, start, count in query:
+        if buckets and total + count > batch_size:
+            break
+        buckets.append((location_id, pd.Timestamp(start).to_pydatetime()))
+        total += count
+    return buckets
+
+def _whole_bucket_batch(query, time_column, id_column, granularity: str, batch_size: int) -> List:
+    """
+    Read the oldest rows of a query, cut back to the last complete bucket
+    
+    If the first bucket alone exceeds batch_size, the whole bucket is read.
+    """
+    rows = query.order_by(time_column, id_column).limit(batch_size).all()
+    if len(rows) < batch_size:
+        return rows
+    
+    # The last bucket may continue past the limit
+    boundary = rollup_bucket_start(getattr(rows[-1], time_column.key), granularity)
+    complete = [row for row in rows if getattr(row, time_column.key) < boundary]
+    if complete:
+        return complete
+    
+    return query.filter(time_column < _next_bucket(boundary, granularity)).order_by(time_column, id_column).all()
+
+def _ensure_hourly_rollups(buckets) -> None:
+    """Compute the hourly rollups missing for the given buckets"""
+    city_keys = {city_key for city_key, _, _, _ in buckets}
+    starts = [start for _, _, _, start in buckets]
+    existing = set(
+        db.session.query(AQIRollup.city_key, AQIRollup.state_key, AQIRollup.pollutant_id, AQIRollup.bucket_start).filter(
+            AQIRollup.granularity == 'hour',
+            AQIRollup.city_key.in_(city_keys),
+            AQIRollup.bucket_start >= min(starts),
+            AQIRollup.bucket_start <= max(starts)
+        ).all()
+    )
+    
+    missing = {bucket for bucket in buckets if bucket not in existing}
+    if missing:
+        logger.info(f"Computing {len(missing)} missing hourly rollups before deleting their readings")
+        refresh_aqi_rollups(missing)
+
+def _average_weather(frame: pd.DataFrame) -> List[Dict]:
+    """Average weather rows per location and bucket"""
+    grouped = frame.groupby(['location_id', 'bucket_start'])
+    averaged = grouped[list(WEATHER_MEASUREMENTS)].mean()
+    
+    radians = np.deg2rad(frame['wind_direction'])
+    vectors = pd.DataFrame({'x': np.cos(radians), 'y': np.sin(radians)}, index=frame.index)
+    vectors = vectors.groupby([frame['location_id'], frame['bucket_start']]).mean()
+    averaged['wind_direction'] = np.rad2deg(np.arctan2(vectors['y'], vectors['x'])).round(6) % 360
+    
+    averaged = averaged.reset_index().rename(columns={'bucket_start': 'recorded_at'})
+    averaged = averaged.astype(object).where(averaged.notna(), None)
+    
+    now = datetime.utcnow()
+    rows = averaged.to_dict('records')
+    for row in rows:
+        row['location_id'] = int(row['location_id'])
+        row['recorded_at'] = pd.Timestamp(row['recorded_at']).to_pydatetime()
+        row['created_at'] = now
+    return rows
+
+def _delete_ids(model, ids: List[int]) -> int:
+    deleted = 0
+    for start in range(0, len(ids), DELETE_CHUNK):
+        deleted += db.session.query(model).filter(
+            model.id.in_(ids[start:start + DELETE_CHUNK])
+        ).delete(synchronize_session=False)
+    return deleted
+
+def _truncate(expression, granularity: str):
+    """Truncate a timestamp expression to the start of its second, hour or day in SQL"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.strftime(SQLITE_TRUNCATE_FORMATS[granularity], expression)
+    return func.date_trunc(granularity, expression)
+
+def _next_bucket(start: datetime, granularity: str) -> datetime:
+    return start + (timedelta(hours=1) if granularity == 'hour' else timedelta(days=1))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Apply the retention tiers to the observation tables')
+    parser.add_argument('--raw-days', type=int, default=RAW_RETENTION_DAYS, help='Days raw observations are kept')
+    parser.add_argument('--hourly-days', type=int, default=HOURLY_RETENTION_DAYS, help='Days hourly aggregates are kept')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, help='Stop each step after this many batches')
+    args = parser.parse_args()
+    
+    from src.main import app
+    
+    with app.app_context():
+        result = compact_observations(args.raw_days, args.hourly_days, args.batch_size, args.max_batches)
+    print("Compaction Result:", result)
@@ -1,24 +1,376 @@
 import requests
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union
 import logging
+import numpy as np
+from src.data_ingestion.http_client import ResilientHTTPClient
+from src.data_ingestion.raw_archive import CPCB_SOURCE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# data.gov.in reports last_update in Indian Standard Time
+CPCB_UTC_OFFSET = timedelta(hours=5, minutes=30)
+
+# AQI breakpoints for different pollutants (Indian standards)
+# Each segment is (c_low, c_high, aqi_low, aqi_high)
+NAQI_BREAKPOINTS = {
+    'PM2.5': [(0, 30, 0, 50), (30, 60, 51, 100), (60, 90, 101, 200), 
+             (90, 120, 201, 300), (120, 250, 301, 400), (250, float('inf'), 401, 500)],
+    'PM10': [(0, 50, 0, 50), (50, 100, 51, 100), (100, 250, 101, 200), 
+            (250, 350, 201, 300), (350, 430, 301, 400), (430, float('inf'), 401, 500)],
+    'NO2': [(0, 40, 0, 50), (40, 80, 51, 100), (80, 180, 101, 200), 
+           (180, 280, 201, 300), (280, 400, 301, 400), (400, float('inf'), 401, 500)],
+    'SO2': [(0, 40, 0, 50), (40, 80, 51, 100), (80, 380, 101, 200), 
+           (380, 800, 201, 300), (800, 1600, 301, 400), (1600, float('inf'), 401, 500)],
+    'CO': [(0, 1, 0, 50), (1, 2, 51, 100), (2, 10, 101, 200), 
+          (10, 17, 201, 300), (17, 34, 301, 400), (34, float('inf'), 401, 500)],
+    'OZONE': [(0, 50, 0, 50), (50, 100, 51, 100), (100, 168, 101, 200), 
+             (168, 208, 201, 300), (208, 748, 301, 400), (748, float('inf'), 401, 500)],
+    'NH3': [(0, 200, 0, 50), (200, 400, 51, 100), (400, 800, 101, 200), 
+           (800, 1200, 201, 300), (1200, 1800, 301, 400), (1800, float('inf'), 401, 500)]
+}
+
+# Breakpoints as arrays (c_low, c_high, aqi_low, aqi_high) for the batch path
+NAQI_BREAKPOINT_TABLES = {
+    pollutant: tuple(np.array(column, dtype=np.float64) for column in zip(*segments))
+    for pollutant, segments in NAQI_BREAKPOINTS.items()
+}
+
+# Upper AQI bound of every category except the last one
+AQI_CATEGORY_LIMITS = np.array([50, 100, 200, 300, 400])
+AQI_CATEGORIES = np.array(['Good', 'Satisfactory', 'Moderate', 'Poor', 'Very Poor', 'Severe', 'Unknown'], dtype=object)
+
+def calculate_aqi_batch(pollutant_ids, concentrations) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate AQI sub-indices and categories for a batch of readings
+    
+    Args:
+        pollutant_ids: Sequence of pollutant types
+        concentrations: Sequence of pollutant concentrations (None or NaN for missing)
+        
+    Returns:
+        Tuple of (AQI values as floats with NaN where no AQI applies,
+        AQI category labels with 'Unknown' where no AQI applies)
+    """
+    pollutant_codes, pollutant_dictionary = _dictionary_encode(list(pollutant_ids))
+    aqi, category_codes = _calculate_aqi_codes(
+        pollutant_codes,
+        pollutant_dictionary,
+        np.array(concentrations, dtype=np.float64)
+    )
+    
+    return aqi, AQI_CATEGORIES[category_codes]
+
+def _calculate_aqi_codes(pollutant_codes: np.ndarray,
+                         pollutant_dictionary: np.ndarray,
+                         values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate AQI sub-indices for dictionary-encoded pollutants
+    
+    Returns:
+        Tuple of (AQI values with NaN where no AQI applies, indices into AQI_CATEGORIES)
+    """
+    aqi = np.full(values.shape, np.nan)
+    
+    for code, pollutant in enumerate(pollutant_dictionary):
+        if pollutant not in NAQI_BREAKPOINT_TABLES:
+            continue
+        
+        mask = (pollutant_codes == code) & np.isfinite(values) & (values >= 0)
+        if not mask.any():
+            continue
+        
+        c_low, c_high, aqi_low, aqi_high = NAQI_BREAKPOINT_TABLES[pollutant]
+        concentration = values[mask]
+        segment = np.searchsorted(c_high, concentration, side='left')
+        
+        # Linear interpolation within the matching segment
+        slope = (aqi_high[segment] - aqi_low[segment]) / (c_high[segment] - c_low[segment])
+        aqi[mask] = np.rint(slope * (concentration - c_low[segment]) + aqi_low[segment])
+    
+    categories = np.full(aqi.shape, len(AQI_CATEGORIES) - 1)
+    known = ~np.isnan(aqi)
+    categories[known] = np.searchsorted(AQI_CATEGORY_LIMITS, aqi[known], side='left')
+    
+    return aqi, categories
+
+def _dictionary_encode(values: List) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode a column as int32 codes into an array of its distinct values, in first-seen order"""
+    dictionary = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    return np.array(codes, dtype=np.int32), np.array(list(dictionary), dtype=object)
+
+def _float_column(values: List, safe_float) -> np.ndarray:
+    """Convert a column to float64 with NaN for missing values"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        # Mixed garbage such as '' or 'NA': fall back to per-value parsing
+        return np.array([safe_float(value) for value in values], dtype=np.float64)
+
+class TimestampParser:
+    """
+    Datetime parser for feed timestamps
+    
+    The format that last succeeded is tried first, so a feed with a single
+    format costs one strptime per distinct string. Parsed results are
+    memoized per string, since every row of a snapshot usually shares the
+    same last_update value.
+    """
+    
+    DEFAULT_FORMATS = (
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%d',
+        '%d-%m-%Y %H:%M:%S',
+        '%d/%m/%Y %H:%M:%S'
+    )
+    
+    def __init__(self, formats: Optional[Iterable[str]] = None, cache_size: int = 10000):
+        """
+        Args:
+            formats: Candidate datetime formats, in initial order of preference
+            cache_size: Maximum number of distinct strings kept in the memo cache
+        """
+        self.formats = tuple(formats or self.DEFAULT_FORMATS)
+        self.cache_size = cache_size
+        self._cache: Dict[str, Optional[datetime]] = {}
+    
+    def parse(self, date_str: Optional[str]) -> Optional[datetime]:
+        """Parse a datetime string, returning None if no format matches"""
+        if not date_str:
+            return None
+        
+        try:
+            return self._cache[date_str]
+        except KeyError:
+            pass
+        
+        parsed = self._parse_uncached(date_str)
+        
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[date_str] = parsed
+        
+        return parsed
+    
+    def parse_many(self, date_strs: Iterable[Optional[str]]) -> np.ndarray:
+        """
+        Parse a whole column of datetime strings
+        
+        Each distinct string is parsed once and the results are scattered
+        back over the column.
+        
+        Args:
+            date_strs: Datetime strings (None or empty for missing values)
+            
+        Returns:
+            Array of datetime64[us] values, NaT where parsing failed
+        """
+        values = np.array([value or '' for value in date_strs], dtype=object)
+        if values.size == 0:
+            return np.array([], dtype='datetime64[us]')
+        
+        distinct, inverse = np.unique(values.astype(str), return_inverse=True)
+        parsed = np.array([self.parse(value) for value in distinct], dtype='datetime64[us]')
+        
+        return parsed[inverse]
+    
+    def _parse_uncached(self, date_str: str) -> Optional[datetime]:
+        for index, fmt in enumerate(self.formats):
+            try:
+                parsed = datetime.strptime(date_str, fmt)
+            except ValueError:
+                continue
+            
+            # Promote the matching format so the next string tries it first
+            if index:
+                self.formats = (fmt,) + self.formats[:index] + self.formats[index + 1:]
+            return parsed
+        
+        logger.warning(f"Could not parse datetime: {date_str}")
+        return None
+
+class AQIRecordBatch:
+    """
+    Columnar batch of processed AQI records
+    
+    Holds one NumPy array per field instead of one dictionary per record.
+    Repeated strings (country, state, city, station, pollutant and AQI
+    category) are stored as int32 codes into a small dictionary of distinct
+    values, numbers as float64 with NaN for missing values and last_update
+    as datetime64[us] with NaT. Row dictionaries or ORM objects are only
+    built when a caller asks for them.
+    """
+    
+    DICTIONARY_FIELDS = ('country', 'state', 'city', 'station', 'pollutant_id', 'aqi_category')
+    FLOAT_FIELDS = ('latitude', 'longitude', 'pollutant_min', 'pollutant_max', 'pollutant_avg', 'aqi_value')
+    FIELDS = (
+        'country', 'state', 'city', 'station', 'latitude', 'longitude', 'pollutant_id',
+        'pollutant_min', 'pollutant_max', 'pollutant_avg', 'last_update', 'aqi_value', 'aqi_category'
+    )
+    
+    def __init__(self, codes: Dict[str, np.ndarray], dictionaries: Dict[str, np.ndarray], values: Dict[str, np.ndarray]):
+        """
+        Args:
+            codes: Dictionary codes of every field in DICTIONARY_FIELDS
+            dictionaries: Distinct values of every field in DICTIONARY_FIELDS
+            values: Arrays of every field in FLOAT_FIELDS, plus last_update
+        """
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.values = values
+    
+    def __len__(self) -> int:
+        return len(self.values['last_update'])
+    
+    @classmethod
+    def from_raw(cls, records: List[Dict], ingestion: 'CPCBDataIngestion') -> 'AQIRecordBatch':
+        """
+        Build a batch from raw API records, computing AQI values and categories
+        
+        Args:
+            records: Raw AQI records from API
+            ingestion: Ingestion client providing the timestamp parser
+        """
+        codes = {}
+        dictionaries = {}
+        values = {}
+        
+        defaults = {'country': 'India'}
+        for field in cls.DICTIONARY_FIELDS[:-1]:
+            default = defaults.get(field, '')
+            codes[field], dictionaries[field] = _dictionary_encode(
+                [record.get(field, default) for record in records]
+            )
+        
+        for field in cls.FLOAT_FIELDS[:-1]:
+            values[field] = _float_column([record.get(field) for record in records], ingestion._safe_float)
+        
+        values['last_update'] = ingestion.timestamp_parser.parse_many(
+            record.get('last_update') for record in records
+        )
+        
+        values['aqi_value'], codes['aqi_category'] = _calculate_aqi_codes(
+            codes['pollutant_id'],
+            dictionaries['pollutant_id'],
+            values['pollutant_avg']
+        )
+        dictionaries['aqi_category'] = AQI_CATEGORIES
+        
+        return cls(codes, dictionaries, values)
+    
+    def column(self, field: str) -> np.ndarray:
+        """Get a field as a decoded array"""
+        if field in self.codes:
+            return self.dictionaries[field][self.codes[field]]
+        return self.values[field]
+    
+    def take(self, selection) -> 'AQIRecordBatch':
+        """Select rows by boolean mask or index array, sharing the dictionaries"""
+        return AQIRecordBatch(
+            {field: codes[selection] for field, codes in self.codes.items()},
+            self.dictionaries,
+            {field: values[selection] for field, values in self.values.items()}
+        )
+    
+    def deduplicate(self, key_fields: Iterable[str]) -> 'AQIRecordBatch':
+        """
+        Drop rows without a complete key and keep the last row for each key
+        
+        Args:
+            key_fields: Dictionary-encoded fields and/or last_update forming the key
+        """
+        key_columns = []
+        complete = np.ones(len(self), dtype=bool)
+        
+        for field in key_fields:
+            if field in self.codes:
+                dictionary = self.dictionaries[field]
+                missing = np.array([value is None or value == '' for value in dictionary], dtype=bool)
+                complete &= ~missing[self.codes[field]]
+                key_columns.append(self.codes[field].astype(np.int64))
+            else:
+                column = self.values[field]
+                complete &= ~np.isnat(column) if column.dtype.kind == 'M' else ~np.isnan(column)
+                key_columns.append(column.view(np.int64))
+        
+        skipped = int(len(self) - complete.sum())
+        if skipped:
+            logger.warning(f"Skipped {skipped} records without a complete {'/'.join(key_fields)} key")
+        
+        rows = np.flatnonzero(complete)
+        if len(rows) == 0:
+            return self.take(rows)
+        
+        # np.unique keeps the first occurrence, so search the rows back to front
+        keys = np.column_stack([column[rows] for column in key_columns])[::-1]
+        _, first_from_end = np.unique(keys, axis=0, return_index=True)
+        last = rows[::-1][first_from_end]
+        
+        return self.take(np.sort(last))
+    
+    def to_rows(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Build one dictionary per row, with None for missing values
+        
+        This is the format of process_aqi_record and of bulk INSERT parameters.
+        """
+        fields = tuple(fields or self.FIELDS)
+        columns = []
+        
+        for field in fields:
+            if field in self.codes:
+                columns.append(self.column(field).tolist())
+            elif field == 'last_update':
+                columns.append(self.values[field].astype(object).tolist())
+            else:
+                column = self.values[field].astype(object)
+                column[np.isnan(self.values[field])] = None
+                if field == 'aqi_value':
+                    column = [None if value is None else int(value) for value in column]
+                columns.append(list(column))
+        
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+    
+    def to_models(self):
+        """Build AQIData ORM objects, for callers that need them"""
+        from src.models.aqi_data import AQIData
+        
+        return [AQIData(**row) for row in self.to_rows()]
+
 class CPCBDataIngestion:
     """
     Data ingestion class for CPCB AQI data from data.gov.in API
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrency: int = 8, timeout: int = 30, archive=None,
+                 http_client: Optional[ResilientHTTPClient] = None):
+        """
+        Args:
+            api_key: data.gov.in API key
+            max_concurrency: Maximum number of parallel requests made by fetch_many
+            timeout: Per-request timeout in seconds
+            archive: Optional RawResponseArchive receiving every raw response
+            http_client: Shared rate-limited HTTP client (a private one is created if omitted)
+        """
         self.api_key = api_key
         self.base_url = "https://api.data.gov.in/resource/3b01bcb8-0b14-4abf-b6f2-c1bfd384ba69"
         self.headers = {
             'User-Agent': 'AirQualityApp/1.0'
         }
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.timestamp_parser = TimestampParser()
+        self.archive = archive
+        
+        # Requests go through one keep-alive session with a connection pool
+        # large enough for the concurrent fetch mode, rate limited and retried
+        self.http = http_client or ResilientHTTPClient(pool_maxsize=self.max_concurrency)
     
     def fetch_realtime_aqi(self, 
                           state: Optional[str] = None, 
@@ -47,10 +399,11 @@ class CPCBDataIngestion:
             params['filters[city]'] = city
             
         try:
-            response = requests.get(self.base_url, params=params, headers=self.headers, timeout=30)
+            response = self.http.get(self.base_url, params=params, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             
             data = response.json()
+            self._archive_response(data, params)
             
             if 'records' in data:
                 logger.info(f"Successfully fetched {len(data['records'])} AQI records")
@@ -66,6 +419,154 @@ class CPCBDataIngestion:
             logger.error(f"Error parsing JSON response: {e}")
             return []
     
+    def fetch_many(self,
+                   cities: Iterable[Union[str, Dict]],
+                   limit: int = 100,
+                   max_concurrency: Optional[int] = None) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Fetch real-time AQI data for several cities concurrently
+        
+        Requests run on a thread pool over the shared keep-alive session and
+        results are yielded as soon as each city finishes, not in input order.
+        
+        Args:
+            cities: City names, or dictionaries with 'city' and optional 'state' keys
+            limit: Maximum number of records to fetch per city
+            max_concurrency: Override for the number of parallel requests
+            
+        Yields:
+            Tuples of (city, list of AQI data records)
+        """
+        targets = []
+        for entry in cities:
+            if isinstance(entry, dict):
+                targets.append((entry.get('city'), entry.get('state')))
+            else:
+                targets.append((entry, None))
+        
+        if not targets:
+            return
+        
+        workers = min(max_concurrency or self.max_concurrency, len(targets))
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cpcb-fetch') as executor:
+            futures = {
+                executor.submit(self.fetch_realtime_aqi, state=state, city=city, limit=limit): city
+                for city, state in targets
+            }
+            for future in as_completed(futures):
+                city = futures[future]
+                try:
+                    records = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching CPCB data for {city}: {e}")
+                    records = []
+                yield city, records
+    
+    def iter_all_records(self,
+                         state: Optional[str] = None,
+                         city: Optional[str] = None,
+                         pollutant: Optional[str] = None,
+                         page_size: int = 1000,
+                         prefetch: bool = True) -> Iterator[Dict]:
+        """
+        Stream every record of the CPCB resource, page by page
+        
+        Walks the data.gov.in offset/limit pages until the resource is
+        exhausted. While the records of one page are being consumed the
+        next page is already being downloaded in the background, and only
+        one page is held in memory at a time.
+        
+        Args:
+            state: Filter by state name
+            city: Filter by city name
+            pollutant: Filter by pollutant type
+            page_size: Number of records requested per page
+            prefetch: Whether to download the next page in the background
+            
+        Yields:
+            Processed AQI records
+        """
+        filters = {}
+        if state:
+            filters['filters[state]'] = state
+        if city:
+            filters['filters[city]'] = city
+        if pollutant:
+            filters['filters[pollutant_id]'] = pollutant
+        
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cpcb-page') if prefetch else None
+        
+        def request_page(offset: int):
+            if executor:
+                return executor.submit(self._fetch_page, offset, page_size, filters)
+            return self._fetch_page(offset, page_size, filters)
+        
+        try:
+            offset = 0
+            pending = request_page(offset)
+            fetched = 0
+            
+            while pending is not None:
+                data = pending.result() if executor else pending
+                pending = None
+                
+                if data is None:
+                    logger.error(f"Stopping CPCB pagination at offset {offset} after {fetched} records")
+                    break
+                
+                records = data.get('records') or []
+                total = self._safe_int(data.get('total'))
+                fetched += len(records)
+                
+                # Request the next page before handing out this one. The API may
+                # cap pages below page_size, so a short page only ends the
+                # stream when the total is unknown.
+                if total is not None:
+                    has_more = bool(records) and offset + len(records) < total
+                else:
+                    has_more = len(records) >= page_size
+                if has_more:
+                    offset += len(records)
+                    pending = request_page(offset)
+                
+                for processed in self.process_aqi_records(records):
+                    yield processed
+            
+            logger.info(f"Streamed {fetched} CPCB records")
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _fetch_page(self, offset: int, limit: int, filters: Dict) -> Optional[Dict]:
+        """
+        Fetch a single page of the CPCB resource
+        
+        Returns:
+            Decoded API response, or None if the request failed
+        """
+        params = {
+            'api-key': self.api_key,
+            'format': 'json',
+            'offset': offset,
+            'limit': limit
+        }
+        params.update(filters)
+        
+        try:
+            response = self.http.get(self.base_url, params=params, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            
+            data = response.json()
+            self._archive_response(data, params)
+            return data
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching CPCB page at offset {offset}: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            logger.error(f"Error parsing JSON response at offset {offset}: {e}")
+            return None
+    
     def fetch_aqi_by_pollutant(self, pollutant: str, limit: int = 100) -> List[Dict]:
         """
         Fetch AQI data filtered by specific pollutant
@@ -85,10 +586,11 @@ class CPCBDataIngestion:
         }
         
         try:
-            response = requests.get(self.base_url, params=params, headers=self.headers, timeout=30)
+            response = self.http.get(self.base_url, params=params, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             
             data = response.json()
+            self._archive_response(data, params)
             
             if 'records' in data:
                 logger.info(f"Successfully fetched {len(data['records'])} records for {pollutant}")
@@ -104,6 +606,11 @@ class CPCBDataIngestion:
             logger.error(f"Error parsing JSON response for {pollutant}: {e}")
             return []
     
+    def _archive_response(self, data: Dict, params: Dict):
+        """Append a raw response to the archive, if one is configured"""
+        if self.archive is not None:
+            self.archive.append(CPCB_SOURCE, data, request=params)
+    
     def process_aqi_record(self, record: Dict) -> Dict:
         """
         Process and clean a single AQI record
@@ -114,7 +621,20 @@ class CPCBDataIngestion:
         Returns:
             Processed AQI record
         """
-        processed = {
+        processed = self._process_aqi_fields(record)
+        
+        # Calculate AQI category based on pollutant average
+        processed['aqi_value'] = self._calculate_aqi(
+            processed['pollutant_id'], 
+            processed['pollutant_avg']
+        )
+        processed['aqi_category'] = self._get_aqi_category(processed['aqi_value'])
+        
+        return processed
+    
+    def _process_aqi_fields(self, record: Dict) -> Dict:
+        """Clean the raw fields of an AQI record, without computing the AQI"""
+        return {
             'country': record.get('country', 'India'),
             'state': record.get('state', ''),
             'city': record.get('city', ''),
@@ -127,15 +647,35 @@ class CPCBDataIngestion:
             'pollutant_avg': self._safe_float(record.get('pollutant_avg')),
             'last_update': self._parse_datetime(record.get('last_update')),
         }
+    
+    def process_aqi_records(self, records: List[Dict]) -> List[Dict]:
+        """
+        Process and clean a batch of AQI records
         
-        # Calculate AQI category based on pollutant average
-        processed['aqi_value'] = self._calculate_aqi(
-            processed['pollutant_id'], 
-            processed['pollutant_avg']
-        )
-        processed['aqi_category'] = self._get_aqi_category(processed['aqi_value'])
+        Same output as process_aqi_record, computed through process_aqi_batch.
         
-        return processed
+        Args:
+            records: Raw AQI records from API
+            
+        Returns:
+            List of processed AQI records
+        """
+        return self.process_aqi_batch(records).to_rows()
+    
+    def process_aqi_batch(self, records: List[Dict]) -> AQIRecordBatch:
+        """
+        Process and clean AQI records into a columnar batch
+        
+        Parsing, AQI computation and bulk writes (see upsert_aqi_records)
+        work on the batch directly, without building a dictionary per record.
+        
+        Args:
+            records: Raw AQI records from API
+            
+        Returns:
+            Columnar batch of processed AQI records
+        """
+        return AQIRecordBatch.from_raw(records, self)
     
     def _safe_float(self, value) -> Optional[float]:
         """Safely convert value to float"""
@@ -146,28 +686,18 @@ class CPCBDataIngestion:
         except (ValueError, TypeError):
             return None
     
+    def _safe_int(self, value) -> Optional[int]:
+        """Safely convert value to int"""
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            return None
+    
     def _parse_datetime(self, date_str: str) -> Optional[datetime]:
         """Parse datetime string to datetime object"""
-        if not date_str:
-            return None
-        
-        # Try different datetime formats
-        formats = [
-            '%Y-%m-%d %H:%M:%S',
-            '%Y-%m-%dT%H:%M:%S',
-            '%Y-%m-%d',
-            '%d-%m-%Y %H:%M:%S',
-            '%d/%m/%Y %H:%M:%S'
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                continue
-        
-        logger.warning(f"Could not parse datetime: {date_str}")
-        return None
+        return self.timestamp_parser.parse(date_str)
     
     def _calculate_aqi(self, pollutant: str, concentration: Optional[float]) -> Optional[int]:
         """
@@ -177,28 +707,10 @@ class CPCBDataIngestion:
         if concentration is None:
             return None
         
-        # AQI breakpoints for different pollutants (Indian standards)
-        breakpoints = {
-            'PM2.5': [(0, 30, 0, 50), (30, 60, 51, 100), (60, 90, 101, 200), 
-                     (90, 120, 201, 300), (120, 250, 301, 400), (250, float('inf'), 401, 500)],
-            'PM10': [(0, 50, 0, 50), (50, 100, 51, 100), (100, 250, 101, 200), 
-                    (250, 350, 201, 300), (350, 430, 301, 400), (430, float('inf'), 401, 500)],
-            'NO2': [(0, 40, 0, 50), (40, 80, 51, 100), (80, 180, 101, 200), 
-                   (180, 280, 201, 300), (280, 400, 301, 400), (400, float('inf'), 401, 500)],
-            'SO2': [(0, 40, 0, 50), (40, 80, 51, 100), (80, 380, 101, 200), 
-                   (380, 800, 201, 300), (800, 1600, 301, 400), (1600, float('inf'), 401, 500)],
-            'CO': [(0, 1, 0, 50), (1, 2, 51, 100), (2, 10, 101, 200), 
-                  (10, 17, 201, 300), (17, 34, 301, 400), (34, float('inf'), 401, 500)],
-            'OZONE': [(0, 50, 0, 50), (50, 100, 51, 100), (100, 168, 101, 200), 
-                     (168, 208, 201, 300), (208, 748, 301, 400), (748, float('inf'), 401, 500)],
-            'NH3': [(0, 200, 0, 50), (200, 400, 51, 100), (400, 800, 101, 200), 
-                   (800, 1200, 201, 300), (1200, 1800, 301, 400), (1800, float('inf'), 401, 500)]
-        }
-        
-        if pollutant not in breakpoints:
+        if pollutant not in NAQI_BREAKPOINTS:
             return None
         
-        for c_low, c_high, aqi_low, aqi_high in breakpoints[pollutant]:
+        for c_low, c_high, aqi_low, aqi_high in NAQI_BREAKPOINTS[pollutant]:
             if c_low <= concentration <= c_high:
                 # Linear interpolation formula
                 aqi = ((aqi_high - aqi_low) / (c_high - c_low)) * (concentration - c_low) + aqi_low
@@ -134,8 +134,8 @@ class Dashboard {
 
     async loadMapData() {
         try {
-            // Get real-time AQI data for major cities
-            const response = await api.getRealTimeAQI({ limit: 50 });
+            // One precomputed record per station across the country
+            const response = await api.getMapSnapshot();
             
             if (response.success && response.data) {
                 // Add markers to map
@@ -105,13 +105,22 @@ class Historical {
             }
 
             // Load historical data from API
-            const response = await api.getHistoricalAQI({
+            const params = {
                 city: this.currentCity,
                 state: this.currentState,
                 start_date: this.dateRange.start,
-                end_date: this.dateRange.end,
-                limit: 1000
-            });
+                end_date: this.dateRange.end
+            };
+            const bucket = this.getBucket();
+            let response;
+            if (bucket) {
+                // One point per bucket and pollutant, aggregated on the server
+                params.bucket = bucket;
+                response = await api.getAggregatedAQI(params);
+            } else {
+                params.limit = 1000;
+                response = await api.getHistoricalAQI(params);
+            }
 
             if (response.success && response.data && response.data.length > 0) {
                 this.historicalData = response.data;
@@ -129,6 +138,16 @@ class Historical {
         }
     }
 
+    getBucket() {
+        // Longer ranges are read from the server's precomputed hour, day and month rollups
+        const days = (new Date(this.dateRange.end) - new Date(this.dateRange.start)) / (24 * 60 * 60 * 1000);
+
+        if (days > 366) return 'month';
+        if (days > 7) return 'day';
+        if (days > 2) return 'hour';
+        return null;
+    }
+
     displayHistoricalChart() {
         if (this.historicalData.length > 0) {
             createHistoricalChart('historicalChart', this.historicalData);
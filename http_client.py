@@ -0,0 +1,413 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # Only needed by the async request path
+    aiohttp = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size for the external APIs
+DEFAULT_HOST_LIMITS = {
+    'api.data.gov.in': (5.0, 10),
+    'api.openweathermap.org': (1.0, 60)  # Free tier allows 60 calls per minute
+}
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate to a single host
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """
+        Take a token, borrowing against future refills if none is left
+        
+        Returns:
+            Seconds the caller must wait before sending its request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+    
+    def pause(self, seconds: float):
+        """Hold back every request to this host for the given time"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    """
+    Per-host token buckets shared by all ingestion clients
+    """
+    
+    def __init__(self, host_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 default_limit: Tuple[float, int] = (10.0, 20)):
+        """
+        Args:
+            host_limits: Mapping of host name to (requests per second, burst size)
+            default_limit: Limit applied to hosts without an explicit entry
+        """
+        self.host_limits = dict(DEFAULT_HOST_LIMITS if host_limits is None else host_limits)
+        self.default_limit = default_limit
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                rate, capacity = self.host_limits.get(host, self.default_limit)
+                self._buckets[host] = TokenBucket(rate, capacity)
+            return self._buckets[host]
+    
+    def acquire(self, host: str) -> float:
+        """Block until a request to the host is allowed, returning the time waited"""
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    async def acquire_async(self, host: str) -> float:
+        """Wait without blocking the event loop until a request to the host is allowed"""
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+    
+    def pause(self, host: str, seconds: float):
+        self.bucket(host).pause(seconds)
+
+class RetryPolicy:
+    """
+    Retry policy with jittered exponential backoff and Retry-After support
+    """
+    
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)):
+        """
+        Args:
+            max_retries: Number of retries after the first attempt
+            backoff_base: Backoff ceiling of the first retry, in seconds
+            backoff_max: Upper limit of any single backoff, in seconds
+            retry_statuses: HTTP status codes that are retried
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+    
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Get the delay before the given retry
+        
+        Uses full jitter (a random delay up to the exponential ceiling), but
+        never less than what the server asked for in Retry-After.
+        """
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+    
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Parse a Retry-After header given in seconds or as an HTTP date"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker
+    
+    After failure_threshold consecutive failed calls the circuit opens and
+    calls to the host fail immediately. Once reset_timeout has passed one
+    trial call is let through: success closes the circuit, failure opens it
+    again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+    
+    def allow(self, host: str) -> bool:
+        """Check whether a call to the host may be sent now"""
+        with self._lock:
+            state = self._state(host)
+            if state['state'] == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if state['state'] == self.OPEN and now - state['opened_at'] >= self.reset_timeout:
+                state['state'] = self.HALF_OPEN
+                state['trial_in_flight'] = False
+            # A trial that never reported back (e.g. a cancelled task) expires too
+            if state['state'] == self.HALF_OPEN and (
+                    not state['trial_in_flight'] or now - state['trial_started_at'] >= self.reset_timeout):
+                state['trial_in_flight'] = True
+                state['trial_started_at'] = now
+                return True
+            return False
+    
+    def is_open(self, host: str) -> bool:
+        """Check whether calls to the host are currently being rejected"""
+        with self._lock:
+            state = self._state(host)
+            return state['state'] == self.OPEN and time.monotonic() - state['opened_at'] < self.reset_timeout
+    
+    def record_success(self, host: str):
+        with self._lock:
+            state = self._state(host)
+            state.update(state=self.CLOSED, failures=0, trial_in_flight=False)
+    
+    def record_failure(self, host: str):
+        with self._lock:
+            state = self._state(host)
+            state['failures'] += 1
+            state['trial_in_flight'] = False
+            if state['state'] == self.HALF_OPEN or state['failures'] >= self.failure_threshold:
+                if state['state'] != self.OPEN:
+                    logger.warning(f"Circuit for {host} opened after {state['failures']} failures")
+                state.update(state=self.OPEN, opened_at=time.monotonic())
+    
+    def states(self) -> Dict[str, str]:
+        with self._lock:
+            return {host: state['state'] for host, state in self._hosts.items()}
+    
+    def _state(self, host: str) -> Dict:
+        if host not in self._hosts:
+            self._hosts[host] = {
+                'state': self.CLOSED,
+                'failures': 0,
+                'opened_at': 0.0,
+                'trial_in_flight': False,
+                'trial_started_at': 0.0
+            }
+        return self._hosts[host]
+
+class ResilientHTTPClient:
+    """
+    HTTP client for the external APIs with rate limiting and retries
+    
+    Wraps a pooled keep-alive requests.Session. Every request first takes a
+    token from the per-host bucket, and throttled or failed requests are
+    retried according to the retry policy. A 429 response also pauses the
+    whole host for its Retry-After time, so concurrent callers back off
+    together. Calls that still fail after their retries trip the per-host
+    circuit breaker, which then rejects calls with CircuitOpenError.
+    """
+    
+    def __init__(self,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 pool_maxsize: int = 10,
+                 headers: Optional[Dict] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        self._counters = {
+            'requests': 0,
+            'throttled': 0,
+            'retried': 0,
+            'failed': 0,
+            'rejected': 0,
+            'rate_limit_wait_seconds': 0.0
+        }
+        self._counters_lock = threading.Lock()
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request, retrying throttled and failed attempts
+        
+        Returns:
+            The final response (callers still check its status)
+        
+        Raises:
+            CircuitOpenError: If the host's circuit is open
+            requests.exceptions.RequestException: If the last attempt could not connect
+        """
+        host = urlsplit(url).hostname or ''
+        attempt = 0
+        
+        # Retries belong to the same call, so only the first attempt is gated
+        self._check_circuit(host)
+        
+        while True:
+            self._count('rate_limit_wait_seconds', self.rate_limiter.acquire(host))
+            self._count('requests')
+            
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.retry_policy.max_retries:
+                    self._record_failure(host)
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                logger.warning(f"Request to {host} failed ({e}), retrying in {delay:.1f}s")
+            except requests.exceptions.RequestException:
+                self._record_failure(host)
+                raise
+            else:
+                if response.status_code not in self.retry_policy.retry_statuses:
+                    self.circuit_breaker.record_success(host)
+                    return response
+                
+                retry_after = self._handle_retryable_status(host, response.status_code,
+                                                            response.headers.get('Retry-After'))
+                if attempt >= self.retry_policy.max_retries:
+                    self._record_failure(host)
+                    return response
+                
+                delay = self.retry_policy.backoff(attempt, retry_after)
+                logger.warning(f"Request to {host} returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+            
+            self._count('retried')
+            attempt += 1
+            time.sleep(delay)
+    
+    async def get_json_async(self, session, url: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Send a GET request through an aiohttp session and decode its JSON body
+        
+        Uses the same rate limiter, retry policy and counters as get().
+        
+        Raises:
+            CircuitOpenError: If the host's circuit is open
+            aiohttp.ClientError: If the last attempt failed
+            asyncio.TimeoutError: If the last attempt timed out
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for async requests")
+        
+        host = urlsplit(url).hostname or ''
+        attempt = 0
+        
+        self._check_circuit(host)
+        
+        while True:
+            self._count('rate_limit_wait_seconds', await self.rate_limiter.acquire_async(host))
+            self._count('requests')
+            
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status not in self.retry_policy.retry_statuses:
+                        self.circuit_breaker.record_success(host)
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    
+                    retry_after = self._handle_retryable_status(host, response.status,
+                                                                response.headers.get('Retry-After'))
+                    if attempt >= self.retry_policy.max_retries:
+                        self._record_failure(host)
+                        response.raise_for_status()
+                    
+                    delay = self.retry_policy.backoff(attempt, retry_after)
+                    logger.warning(f"Request to {host} returned {response.status}, retrying in {delay:.1f}s")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retry_policy.max_retries:
+                    self._record_failure(host)
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                logger.warning(f"Request to {host} failed ({e!r}), retrying in {delay:.1f}s")
+            except aiohttp.ClientResponseError:
+                raise
+            except aiohttp.ClientError:
+                self._record_failure(host)
+                raise
+            
+            self._count('retried')
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict:
+        """Get request, throttling and retry counters"""
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['rate_limit_wait_seconds'] = round(stats['rate_limit_wait_seconds'], 3)
+        stats['circuits'] = self.circuit_breaker.states()
+        return stats
+    
+    def is_available(self, url: str) -> bool:
+        """Check whether the circuit of the URL's host currently lets calls through"""
+        return not self.circuit_breaker.is_open(urlsplit(url).hostname or '')
+    
+    def _check_circuit(self, host: str):
+        if not self.circuit_breaker.allow(host):
+            self._count('rejected')
+            raise CircuitOpenError(f"Circuit for {host} is open")
+    
+    def _record_failure(self, host: str):
+        self._count('failed')
+        self.circuit_breaker.record_failure(host)
+    
+    def _handle_retryable_status(self, host: str, status: int, retry_after_header: Optional[str]) -> Optional[float]:
+        retry_after = self.retry_policy.parse_retry_after(retry_after_header)
+        if status == 429:
+            self._count('throttled')
+            if retry_after:
+                self.rate_limiter.pause(host, retry_after)
+        return retry_after
+    
+    def _count(self, counter: str, amount: float = 1):
+        with self._counters_lock:
+            self._counters[counter] += amount
@@ -0,0 +1,255 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import logging
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.aqi_data import LatestAQI
+from src.models.aqi_repository import (
+    upsert_aqi_records, insert_weather_records, get_watermarks, advance_watermarks,
+    aqi_rollup_buckets, refresh_deferred_rollups
+)
+from src.data_ingestion.cpcb_ingestion import CPCBDataIngestion
+from src.data_ingestion.weather_ingestion import WeatherDataIngestion
+from src.models.compaction import compact_observations
+from src.models.parquet_archive import export_archive, parquet_available
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CPCB_SOURCE = 'cpcb'
+OPENWEATHER_SOURCE = 'openweather'
+PARQUET_EXPORT_JOB = 'parquet_export'
+COMPACTION_JOB = 'compaction'
+
+# Records requested per city, above the station x pollutant count of the largest city
+CPCB_CITY_LIMIT = int(os.getenv('INGESTION_CPCB_CITY_LIMIT', 2000))
+
+class IngestionScheduler:
+    """
+    Periodic CPCB and OpenWeatherMap collection outside the request path
+    
+    A run only writes records newer than those already stored. For CPCB
+    the high-water mark is the latest_aqi row of each station and
+    pollutant, as stations of a city report at different times. Weather
+    keeps one per-city high-water mark.
+    """
+    
+    def __init__(self,
+                 app,
+                 cpcb_ingestion: CPCBDataIngestion,
+                 weather_ingestion: WeatherDataIngestion,
+                 cities: Optional[List[Dict]] = None,
+                 cpcb_interval: int = 900,
+                 weather_interval: int = 1800,
+                 export_interval: int = 86400,
+                 compaction_interval: int = 86400):
+        """
+        Initialize the scheduler
+        
+        Args:
+            app: Flask application providing the database configuration
+            cpcb_ingestion: CPCB ingestion client
+            weather_ingestion: Weather ingestion client
+            cities: City dictionaries with 'city' and 'state' keys (defaults to major cities)
+            cpcb_interval: Seconds between CPCB runs (0 disables the job)
+            weather_interval: Seconds between OpenWeatherMap runs (0 disables the job)
+            export_interval: Seconds between Parquet archive exports (0 disables the job)
+            compaction_interval: Seconds between retention compaction runs (0 disables the job)
+        """
+        self.app = app
+        self.cpcb_ingestion = cpcb_ingestion
+        self.weather_ingestion = weather_ingestion
+        self.cities = cities or weather_ingestion.get_major_indian_cities()
+        self.jobs = []
+        self._stop_event = threading.Event()
+        
+        if cpcb_interval > 0:
+            self.jobs.append({'name': CPCB_SOURCE, 'interval': cpcb_interval, 'run': self.run_cpcb_once})
+        if weather_interval > 0:
+            self.jobs.append({'name': OPENWEATHER_SOURCE, 'interval': weather_interval, 'run': self.run_weather_once})
+        # Exports run before compaction, so raw rows reach the archive before they are deleted
+        if export_interval > 0:
+            if parquet_available():
+                self.jobs.append({'name': PARQUET_EXPORT_JOB, 'interval': export_interval, 'run': self.run_export_once})
+            else:
+                logger.warning("pyarrow is not installed, the Parquet export job is disabled")
+        if compaction_interval > 0:
+            self.jobs.append({'name': COMPACTION_JOB, 'interval': compaction_interval, 'run': self.run_compaction_once})
+    
+    def run_cpcb_once(self) -> Dict:
+        """
+        Collect CPCB AQI data for all cities and store the new records
+        
+        Returns:
+            Dictionary with run statistics
+        """
+        stored = 0
+        skipped = 0
+        touched = set()
+        
+        with self.app.app_context():
+            for city, raw_records in self.cpcb_ingestion.fetch_many(self.cities, limit=CPCB_CITY_LIMIT):
+                if len(raw_records) >= CPCB_CITY_LIMIT:
+                    logger.warning(f"CPCB returned {len(raw_records)} records for {city}, the response may be "
+                                   f"truncated (raise INGESTION_CPCB_CITY_LIMIT)")
+                
+                batch = self.cpcb_ingestion.process_aqi_batch(raw_records)
+                last_updates = batch.column('last_update')
+                stored_until = _stored_until(batch)
+                
+                # NaT never compares greater, so rows without a timestamp are dropped too
+                new_records = batch.take(np.where(
+                    np.isnat(stored_until),
+                    ~np.isnat(last_updates),
+                    last_updates > stored_until
+                ))
+                skipped += len(batch) - len(new_records)
+                
+                if not len(new_records):
+                    continue
+                
+                try:
+                    stored += upsert_aqi_records(new_records, update_rollups=False)
+                    db.session.commit()
+                    touched |= aqi_rollup_buckets(new_records)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error storing CPCB data for {city}: {e}")
+            
+            # Once for all cities, after their rows are committed
+            refresh_deferred_rollups(touched)
+        
+        logger.info(f"CPCB run stored {stored} new records, skipped {skipped} already stored")
+        return {'source': CPCB_SOURCE, 'stored': stored, 'skipped': skipped}
+    
+    def run_weather_once(self) -> Dict:
+        """
+        Collect current weather for all cities and store the new records
+        
+        Returns:
+            Dictionary with run statistics
+        """
+        records = self.weather_ingestion.collect_current_weather(self.cities)
+        
+        with self.app.app_context():
+            watermarks = get_watermarks(OPENWEATHER_SOURCE)
+            new_records = [
+                record for record in records
+                if _is_newer(record.get('recorded_at'), watermarks.get(record['city']))
+            ]
+            
+            marks = {}
+            for record in new_records:
+                city = record['city']
+                marks[city] = max(marks.get(city, record['recorded_at']), record['recorded_at'])
+            
+            try:
+                stored = insert_weather_records(new_records)
+                advance_watermarks(OPENWEATHER_SOURCE, marks)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error storing weather data: {e}")
+                stored = 0
+        
+        logger.info(f"Weather run stored {stored} new records")
+        return {'source': OPENWEATHER_SOURCE, 'stored': stored, 'skipped': len(records) - len(new_records)}
+    
+    def run_export_once(self) -> Dict:
+        """
+        Export the days completed since the last run to the Parquet archive
+        
+        Returns:
+            Dictionary with the rows exported per dataset
+        """
+        with self.app.app_context():
+            return export_archive()
+    
+    def run_compaction_once(self) -> Dict:
+        """
+        Apply the retention tiers to the observation tables
+        
+        Returns:
+            Dictionary with the rows reclaimed per table (see compact_observations)
+        """
+        with self.app.app_context():
+            return compact_observations()
+    
+    def run_forever(self):
+        """Run every job on its interval until stop() is called"""
+        logger.info(f"Starting ingestion scheduler with jobs: {[job['name'] for job in self.jobs]}")
+        
+        next_runs = {job['name']: time.monotonic() for job in self.jobs}
+        
+        while self.jobs and not self._stop_event.is_set():
+            for job in self.jobs:
+                if time.monotonic() >= next_runs[job['name']]:
+                    self._run_job(job['name'], job['run'])
+                    next_runs[job['name']] = time.monotonic() + job['interval']
+            
+            self._stop_event.wait(max(0, min(next_runs.values()) - time.monotonic()))
+        
+        logger.info("Ingestion scheduler stopped")
+    
+    def stop(self):
+        """Ask run_forever to return after the job in progress"""
+        self._stop_event.set()
+    
+    def _run_job(self, name: str, run: Callable[[], Dict]):
+        started = time.monotonic()
+        try:
+            result = run()
+            logger.info(f"Ingestion job {name} finished in {time.monotonic() - started:.1f}s: {result}")
+        except Exception as e:
+            logger.error(f"Ingestion job {name} failed: {e}")
+
+def _stored_until(batch) -> np.ndarray:
+    """Latest stored observation time of every row's station and pollutant, NaT if none"""
+    stations = batch.column('station')
+    pollutants = batch.column('pollutant_id')
+    
+    latest = {}
+    distinct = sorted(set(stations.tolist()))
+    for start in range(0, len(distinct), 500):
+        latest.update({
+            (station, pollutant_id): last_update
+            for station, pollutant_id, last_update in db.session.query(
+                LatestAQI.station, LatestAQI.pollutant_id, LatestAQI.last_update
+            ).filter(LatestAQI.station.in_(distinct[start:start + 500]))
+        })
+    
+    return np.array(
+        [latest.get(key) for key in zip(stations.tolist(), pollutants.tolist())],
+        dtype='datetime64[us]'
+    )
+
+def _is_newer(timestamp: Optional[datetime], high_water_mark: Optional[datetime]) -> bool:
+    return timestamp is not None and (high_water_mark is None or timestamp > high_water_mark)
+
+if __name__ == "__main__":
+    from src.main import app
+    from src.routes.aqi_routes import cpcb_ingestion, weather_ingestion
+    
+    scheduler = IngestionScheduler(
+        app,
+        cpcb_ingestion,
+        weather_ingestion,
+        cpcb_interval=int(os.getenv('INGESTION_CPCB_INTERVAL', 900)),
+        weather_interval=int(os.getenv('INGESTION_WEATHER_INTERVAL', 1800)),
+        export_interval=int(os.getenv('INGESTION_EXPORT_INTERVAL', 86400)),
+        compaction_interval=int(os.getenv('INGESTION_COMPACTION_INTERVAL', 86400))
+    )
+    
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
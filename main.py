@@ -6,12 +6,17 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
+from src.models.aqi_repository import SCHEMA_VERSION, schema_version
+from src.models.storage import init_database
 from src.routes.user import user_bp
 from src.routes.aqi_routes import aqi_bp
 from src.routes.ml_routes import ml_bp
+from src.routes.serialization import FastJSONProvider
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+# orjson when installed, for every jsonify() response
+app.json = FastJSONProvider(app)
 
 # Enable CORS for all routes
 CORS(app)
@@ -20,12 +25,12 @@ app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(aqi_bp, url_prefix='/api')
 app.register_blueprint(ml_bp, url_prefix='/api')
 
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+# SQLite by default, PostgreSQL with DB_TYPE=postgresql (see src/models/storage.py)
+init_database(app, db, os.path.join(os.path.dirname(__file__), 'database', 'app.db'))
+# Tables are created and upgraded by `python -m src.models.aqi_repository migrate`, not on start
 with app.app_context():
-    db.create_all()
+    if (schema_version() or 0) < SCHEMA_VERSION:
+        app.logger.warning("Database schema is outdated, run: python -m src.models.aqi_repository migrate")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
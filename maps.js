@@ -146,17 +146,21 @@ function addAQIMarkers(aqiData) {
             <div class="map-popup">
                 <div class="popup-header">
                     <h4>${station.city || 'Unknown'}, ${station.state || 'Unknown'}</h4>
-                    <span class="popup-station">${station.station_name || 'Station'}</span>
+                    <span class="popup-station">${station.station || 'Station'}</span>
                 </div>
                 <div class="popup-aqi">
                     <span class="aqi-value" style="color: ${color};">${aqi}</span>
                     <span class="aqi-category">${category}</span>
                 </div>
                 <div class="popup-details">
-                    ${station.pm25 ? `<div>PM2.5: ${station.pm25} μg/m³</div>` : ''}
-                    ${station.pm10 ? `<div>PM10: ${station.pm10} μg/m³</div>` : ''}
-                    ${station.no2 ? `<div>NO₂: ${station.no2} μg/m³</div>` : ''}
-                    ${station.so2 ? `<div>SO₂: ${station.so2} μg/m³</div>` : ''}
+                    ${Object.entries(station.concentrations || {})
+                        .filter(([, value]) => value !== null)
+                        .map(([pollutant, value]) => {
+                            const subIndex = (station.sub_indices || {})[pollutant];
+                            const dominant = pollutant === station.dominant_pollutant ? ' <strong>(dominant)</strong>' : '';
+                            return `<div>${pollutant}: ${value} μg/m³${subIndex != null ? ` · AQI ${subIndex}` : ''}${dominant}</div>`;
+                        })
+                        .join('')}
                 </div>
                 <div class="popup-time">
                     Updated: ${formatTimestamp(station.last_update)}
@@ -374,10 +378,11 @@ function updateDashboardWithStation(station) {
     const no2Value = document.getElementById('no2Value');
     const so2Value = document.getElementById('so2Value');
 
-    if (pm25Value) pm25Value.textContent = station.pm25 || '--';
-    if (pm10Value) pm10Value.textContent = station.pm10 || '--';
-    if (no2Value) no2Value.textContent = station.no2 || '--';
-    if (so2Value) so2Value.textContent = station.so2 || '--';
+    const concentrations = station.concentrations || {};
+    if (pm25Value) pm25Value.textContent = concentrations['PM2.5'] ?? '--';
+    if (pm10Value) pm10Value.textContent = concentrations['PM10'] ?? '--';
+    if (no2Value) no2Value.textContent = concentrations['NO2'] ?? '--';
+    if (so2Value) so2Value.textContent = concentrations['SO2'] ?? '--';
 
     // Show success message
     showSuccess(`Selected ${station.city}, ${station.state}`);
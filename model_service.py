@@ -3,14 +3,18 @@ import sys
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import logging
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from src.models.user import db
-from src.models.aqi_data import AQIData, WeatherData, AQIForecast
+from src.models.aqi_data import AQIData, WeatherData, Location, normalize_location_key
+from src.models.aqi_repository import upsert_forecasts
+from src.models.parquet_archive import (
+    AQI_DATASET, WEATHER_DATASET, parquet_available, archived_until, read_archive, read_recent
+)
 from src.ml_models.aqi_forecasting import AQIForecastingModel
 from src.data_ingestion.weather_ingestion import WeatherDataIngestion
 
@@ -18,6 +22,12 @@ from src.data_ingestion.weather_ingestion import WeatherDataIngestion
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns read by AQIForecastingModel.prepare_features
+AQI_FEATURE_COLUMNS = ['city', 'state', 'latitude', 'longitude', 'pollutant_avg', 'aqi_value', 'last_update']
+WEATHER_FEATURE_COLUMNS = [
+    'city', 'state', 'temperature', 'humidity', 'wind_speed', 'wind_direction', 'pressure', 'visibility', 'recorded_at'
+]
+
 class AQIModelService:
     """
     Service class for AQI forecasting model inference and management
@@ -51,26 +61,21 @@ class AQIModelService:
             logger.error(f"Error loading existing model: {e}")
             self.is_model_loaded = False
     
-    def train_model_with_database_data(self, min_data_points: int = 100) -> Dict:
+    def train_model_with_database_data(self, min_data_points: int = 100, start: Optional[datetime] = None) -> Dict:
         """
         Train the model using data from the database
         
         Args:
             min_data_points: Minimum number of data points required for training
-            
+            start: Only train on observations from this time on (defaults to all history)
+        
         Returns:
             Dictionary with training results
         """
         logger.info("Training model with database data")
         
         try:
-            # Fetch AQI data from database
-            aqi_query = db.session.query(AQIData).all()
-            aqi_data = pd.DataFrame([record.to_dict() for record in aqi_query])
-            
-            # Fetch weather data from database
-            weather_query = db.session.query(WeatherData).all()
-            weather_data = pd.DataFrame([record.to_dict() for record in weather_query])
+            aqi_data, weather_data = self.load_training_data(start)
             
             if len(aqi_data) < min_data_points or len(weather_data) < min_data_points:
                 logger.warning(f"Insufficient data for training. AQI: {len(aqi_data)}, Weather: {len(weather_data)}")
@@ -110,7 +115,7 @@ class AQIModelService:
                 'training_records': len(X),
                 'feature_count': X.shape[1] if len(X.shape) > 1 else 0
             }
-            
+        
         except Exception as e:
             logger.error(f"Error training model: {e}")
             return {
@@ -118,6 +123,36 @@ class AQIModelService:
                 'error': str(e)
             }
     
+    def load_training_data(self, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Load the AQI and weather observations used for training
+        
+        Days already exported to the Parquet archive are read from it, with
+        only the feature columns and the requested days decoded. Newer days
+        are read from the database. Without pyarrow, everything is read
+        from the database.
+        
+        Args:
+            start: Only observations from this time on
+            end: Only observations before this time
+        
+        Returns:
+            Tuple of (AQI DataFrame, weather DataFrame)
+        """
+        frames = []
+        for dataset, columns in ((AQI_DATASET, AQI_FEATURE_COLUMNS), (WEATHER_DATASET, WEATHER_FEATURE_COLUMNS)):
+            boundary = archived_until(dataset) if parquet_available() else None
+            if boundary is not None and (start is None or start < boundary):
+                archived = read_archive(dataset, columns, start, min(end, boundary) if end else boundary)
+                recent = read_recent(dataset, columns, max(start, boundary) if start else boundary, end)
+                frames.append(pd.concat([archived, recent], ignore_index=True))
+            else:
+                frames.append(read_recent(dataset, columns, start, end))
+        
+        logger.info(f"Loaded {len(frames[0])} AQI and {len(frames[1])} weather rows for training")
+        return frames[0], frames[1]
+    
     def generate_forecasts_for_cities(self, cities: List[Dict], forecast_days: int = 3) -> Dict:
         """
         Generate AQI forecasts for specified cities
@@ -125,7 +160,7 @@ class AQIModelService:
         Args:
             cities: List of city dictionaries with 'city' and 'state' keys
             forecast_days: Number of days to forecast
-            
+        
         Returns:
             Dictionary with forecast results
         """
@@ -141,64 +176,50 @@ class AQIModelService:
         errors = []
         
         try:
+            # Recent data of all cities is read in two queries and the
+            # forecasts are written in one bulk upsert, so the number of
+            # round trips does not grow with the number of cities or days
+            features_by_city = self._get_recent_features_for_cities(cities)
+            forecast_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            forecasts = []
+            
             for city_info in cities:
                 city = city_info['city']
                 state = city_info['state']
                 
                 try:
-                    # Get recent AQI and weather data for the city
-                    recent_features = self._get_recent_features_for_city(city, state)
+                    recent_features = features_by_city.get((normalize_location_key(city), normalize_location_key(state)))
                     
                     if recent_features is None:
                         errors.append(f"No recent data available for {city}, {state}")
                         continue
                     
+                    # Make prediction
+                    prediction = int(self.model.predict(recent_features.reshape(1, -1))[0])
+                    
+                    # Determine AQI category
+                    aqi_category = self._get_aqi_category(prediction)
+                    
                     # Generate forecasts for each day
                     for day in range(1, forecast_days + 1):
-                        forecast_date = datetime.utcnow() + timedelta(days=day)
-                        
-                        # Make prediction
-                        prediction = self.model.predict(recent_features.reshape(1, -1))[0]
-                        
-                        # Determine AQI category
-                        aqi_category = self._get_aqi_category(int(prediction))
-                        
-                        # Create forecast record
-                        forecast = AQIForecast(
-                            city=city,
-                            state=state,
-                            latitude=city_info.get('latitude'),
-                            longitude=city_info.get('longitude'),
-                            forecast_date=forecast_date,
-                            predicted_aqi=int(prediction),
-                            predicted_category=aqi_category,
-                            confidence_score=0.8,  # Placeholder confidence score
-                            model_version=self.model.model_version
-                        )
-                        
-                        # Check if forecast already exists for this date
-                        existing_forecast = db.session.query(AQIForecast).filter_by(
-                            city=city,
-                            state=state,
-                            forecast_date=forecast_date.date()
-                        ).first()
-                        
-                        if existing_forecast:
-                            # Update existing forecast
-                            existing_forecast.predicted_aqi = int(prediction)
-                            existing_forecast.predicted_category = aqi_category
-                            existing_forecast.confidence_score = 0.8
-                            existing_forecast.model_version = self.model.model_version
-                        else:
-                            # Add new forecast
-                            db.session.add(forecast)
-                        
-                        forecasts_created += 1
+                        forecasts.append({
+                            'city': city,
+                            'state': state,
+                            'latitude': city_info.get('latitude'),
+                            'longitude': city_info.get('longitude'),
+                            'forecast_date': forecast_start + timedelta(days=day),
+                            'predicted_aqi': prediction,
+                            'predicted_category': aqi_category,
+                            'confidence_score': 0.8,  # Placeholder confidence score
+                            'model_version': self.model.model_version
+                        })
                 
                 except Exception as e:
                     errors.append(f"Error generating forecast for {city}, {state}: {str(e)}")
                     logger.error(f"Error generating forecast for {city}, {state}: {e}")
             
+            forecasts_created = upsert_forecasts(forecasts)
+            
             # Commit all forecasts
             db.session.commit()
             
@@ -209,7 +230,7 @@ class AQIModelService:
                 'cities_processed': len(cities),
                 'errors': errors
             }
-            
+        
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error in forecast generation: {e}")
@@ -227,55 +248,94 @@ class AQIModelService:
         Args:
             city: City name
             state: State name
-            
+        
         Returns:
             Feature array or None if insufficient data
         """
+        features = self._get_recent_features_for_cities([{'city': city, 'state': state}])
+        return features.get((normalize_location_key(city), normalize_location_key(state)))
+    
+    def _get_recent_features_for_cities(self, cities: List[Dict]) -> Dict[tuple, np.ndarray]:
+        """
+        Get recent feature data for several cities with one query per table
+        
+        Args:
+            cities: List of city dictionaries with 'city' and 'state' keys
+        
+        Returns:
+            Dictionary mapping (city_key, state_key) to the feature array of
+            every city with enough data
+        """
+        keys = {(normalize_location_key(city_info['city']), normalize_location_key(city_info['state'])) for city_info in cities}
+        city_keys = sorted({city_key for city_key, _ in keys})
+        state_keys = sorted({state_key for _, state_key in keys})
+        
         try:
-            # Get recent AQI data (last 30 days)
+            # Get recent AQI and weather data (last 30 days)
             cutoff_date = datetime.utcnow() - timedelta(days=30)
             
+            aqi_by_city = {}
             aqi_query = db.session.query(AQIData).filter(
-                AQIData.city.ilike(f'%{city}%'),
-                AQIData.state.ilike(f'%{state}%'),
+                AQIData.city_key.in_(city_keys),
+                AQIData.state_key.in_(state_keys),
                 AQIData.last_update >= cutoff_date
-            ).all()
+            )
+            for record in aqi_query:
+                aqi_by_city.setdefault((record.city_key, record.state_key), []).append(record.to_dict())
             
+            weather_by_city = {}
             weather_query = db.session.query(WeatherData).filter(
-                WeatherData.city.ilike(f'%{city}%'),
-                WeatherData.state.ilike(f'%{state}%'),
+                WeatherData.location_id.in_(
+                    db.select(Location.id).where(Location.city_key.in_(city_keys), Location.state_key.in_(state_keys))
+                ),
                 WeatherData.recorded_at >= cutoff_date
-            ).all()
-            
-            if not aqi_query or not weather_query:
-                return None
-            
-            # Convert to DataFrames
-            aqi_data = pd.DataFrame([record.to_dict() for record in aqi_query])
-            weather_data = pd.DataFrame([record.to_dict() for record in weather_query])
-            
-            # Prepare features
-            features_df = self.model.prepare_features(aqi_data, weather_data)
-            
-            if len(features_df) == 0:
-                return None
-            
-            # Get the most recent feature row
-            features_df = features_df.sort_values('date').tail(1)
-            
-            # Extract feature columns in the same order as training
-            feature_values = []
-            for col in self.model.feature_columns:
-                if col in features_df.columns:
-                    feature_values.append(features_df[col].iloc[0])
-                else:
-                    feature_values.append(0)  # Default value for missing features
-            
-            return np.array(feature_values)
-            
+            )
+            for record in weather_query:
+                key = (record.location.city_key, record.location.state_key)
+                weather_by_city.setdefault(key, []).append(record.to_dict())
         except Exception as e:
-            logger.error(f"Error getting recent features for {city}, {state}: {e}")
+            logger.error(f"Error getting recent features: {e}")
+            return {}
+        
+        features = {}
+        for key in keys:
+            if key not in aqi_by_city or key not in weather_by_city:
+                continue
+            
+            try:
+                feature_values = self._latest_feature_values(
+                    pd.DataFrame(aqi_by_city[key]),
+                    pd.DataFrame(weather_by_city[key])
+                )
+            except Exception as e:
+                logger.error(f"Error getting recent features for {key[0]}, {key[1]}: {e}")
+                continue
+            
+            if feature_values is not None:
+                features[key] = feature_values
+        
+        return features
+    
+    def _latest_feature_values(self, aqi_data: pd.DataFrame, weather_data: pd.DataFrame) -> Optional[np.ndarray]:
+        """Build the feature array of the most recent observations of one city"""
+        # Prepare features
+        features_df = self.model.prepare_features(aqi_data, weather_data)
+        
+        if len(features_df) == 0:
             return None
+        
+        # Get the most recent feature row
+        features_df = features_df.sort_values('date').tail(1)
+        
+        # Extract feature columns in the same order as training
+        feature_values = []
+        for col in self.model.feature_columns:
+            if col in features_df.columns:
+                feature_values.append(features_df[col].iloc[0])
+            else:
+                feature_values.append(0)  # Default value for missing features
+        
+        return np.array(feature_values)
     
     def _get_aqi_category(self, aqi_value: int) -> str:
         """Get AQI category based on AQI value"""
@@ -339,7 +399,7 @@ class AQIModelService:
                 'feature_count': X.shape[1] if len(X.shape) > 1 else 0,
                 'data_source': 'sample_data'
             }
-            
+        
         except Exception as e:
             logger.error(f"Error retraining model with sample data: {e}")
             return {
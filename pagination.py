@@ -0,0 +1,77 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, or_
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Encode a (timestamp, id) position as an opaque URL-safe cursor"""
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def paginate_keyset(query,
+                    time_column,
+                    id_column,
+                    limit: int,
+                    cursor: Optional[str] = None,
+                    descending: bool = True) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page of a query ordered by (time_column, id_column)
+    
+    The cursor is the position of the last row of the previous page, and
+    the next page starts strictly after it. Every page is an index range
+    scan, so deep pages cost the same as the first one, and rows inserted
+    while paging do not shift the pages.
+    
+    Args:
+        query: Filtered query, without ORDER BY or LIMIT
+        time_column: Timestamp column of the sort key
+        id_column: Primary key column breaking ties between equal timestamps
+        limit: Maximum number of rows per page
+        cursor: Cursor returned with the previous page, None for the first page
+        descending: Newest first (True) or oldest first (False)
+    
+    Returns:
+        Tuple of (rows of this page, cursor of the next page or None on the last page)
+    
+    Raises:
+        ValueError: If the cursor is malformed or limit is below 1
+    """
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(time_column < timestamp, and_(time_column == timestamp, id_column < row_id)))
+        else:
+            query = query.filter(or_(time_column > timestamp, and_(time_column == timestamp, id_column > row_id)))
+    
+    if descending:
+        query = query.order_by(time_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(time_column.asc(), id_column.asc())
+    
+    # One extra row tells whether another page follows
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
@@ -0,0 +1,269 @@
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+import logging
+import pandas as pd
+from sqlalchemy import func, select
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed by the Parquet archive
+    pa = None
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.aqi_data import AQIData, WeatherData, Location, CodedString
+from src.models.aqi_repository import get_watermarks, advance_watermarks
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARQUET_ARCHIVE_DIR = os.getenv(
+    'PARQUET_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'parquet')
+)
+
+AQI_DATASET = 'aqi_data'
+WEATHER_DATASET = 'weather_data'
+
+# Days are exported once they are this many days old, so late upserts still land in the database only
+EXPORT_LAG_DAYS = 1
+
+# Archived columns of every dataset, as (name, SQL expression)
+DATASET_COLUMNS = {
+    AQI_DATASET: [
+        ('country', AQIData.country),
+        ('state', AQIData.state),
+        ('city', AQIData.city),
+        ('station', AQIData.station),
+        ('latitude', AQIData.latitude),
+        ('longitude', AQIData.longitude),
+        ('pollutant_id', AQIData.pollutant_id),
+        ('pollutant_min', AQIData.pollutant_min),
+        ('pollutant_max', AQIData.pollutant_max),
+        ('pollutant_avg', AQIData.pollutant_avg),
+        ('aqi_value', AQIData.aqi_value),
+        ('aqi_category', AQIData.aqi_category),
+        ('last_update', AQIData.last_update)
+    ],
+    WEATHER_DATASET: [
+        ('city', Location.city),
+        ('state', Location.state),
+        ('latitude', Location.latitude),
+        ('longitude', Location.longitude),
+        ('temperature', WeatherData.temperature),
+        ('humidity', WeatherData.humidity),
+        ('wind_speed', WeatherData.wind_speed),
+        ('wind_direction', WeatherData.wind_direction),
+        ('pressure', WeatherData.pressure),
+        ('visibility', WeatherData.visibility),
+        ('recorded_at', WeatherData.recorded_at)
+    ]
+}
+
+TIME_COLUMNS = {AQI_DATASET: 'last_update', WEATHER_DATASET: 'recorded_at'}
+
+def parquet_available() -> bool:
+    """Whether pyarrow is installed"""
+    return pa is not None
+
+def export_archive(start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   datasets: Sequence[str] = (AQI_DATASET, WEATHER_DATASET),
+                   root_dir: str = PARQUET_ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Export complete days of observations into date-partitioned Parquet files
+    
+    Every day is written to <root_dir>/<dataset>/date=YYYY-MM-DD/part-0.parquet,
+    replacing an earlier export of that day. Without a start, each dataset
+    continues after the last day exported, so periodic runs only write the
+    new days. Run it more often than the compaction job, which deletes raw
+    rows after the retention period.
+    
+    Must be called inside a Flask application context.
+    
+    Args:
+        start: First day to export (defaults to the day after the last export)
+        end: Day to stop before (defaults to EXPORT_LAG_DAYS before today)
+        datasets: Datasets to export
+        root_dir: Archive directory
+    
+    Returns:
+        Dictionary mapping dataset to the number of rows exported
+    """
+    _require_pyarrow()
+    end = _day(end or datetime.utcnow() - timedelta(days=EXPORT_LAG_DAYS))
+    stats = {}
+    
+    for dataset in datasets:
+        time_column = dict(DATASET_COLUMNS[dataset])[TIME_COLUMNS[dataset]]
+        day = _day(start) if start else archived_until(dataset)
+        if day is None:
+            oldest = db.session.query(func.min(time_column)).scalar()
+            day = _day(oldest) if oldest else end
+        
+        exported = 0
+        while day < end:
+            exported += _export_day(dataset, time_column, day, root_dir)
+            day += timedelta(days=1)
+            advance_watermarks(_watermark_source(dataset), {'*': day})
+            db.session.commit()
+        
+        stats[dataset] = exported
+        logger.info(f"Exported {exported} {dataset} rows to {root_dir}")
+    
+    return stats
+
+def archived_until(dataset: str) -> Optional[datetime]:
+    """Get the start of the first day not exported yet, None if nothing was exported"""
+    return get_watermarks(_watermark_source(dataset)).get('*')
+
+def read_archive(dataset: str,
+                 columns: Optional[List[str]] = None,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 filters: Optional[List] = None,
+                 root_dir: str = PARQUET_ARCHIVE_DIR) -> pd.DataFrame:
+    """
+    Read archived observations into a DataFrame
+    
+    Only the requested columns are decoded. The time range prunes whole
+    day partitions and, with any extra filters, skips row groups whose
+    statistics rule them out. Files are memory-mapped instead of copied
+    into buffers.
+    
+    Args:
+        dataset: aqi_data or weather_data
+        columns: Columns to load (defaults to all)
+        start: Only rows observed at or after this time
+        end: Only rows observed before this time
+        filters: Extra pyarrow filters, e.g. [('city', 'in', ['Delhi'])]
+        root_dir: Archive directory
+    
+    Returns:
+        DataFrame with one row per archived observation
+    """
+    _require_pyarrow()
+    time_column = TIME_COLUMNS[dataset]
+    names = columns or [name for name, _ in DATASET_COLUMNS[dataset]]
+    
+    path = os.path.join(root_dir, dataset)
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=names)
+    
+    predicates = list(filters or [])
+    if start:
+        predicates += [('date', '>=', start.date()), (time_column, '>=', start)]
+    if end:
+        predicates += [('date', '<=', end.date()), (time_column, '<', end)]
+    
+    table = pq.read_table(
+        path,
+        columns=names,
+        filters=predicates or None,
+        memory_map=True,
+        partitioning=ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+    )
+    return table.to_pandas()
+
+def read_recent(dataset: str,
+                columns: Optional[List[str]] = None,
+                start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Read observations from the database into a DataFrame with the archive's columns
+    
+    Rows are selected as plain tuples, without building ORM objects.
+    """
+    definitions = dict(DATASET_COLUMNS[dataset])
+    names = columns or list(definitions)
+    time_column = definitions[TIME_COLUMNS[dataset]]
+    
+    query = _select(dataset, [definitions[name] for name in names])
+    if start:
+        query = query.where(time_column >= start)
+    if end:
+        query = query.where(time_column < end)
+    
+    return pd.DataFrame(db.session.execute(query).all(), columns=names)
+
+def _export_day(dataset: str, time_column, day: datetime, root_dir: str) -> int:
+    """Write one day of a dataset, replacing an earlier export of it"""
+    columns = DATASET_COLUMNS[dataset]
+    query = _select(dataset, [column for _, column in columns]).where(
+        time_column >= day,
+        time_column < day + timedelta(days=1)
+    )
+    rows = db.session.execute(query).all()
+    
+    directory = os.path.join(root_dir, dataset, f'date={day.date().isoformat()}')
+    path = os.path.join(directory, 'part-0.parquet')
+    if not rows:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    
+    values = list(zip(*rows))
+    table = pa.table(
+        [pa.array(values[index], type=_arrow_type(column)) for index, (_, column) in enumerate(columns)],
+        names=[name for name, _ in columns]
+    )
+    
+    # Written under a hidden name first, so readers never see a partial file
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f'.part-0.parquet.{os.getpid()}.tmp')
+    pq.write_table(table, temp_path, compression='zstd', use_dictionary=True)
+    os.replace(temp_path, path)
+    
+    return len(rows)
+
+def _select(dataset: str, columns: List):
+    query = select(*columns)
+    if dataset == WEATHER_DATASET:
+        query = query.select_from(WeatherData).join(Location, WeatherData.location_id == Location.id)
+    return query
+
+def _arrow_type(column):
+    if isinstance(column.type, (CodedString, db.String)):
+        return pa.string()
+    if isinstance(column.type, db.DateTime):
+        return pa.timestamp('us')
+    if isinstance(column.type, db.Integer):
+        return pa.int32()
+    return pa.float64()
+
+def _watermark_source(dataset: str) -> str:
+    return f'parquet_{dataset}'
+
+def _day(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the Parquet archive")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export observations into the Parquet archive')
+    parser.add_argument('--start', help='First day to export (ISO format, defaults to the day after the last export)')
+    parser.add_argument('--end', help='Day to stop before (ISO format)')
+    parser.add_argument('--dataset', choices=[AQI_DATASET, WEATHER_DATASET], help='Export only this dataset')
+    parser.add_argument('--archive-dir', default=PARQUET_ARCHIVE_DIR)
+    args = parser.parse_args()
+    
+    from src.main import app
+    
+    with app.app_context():
+        result = export_archive(
+            start=datetime.fromisoformat(args.start) if args.start else None,
+            end=datetime.fromisoformat(args.end) if args.end else None,
+            datasets=[args.dataset] if args.dataset else (AQI_DATASET, WEATHER_DATASET),
+            root_dir=args.archive_dir
+        )
+    print("Export Result:", result)
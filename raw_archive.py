@@ -0,0 +1,357 @@
+import os
+import sys
+import gzip
+import json
+import threading
+import argparse
+try:
+    import fcntl
+except ImportError:  # Index locking is best effort on platforms without fcntl
+    fcntl = None
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import logging
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CPCB_SOURCE = 'cpcb'
+OPENWEATHER_CURRENT_SOURCE = 'openweather_current'
+OPENWEATHER_FORECAST_SOURCE = 'openweather_forecast'
+
+# Request parameters that must never be written to disk
+REDACTED_PARAMS = ('api-key', 'appid')
+
+# Name of the index file of every source and day directory
+INDEX_FILE = 'index.json'
+
+class RawResponseArchive:
+    """
+    Append-only archive of raw API responses
+    
+    Responses are appended as NDJSON lines to gzip-compressed segment files,
+    one directory per source and day. A segment is rotated when it grows past
+    max_segment_bytes or the day changes. Every day directory has an
+    index.json recording the time range and entry count of its segments, so
+    an append only rewrites the index of its day and replays only open the
+    days and segments that overlap the requested range.
+    
+    Several processes (the web app and the ingestion scheduler) may share
+    an archive: each writes its own segments and merges its entries into
+    the day's index under a file lock.
+    """
+    
+    def __init__(self, root_dir: str, max_segment_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize the archive
+        
+        Args:
+            root_dir: Directory holding the source and day directories
+            max_segment_bytes: Compressed size after which a segment is rotated
+        """
+        self.root_dir = root_dir
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._active = {}
+    
+    def append(self,
+               source: str,
+               payload: Dict,
+               request: Optional[Dict] = None,
+               fetched_at: Optional[datetime] = None):
+        """
+        Append a raw response to the active segment of a source
+        
+        Args:
+            source: Source name (cpcb, openweather_current, openweather_forecast)
+            payload: Decoded response body
+            request: Request parameters and context (API keys are removed)
+            fetched_at: Time the response was received (defaults to now)
+        """
+        fetched_at = fetched_at or datetime.utcnow()
+        entry = {
+            'source': source,
+            'fetched_at': fetched_at.isoformat(),
+            'request': {k: v for k, v in (request or {}).items() if k not in REDACTED_PARAMS},
+            'payload': payload
+        }
+        line = (json.dumps(entry, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        
+        try:
+            with self._lock:
+                segment = self._active_segment(source, fetched_at)
+                path = os.path.join(self.root_dir, segment['path'])
+                
+                # Every append is written as its own gzip member, so a segment
+                # stays readable even if the process dies mid-write
+                with gzip.open(path, 'ab') as segment_file:
+                    segment_file.write(line)
+                
+                segment['entries'] += 1
+                segment['bytes'] = os.path.getsize(path)
+                segment['last_fetched_at'] = max(segment['last_fetched_at'], entry['fetched_at'])
+                segment['first_fetched_at'] = min(segment['first_fetched_at'], entry['fetched_at'])
+                self._save_index(os.path.dirname(segment['path']))
+        except OSError as e:
+            logger.error(f"Error archiving {source} response: {e}")
+    
+    def iter_entries(self,
+                     source: Optional[str] = None,
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> Iterator[Dict]:
+        """
+        Stream archived entries in fetch order
+        
+        Args:
+            source: Only return entries of this source
+            start: Only return entries fetched at or after this time
+            end: Only return entries fetched at or before this time
+        
+        Yields:
+            Archived entries with 'source', 'fetched_at', 'request' and 'payload'
+        """
+        start_str = start.isoformat() if start else None
+        end_str = end.isoformat() if end else None
+        
+        segments = self.segments(
+            source,
+            start.strftime('%Y-%m-%d') if start else None,
+            end.strftime('%Y-%m-%d') if end else None
+        )
+        segments = [
+            segment for segment in segments
+            if (source is None or segment['source'] == source)
+            and (start_str is None or segment['last_fetched_at'] >= start_str)
+            and (end_str is None or segment['first_fetched_at'] <= end_str)
+        ]
+        segments.sort(key=lambda segment: (segment['first_fetched_at'], segment['path']))
+        
+        for segment in segments:
+            path = os.path.join(self.root_dir, segment['path'])
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as segment_file:
+                    for line in segment_file:
+                        entry = json.loads(line)
+                        if start_str and entry['fetched_at'] < start_str:
+                            continue
+                        if end_str and entry['fetched_at'] > end_str:
+                            continue
+                        yield entry
+            except (OSError, EOFError, json.JSONDecodeError) as e:
+                logger.error(f"Error reading archive segment {segment['path']}: {e}")
+    
+    def segments(self,
+                 source: Optional[str] = None,
+                 first_day: Optional[str] = None,
+                 last_day: Optional[str] = None) -> List[Dict]:
+        """
+        Get the index entries of the segments, including other writers'
+        
+        Args:
+            source: Only return segments of this source
+            first_day: Only return segments of this day (YYYY-MM-DD) or later
+            last_day: Only return segments of this day (YYYY-MM-DD) or earlier
+        
+        Returns:
+            Copies of the index entries
+        """
+        with self._lock:
+            # '' is the archive-wide index written before indexes were kept per day
+            for directory in [''] + self._day_directories(source, first_day, last_day):
+                for segment in self._read_index(directory):
+                    self._segments.setdefault(segment['path'], segment)
+            return [
+                dict(segment) for segment in self._segments.values()
+                if (source is None or segment['source'] == source)
+                and (first_day is None or segment['day'] >= first_day)
+                and (last_day is None or segment['day'] <= last_day)
+            ]
+    
+    def _active_segment(self, source: str, fetched_at: datetime) -> Dict:
+        day = fetched_at.strftime('%Y-%m-%d')
+        
+        segment = self._active.get(source)
+        if segment and segment['day'] == day and segment['bytes'] < self.max_segment_bytes:
+            return segment
+        
+        directory = os.path.join(source, day)
+        os.makedirs(os.path.join(self.root_dir, directory), exist_ok=True)
+        
+        # Segment names carry the writer's pid, so processes never share a file
+        sequence = 0
+        while True:
+            path = os.path.join(directory, f'segment-{os.getpid()}-{sequence:05d}.ndjson.gz')
+            if path not in self._segments and not os.path.exists(os.path.join(self.root_dir, path)):
+                break
+            sequence += 1
+        
+        segment = {
+            'path': path,
+            'source': source,
+            'day': day,
+            'first_fetched_at': fetched_at.isoformat(),
+            'last_fetched_at': fetched_at.isoformat(),
+            'entries': 0,
+            'bytes': 0
+        }
+        self._segments[path] = segment
+        self._active[source] = segment
+        return segment
+    
+    def _day_directories(self, source: Optional[str], first_day: Optional[str],
+                         last_day: Optional[str]) -> List[str]:
+        """Source/day directories of the archive within the given days"""
+        sources = [source] if source else sorted(
+            entry.name for entry in _scandir(self.root_dir) if entry.is_dir()
+        )
+        return [
+            os.path.join(name, entry.name)
+            for name in sources
+            for entry in _scandir(os.path.join(self.root_dir, name))
+            if entry.is_dir()
+            and (first_day is None or entry.name >= first_day)
+            and (last_day is None or entry.name <= last_day)
+        ]
+    
+    def _read_index(self, directory: str) -> List[Dict]:
+        index_path = os.path.join(self.root_dir, directory, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return []
+        try:
+            with open(index_path, 'r', encoding='utf-8') as index_file:
+                return json.load(index_file).get('segments', [])
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Error loading archive index of {directory}: {e}")
+            return []
+    
+    def _save_index(self, directory: str):
+        """Rewrite the index of one day directory, merging other writers' segments"""
+        index_path = os.path.join(self.root_dir, directory, INDEX_FILE)
+        
+        with open(f"{index_path}.lock", 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            
+            # Keep the entries other processes wrote since our last save
+            own_paths = {segment['path'] for segment in self._active.values()}
+            for segment in self._read_index(directory):
+                if segment['path'] not in own_paths:
+                    self._segments[segment['path']] = segment
+            
+            segments = [
+                segment for segment in self._segments.values()
+                if os.path.dirname(segment['path']) == directory
+            ]
+            temp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump({'segments': segments}, index_file)
+            os.replace(temp_path, index_path)
+
+def _scandir(path: str) -> List[os.DirEntry]:
+    """Entries of a directory, none if it does not exist"""
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except FileNotFoundError:
+        return []
+
+def replay_archive(archive: RawResponseArchive,
+                   cpcb_ingestion,
+                   weather_ingestion,
+                   source: Optional[str] = None,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   batch_size: int = 5000) -> Dict:
+    """
+    Re-process archived responses into the database without network access
+    
+    CPCB responses go through process_aqi_batch and are upserted, so
+    replaying a range that is already stored only rewrites those rows.
+    Current-weather responses are stored with their observation time (the
+    fetch time if the response has none) and skipped when their location
+    already has a row at that time, so replaying a stored range adds no
+    rows. Forecast responses are archived but have no table to replay into.
+    
+    Must be called inside a Flask application context.
+    
+    Returns:
+        Dictionary with the number of entries read and rows written per source
+    """
+    from src.models.user import db
+    from src.models.aqi_repository import (
+        upsert_aqi_records, insert_weather_records, aqi_rollup_buckets, refresh_deferred_rollups
+    )
+    
+    stats = {'entries': 0, CPCB_SOURCE: 0, OPENWEATHER_CURRENT_SOURCE: 0}
+    raw_aqi_records = []
+    weather_batch = []
+    
+    def flush():
+        batch = cpcb_ingestion.process_aqi_batch(raw_aqi_records)
+        stats[CPCB_SOURCE] += upsert_aqi_records(batch, update_rollups=False)
+        stats[OPENWEATHER_CURRENT_SOURCE] += insert_weather_records(weather_batch, skip_existing=True)
+        db.session.commit()
+        refresh_deferred_rollups(aqi_rollup_buckets(batch))
+        raw_aqi_records.clear()
+        weather_batch.clear()
+    
+    try:
+        for entry in archive.iter_entries(source, start, end):
+            stats['entries'] += 1
+            payload = entry['payload']
+            
+            if entry['source'] == CPCB_SOURCE:
+                raw_aqi_records.extend(payload.get('records') or [])
+            elif entry['source'] == OPENWEATHER_CURRENT_SOURCE:
+                request = entry.get('request', {})
+                weather_batch.append(weather_ingestion._process_openweather_record(
+                    payload,
+                    request.get('city'),
+                    request.get('state'),
+                    recorded_at=datetime.fromisoformat(entry['fetched_at'])
+                ))
+            
+            if len(raw_aqi_records) + len(weather_batch) >= batch_size:
+                flush()
+        
+        flush()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    logger.info(f"Replayed archive: {stats}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay archived raw API responses into the database')
+    parser.add_argument('command', choices=['replay', 'segments'])
+    parser.add_argument('--source', choices=[CPCB_SOURCE, OPENWEATHER_CURRENT_SOURCE])
+    parser.add_argument('--start', help='Start time (ISO format)')
+    parser.add_argument('--end', help='End time (ISO format)')
+    parser.add_argument('--archive-dir', help='Archive directory (defaults to RAW_ARCHIVE_DIR)')
+    args = parser.parse_args()
+    
+    from src.main import app
+    from src.routes.aqi_routes import cpcb_ingestion, weather_ingestion, RAW_ARCHIVE_DIR
+    
+    archive = RawResponseArchive(args.archive_dir or RAW_ARCHIVE_DIR)
+    
+    if args.command == 'segments':
+        for segment in archive.segments():
+            print(json.dumps(segment))
+    else:
+        with app.app_context():
+            result = replay_archive(
+                archive,
+                cpcb_ingestion,
+                weather_ingestion,
+                source=args.source,
+                start=datetime.fromisoformat(args.start) if args.start else None,
+                end=datetime.fromisoformat(args.end) if args.end else None
+            )
+        print("Replay Result:", result)
@@ -0,0 +1,220 @@
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Optional, Sequence, Tuple
+from flask import request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+
+# Top-level response fields left out of the ETag, as they change on every build
+VOLATILE_FIELDS = ('timestamp',)
+
+# Smaller bodies are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+# Session.info key collecting the tables written in the current transaction
+_WRITTEN_TABLES = 'response_cache_written_tables'
+
+class ResponseCache:
+    """
+    In-process cache of serialized GET responses
+    
+    Entries are keyed by path and normalized query parameters. Each entry
+    records the version of the tables it was built from, and a version is
+    bumped whenever a session commits writes to its table, so ingestion and
+    forecast runs in this process invalidate the responses they affect at
+    once. Writes committed by other processes (the ingestion scheduler)
+    are picked up when the entry's TTL expires.
+    """
+    
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        """
+        Initialize the cache
+        
+        Args:
+            ttl: Seconds an entry is served before it is rebuilt (0 disables caching)
+            max_entries: Number of entries kept, least recently used are evicted first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+    
+    def versions(self, tables: Sequence[str]) -> Tuple[int, ...]:
+        """Get the current versions of tables"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+    
+    def invalidate(self, tables: Sequence[str]):
+        """Mark every entry built from any of the tables as outdated"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+    
+    def get(self, key, tables: Sequence[str]):
+        """
+        Get a fresh entry, or None
+        
+        Outdated entries stay in place until put() replaces them, so their
+        validators can be reused when the rebuilt body has the same data.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                current = tuple(self._versions.get(table, 0) for table in tables)
+                if entry['versions'] != current or time.monotonic() - entry['stored_at'] > self.ttl:
+                    entry = None
+            
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            
+            self.stats['hits'] += 1
+            self._entries.move_to_end(key)
+            return entry
+    
+    def peek(self, key) -> Optional[Dict]:
+        """Get the stored entry whether it is fresh or not, without counting a lookup"""
+        with self._lock:
+            return self._entries.get(key)
+    
+    def record_not_modified(self):
+        with self._lock:
+            self.stats['not_modified'] += 1
+    
+    def put(self, key, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+response_cache = ResponseCache()
+
+def cached_response(tables: Sequence[str], cache: ResponseCache = response_cache, compress: bool = False):
+    """
+    Serve a GET view from the response cache, with conditional GET support
+    
+    Successful responses carry an ETag (hash of the body without its
+    VOLATILE_FIELDS) and Last-Modified (time that data was first served)
+    and are revalidated on every use, so a client sending If-None-Match or
+    If-Modified-Since gets 304 Not Modified while the data is unchanged,
+    even after its entry expired and was rebuilt. Error responses are
+    never cached.
+    
+    Args:
+        tables: Names of the tables the view reads
+        cache: Cache holding the entries
+        compress: Gzip bodies for clients accepting it. The compressed body
+            is kept with the entry, so it is only compressed once.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if cache.ttl <= 0:
+                return view(*args, **kwargs)
+            
+            key = (request.path, _normalized_args())
+            entry = cache.get(key, tables)
+            
+            if entry is None:
+                # Taken before the view runs, so a commit during the view outdates the entry
+                versions = cache.versions(tables)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                
+                body = response.get_data()
+                etag = _data_etag(response)
+                previous = cache.peek(key)
+                if previous is not None and previous['etag'] == etag:
+                    last_modified = previous['last_modified']
+                else:
+                    last_modified = datetime.utcnow().replace(microsecond=0)
+                
+                entry = {
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'versions': versions,
+                    'stored_at': time.monotonic()
+                }
+                cache.put(key, entry)
+            
+            body, etag = entry['body'], entry['etag']
+            encoded = compress and len(body) >= GZIP_MIN_SIZE and request.accept_encodings['gzip'] > 0
+            if encoded:
+                if 'gzip_body' not in entry:
+                    entry['gzip_body'] = gzip.compress(body)
+                # Each encoding is a different representation with its own validator
+                body, etag = entry['gzip_body'], etag + '-gzip'
+            
+            response = make_response(body)
+            response.mimetype = entry['mimetype']
+            response.set_etag(etag)
+            if encoded:
+                response.content_encoding = 'gzip'
+            if compress:
+                response.vary.add('Accept-Encoding')
+            response.last_modified = entry['last_modified']
+            # Browsers revalidate before every reuse instead of guessing freshness
+            response.cache_control.no_cache = True
+            
+            response = response.make_conditional(request)
+            if response.status_code == 304:
+                cache.record_not_modified()
+            return response
+        return wrapper
+    return decorator
+
+def _data_etag(response) -> str:
+    """Hash of a response body, ignoring the VOLATILE_FIELDS of a JSON object"""
+    payload = response.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return hashlib.sha1(response.get_data()).hexdigest()
+    
+    data = {name: value for name, value in payload.items() if name not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def _normalized_args() -> Tuple:
+    """Query parameters without empty values and surrounding whitespace, sorted"""
+    return tuple(sorted(
+        (name, value.strip()) for name, value in request.args.items(multi=True) if value.strip()
+    ))
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info.setdefault(_WRITTEN_TABLES, set()).add(orm_execute_state.statement.table.name)
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush_writes(session, flush_context):
+    written = session.info.setdefault(_WRITTEN_TABLES, set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        written.add(instance.__table__.name)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_tables(session):
+    written = session.info.pop(_WRITTEN_TABLES, None)
+    if written:
+        response_cache.invalidate(written)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_written_tables(session):
+    session.info.pop(_WRITTEN_TABLES, None)
@@ -0,0 +1,133 @@
+import io
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Sequence
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Responses fall back to the standard library encoder
+    orjson = None
+
+# Non-string keys are converted like the standard library encoder does
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+# Responses sort their keys like the default provider, export rows keep the field order
+RESPONSE_OPTIONS = ORJSON_OPTIONS | orjson.OPT_SORT_KEYS if orjson else 0
+
+RESPONSE_FORMATS = ('rows', 'columnar')
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider serializing responses with orjson when it is installed
+    
+    orjson encodes datetimes, numpy values and dataclasses natively and
+    writes bytes straight into the response, several times faster than the
+    standard library encoder on large lists. Datetimes are written in ISO
+    format with either encoder, like the to_dict() methods of the models.
+    Keys are sorted with either encoder, as with the default provider, so
+    response bodies and their ETags do not depend on the encoder.
+    """
+    
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None:
+            kwargs.setdefault('default', _default)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=RESPONSE_OPTIONS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=RESPONSE_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def columnar(rows: Sequence, fields: Sequence[str]) -> Dict[str, List]:
+    """
+    Transpose row tuples into one list per field
+    
+    Args:
+        rows: Rows selected as plain column tuples, in the order of fields
+        fields: Field names
+    
+    Returns:
+        Dictionary mapping every field to the list of its values
+    """
+    if not rows:
+        return {field: [] for field in fields}
+    return {field: list(values) for field, values in zip(fields, zip(*rows))}
+
+def stream_export(chunks: Iterable[Sequence], fields: Sequence[str], export_format: str,
+                  compress: bool = False) -> Iterator[bytes]:
+    """
+    Encode chunks of row tuples as NDJSON or CSV, one piece of output per chunk
+    
+    Nothing but the current chunk is held in memory. A CSV header is
+    produced before the first chunk is read, so the response starts at once.
+    With compress, the output is a gzip stream flushed after every chunk,
+    so clients still receive data as it is produced.
+    
+    Args:
+        chunks: Lists of rows, in the order of fields
+        fields: Field names
+        export_format: ndjson or csv
+        compress: Gzip the output
+    
+    Returns:
+        Iterator of encoded bytes
+    """
+    encode = _ndjson_chunk if export_format == 'ndjson' else _csv_chunk
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 selects the gzip container
+    
+    def pieces():
+        if export_format == 'csv':
+            yield _csv_chunk([fields], fields)
+        for rows in chunks:
+            yield encode(rows, fields)
+    
+    for piece in pieces():
+        if compressor is not None:
+            piece = compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if piece:
+            yield piece
+    
+    if compressor is not None:
+        yield compressor.flush()
+
+def _ndjson_chunk(rows: Sequence, fields: Sequence[str]) -> bytes:
+    if orjson is not None:
+        return b''.join(
+            orjson.dumps(dict(zip(fields, row)), default=_default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        )
+    return ''.join(
+        json.dumps(dict(zip(fields, row)), default=_default, separators=(',', ':')) + '\n' for row in rows
+    ).encode('utf-8')
+
+def _csv_chunk(rows: Sequence, fields: Sequence[str]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows(
+        [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row] for row in rows
+    )
+    return buffer.getvalue().encode('utf-8')
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # orjson encodes these natively, the standard library encoder needs them converted
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    return DefaultJSONProvider.default(obj)
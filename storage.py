@@ -0,0 +1,143 @@
+import os
+from typing import Dict, Optional
+from urllib.parse import quote_plus
+import logging
+from sqlalchemy import event
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SQLITE = 'sqlite'
+POSTGRESQL = 'postgresql'
+
+def database_settings(default_sqlite_path: str, env: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Read the storage configuration from the environment
+    
+    DB_TYPE selects the backend (sqlite or postgresql). DATABASE_URL, if
+    set, overrides the connection settings of either backend.
+    
+    Args:
+        default_sqlite_path: Database file used when DB_PATH is not set
+        env: Environment mapping (defaults to os.environ)
+    
+    Returns:
+        Dictionary with 'backend', 'uri', 'engine_options' and, for SQLite, 'pragmas'
+    """
+    env = os.environ if env is None else env
+    
+    url = env.get('DATABASE_URL')
+    if url and url.startswith('postgres://'):
+        # Heroku-style URLs are not accepted by SQLAlchemy
+        url = 'postgresql://' + url[len('postgres://'):]
+    
+    backend = env.get('DB_TYPE') or (url.split(':', 1)[0].split('+', 1)[0] if url else SQLITE)
+    pool_size = int(env.get('DB_POOL_SIZE', 10))
+    max_overflow = int(env.get('DB_MAX_OVERFLOW', 20))
+    
+    if backend == POSTGRESQL:
+        if not url:
+            url = (
+                f"postgresql://{quote_plus(env.get('DB_USER', 'postgres'))}:{quote_plus(env.get('DB_PASSWORD', ''))}"
+                f"@{env.get('DB_HOST', 'localhost')}:{env.get('DB_PORT', '5432')}/{env.get('DB_NAME', 'airquality')}"
+            )
+        statement_timeout = int(env.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+        
+        return {
+            'backend': POSTGRESQL,
+            'uri': url,
+            'engine_options': {
+                'pool_size': pool_size,
+                'max_overflow': max_overflow,
+                'pool_pre_ping': True,  # Drop connections closed by the server or a proxy
+                'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+                'connect_args': {'options': f'-c statement_timeout={statement_timeout}'}
+            }
+        }
+    
+    if backend != SQLITE:
+        raise ValueError(f"Unsupported DB_TYPE '{backend}'. Use {SQLITE} or {POSTGRESQL}")
+    
+    path = env.get('DB_PATH') or default_sqlite_path
+    busy_timeout = int(env.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    uri = url or f"sqlite:///{os.path.abspath(path)}"
+    
+    engine_options = {
+        'connect_args': {
+            'timeout': busy_timeout / 1000,
+            'check_same_thread': False  # Pooled connections move between request threads
+        }
+    }
+    if ':memory:' not in uri and uri != 'sqlite://':
+        engine_options.update({'pool_size': pool_size, 'max_overflow': max_overflow})
+    
+    return {
+        'backend': SQLITE,
+        'uri': uri,
+        'engine_options': engine_options,
+        'pragmas': {
+            # Readers no longer block on the writer and vice versa
+            'journal_mode': env.get('SQLITE_JOURNAL_MODE', 'WAL'),
+            # Safe with WAL: a crash can lose the last commits, never corrupt the file
+            'synchronous': env.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            'busy_timeout': busy_timeout,
+            'mmap_size': int(env.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+            'cache_size': -int(env.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+            'temp_store': 'MEMORY'
+        }
+    }
+
+def init_database(app, db, default_sqlite_path: str, env: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Configure the Flask app's database and bind db to it
+    
+    Args:
+        app: Flask application
+        db: Flask-SQLAlchemy instance
+        default_sqlite_path: Database file used when DB_PATH is not set
+        env: Environment mapping (defaults to os.environ)
+    
+    Returns:
+        The settings used (see database_settings)
+    """
+    settings = database_settings(default_sqlite_path, env)
+    
+    if settings['backend'] == SQLITE and settings['uri'].startswith('sqlite:///'):
+        directory = os.path.dirname(settings['uri'][len('sqlite:///'):])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = settings['uri']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = settings['engine_options']
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    
+    if settings['backend'] == SQLITE:
+        with app.app_context():
+            event.listen(db.engine, 'connect', _sqlite_pragma_listener(settings['pragmas']))
+            event.listen(db.engine, 'begin', _begin_sqlite_transaction)
+    
+    logger.info(f"Using {settings['backend']} database")
+    return settings
+
+def _sqlite_pragma_listener(pragmas: Dict):
+    """Build a connect listener applying the pragmas to every new SQLite connection"""
+    def apply_pragmas(dbapi_connection, connection_record):
+        # pysqlite starts transactions on its own, not when SQLAlchemy begins
+        # one, which breaks SAVEPOINTs (begin_nested). Disable it and emit
+        # BEGIN from _begin_sqlite_transaction instead, as the SQLAlchemy
+        # SQLite dialect documentation recommends.
+        dbapi_connection.isolation_level = None
+        
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return apply_pragmas
+
+def _begin_sqlite_transaction(connection):
+    """Begin listener emitting the BEGIN pysqlite no longer emits"""
+    connection.exec_driver_sql('BEGIN')
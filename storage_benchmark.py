@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from src.models.user import db
+from src.models.aqi_data import AQIData
+from src.models.aqi_repository import upsert_aqi_records, filter_by_location
+from src.models.storage import SQLITE, init_database
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLLUTANTS = ['PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'OZONE', 'NH3']
+
+# Storage environment standing for the SQLite database before tuning: a
+# bare URI with SQLAlchemy's default pool and SQLite's default pragmas
+SQLITE_UNTUNED = None
+
+def synthetic_records(writer: int, batch: int, batch_size: int, cities: int, stations_per_city: int) -> List[Dict]:
+    """Build a batch of processed AQI records, unique per writer and batch"""
+    base_time = datetime(2024, 1, 1) + timedelta(hours=batch)
+    rng = random.Random(writer * 1000003 + batch)
+    records = []
+    
+    for index in range(batch_size):
+        city = index % cities
+        station = (index // cities) % stations_per_city
+        pollutant = POLLUTANTS[index % len(POLLUTANTS)]
+        records.append({
+            'country': 'India',
+            'state': f'State {city % 10}',
+            'city': f'City {city}',
+            'station': f'Station {writer}-{city}-{station}',
+            'latitude': 20 + rng.random(),
+            'longitude': 78 + rng.random(),
+            'pollutant_id': pollutant,
+            'pollutant_min': rng.uniform(0, 50),
+            'pollutant_max': rng.uniform(50, 300),
+            'pollutant_avg': rng.uniform(10, 200),
+            'aqi_value': rng.randint(0, 500),
+            'aqi_category': 'Moderate',
+            # Stations repeat every cities * stations_per_city rows, so shift their time to keep keys unique
+            'last_update': base_time + timedelta(seconds=index // (cities * stations_per_city))
+        })
+    
+    return records
+
+def run_benchmark(name: str,
+                  env: Optional[Dict[str, str]],
+                  sqlite_path: str,
+                  duration: float = 10.0,
+                  writers: int = 2,
+                  readers: int = 8,
+                  batch_size: int = 500,
+                  cities: int = 50) -> Dict:
+    """
+    Run concurrent upserts and realtime-style reads against one storage mode
+    
+    Args:
+        name: Label of the mode in the results
+        env: Storage environment (see storage.database_settings), or
+            SQLITE_UNTUNED for a plain SQLite database at sqlite_path
+        sqlite_path: Database file used when the mode is SQLite
+        duration: Seconds the workload runs
+        writers: Number of threads upserting record batches
+        readers: Number of threads querying the latest rows of a city
+        batch_size: Records per upsert
+        cities: Number of distinct synthetic cities
+    
+    Returns:
+        Dictionary with write and read throughput and latencies
+    """
+    app = Flask(name)
+    if env is SQLITE_UNTUNED:
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.abspath(sqlite_path)}"
+        db.init_app(app)
+        settings = {'backend': SQLITE}
+    else:
+        settings = init_database(app, db, sqlite_path, env=env)
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {'rows_written': 0, 'write_errors': 0, 'reads': 0, 'read_errors': 0}
+    write_latencies = []
+    read_latencies = []
+    
+    def writer(index: int):
+        batch = 0
+        with app.app_context():
+            while not stop.is_set():
+                records = synthetic_records(index, batch, batch_size, cities, 5)
+                started = time.perf_counter()
+                try:
+                    written = upsert_aqi_records(records)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.debug(f"Write failed: {e}")
+                    with lock:
+                        results['write_errors'] += 1
+                    continue
+                with lock:
+                    results['rows_written'] += written
+                    write_latencies.append(time.perf_counter() - started)
+                batch += 1
+    
+    def reader(index: int):
+        rng = random.Random(index)
+        with app.app_context():
+            while not stop.is_set():
+                city = f'City {rng.randrange(cities)}'
+                started = time.perf_counter()
+                try:
+                    filter_by_location(AQIData.query, AQIData, city).order_by(
+                        AQIData.last_update.desc()
+                    ).limit(50).all()
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.debug(f"Read failed: {e}")
+                    with lock:
+                        results['read_errors'] += 1
+                    continue
+                with lock:
+                    results['reads'] += 1
+                    read_latencies.append(time.perf_counter() - started)
+    
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    with app.app_context():
+        db.engine.dispose()
+    
+    return {
+        'mode': name,
+        'backend': settings['backend'],
+        'rows_written_per_sec': round(results['rows_written'] / elapsed, 1),
+        'reads_per_sec': round(results['reads'] / elapsed, 1),
+        'write_p95_ms': _percentile_ms(write_latencies, 95),
+        'read_p50_ms': _percentile_ms(read_latencies, 50),
+        'read_p95_ms': _percentile_ms(read_latencies, 95),
+        'write_errors': results['write_errors'],
+        'read_errors': results['read_errors']
+    }
+
+def _percentile_ms(latencies: List[float], percentile: int) -> Optional[float]:
+    if not latencies:
+        return None
+    return round(float(np.percentile(latencies, percentile)) * 1000, 2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare read/write throughput of the storage modes')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode')
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--postgres-url', help='PostgreSQL URL to include (its tables are dropped and recreated)')
+    args = parser.parse_args()
+    
+    workload = {
+        'duration': args.duration,
+        'writers': args.writers,
+        'readers': args.readers,
+        'batch_size': args.batch_size
+    }
+    
+    modes = [
+        ('sqlite-untuned', SQLITE_UNTUNED),
+        ('sqlite-wal', {'DB_TYPE': 'sqlite'})
+    ]
+    if args.postgres_url:
+        modes.append(('postgresql', {'DB_TYPE': 'postgresql', 'DATABASE_URL': args.postgres_url}))
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for name, env in modes:
+            result = run_benchmark(name, env, os.path.join(directory, f'{name}.db'), **workload)
+            print(result)
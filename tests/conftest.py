@@ -0,0 +1,51 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.user import db
+from src.models.storage import init_database
+from src.routes.aqi_routes import aqi_bp
+from src.routes.response_cache import response_cache
+from src.routes.serialization import FastJSONProvider
+
+@pytest.fixture
+def app(tmp_path):
+    """Application bound to a fresh SQLite database, configured like main.py"""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.register_blueprint(aqi_bp, url_prefix='/api')
+    init_database(app, db, str(tmp_path / 'app.db'), env={})
+    response_cache.clear()
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def aqi_record(city: str = 'Delhi', station: str = 'Anand Vihar', pollutant_id: str = 'PM2.5',
+               last_update=None, pollutant_avg: float = 100.0, aqi_value=None, state: str = 'Delhi') -> dict:
+    """Processed AQI record, as produced by CPCBDataIngestion"""
+    return {
+        'country': 'India',
+        'state': state,
+        'city': city,
+        'station': station,
+        'latitude': 28.6,
+        'longitude': 77.2,
+        'pollutant_id': pollutant_id,
+        'pollutant_min': pollutant_avg / 2,
+        'pollutant_max': pollutant_avg * 2,
+        'pollutant_avg': pollutant_avg,
+        'aqi_value': aqi_value,
+        'aqi_category': 'Moderate',
+        'last_update': last_update
+    }
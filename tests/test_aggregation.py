@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from functools import partial
+import pandas as pd
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_data import AQIData
+from src.models.aqi_repository import upsert_aqi_records
+import src.models.aggregation as aggregation
+from src.models.aggregation import aggregate_aqi, aggregate_fields, to_records
+from src.models.parquet_archive import export_archive, parquet_available, read_archive
+
+START = datetime(2024, 1, 1)
+
+def readings(city: str = 'Delhi', state: str = 'Delhi', days: int = 21) -> list:
+    """Readings every 37 minutes, alternating between two pollutants and five stations"""
+    return [
+        aqi_record(city=city, state=state, station=f'{city} {index % 5}', pollutant_id=('PM10', 'PM2.5')[index % 2],
+                   last_update=START + timedelta(minutes=37 * index), pollutant_avg=float(index * 7 % 300),
+                   aqi_value=index * 13 % 400)
+        for index in range(days * 24 * 60 // 37)
+    ]
+
+def expected_stats(records: list, period: str, percentile: float) -> pd.DataFrame:
+    frame = pd.DataFrame(records)
+    frame['bucket_start'] = frame['last_update'].dt.to_period(period).dt.start_time
+    return frame.groupby(['bucket_start', 'pollutant_id']).agg(
+        reading_count=('aqi_value', 'size'),
+        aqi_mean=('aqi_value', 'mean'),
+        pollutant_max=('pollutant_avg', 'max'),
+        pollutant_quantile=('pollutant_avg', lambda values: values.quantile(percentile / 100))
+    ).reset_index()
+
+def test_week_buckets_match_pandas(app):
+    records = readings()
+    upsert_aqi_records(records)
+    db.session.commit()
+    
+    stats = aggregate_aqi('delhi', bucket='week', percentiles=[50, 99.5])
+    expected = expected_stats(records, 'W-SUN', 99.5)
+    
+    assert list(stats.columns) == aggregate_fields([50, 99.5])
+    assert stats['bucket_start'].tolist() == expected['bucket_start'].tolist()
+    assert stats['reading_count'].tolist() == expected['reading_count'].tolist()
+    assert stats['aqi_mean'].tolist() == pytest.approx(expected['aqi_mean'].tolist())
+    assert stats['pollutant_p99_5'].tolist() == pytest.approx(expected['pollutant_quantile'].tolist())
+    assert stats['aqi_value'].tolist() == expected['aqi_mean'].round().astype(int).tolist()
+
+def test_rollup_buckets_merge_the_matching_cities(app):
+    mumbai = readings('Mumbai', 'Maharashtra', days=2)
+    navi_mumbai = readings('Navi Mumbai', 'Maharashtra', days=2)
+    upsert_aqi_records(mumbai + navi_mumbai + readings(days=2))
+    db.session.commit()
+    
+    stats = aggregate_aqi('mumbai', match='contains', pollutants=['PM10'], bucket='day')
+    expected = expected_stats(mumbai + navi_mumbai, 'D', 95)
+    expected = expected[expected['pollutant_id'] == 'PM10'].reset_index(drop=True)
+    
+    assert set(stats['pollutant_id']) == {'PM10'}
+    assert stats['reading_count'].tolist() == expected['reading_count'].tolist()
+    assert stats['aqi_mean'].tolist() == pytest.approx(expected['aqi_mean'].tolist())
+    assert stats['pollutant_max'].tolist() == expected['pollutant_max'].tolist()
+    # The p95 of merged rollups is approximated from the hourly ones, within the bucket's range
+    assert all(stats['pollutant_p95'] <= stats['pollutant_max'])
+
+@pytest.mark.skipif(not parquet_available(), reason='pyarrow is not installed')
+def test_archived_days_are_read_from_the_archive(app, tmp_path, monkeypatch):
+    records = readings()
+    upsert_aqi_records(records + readings('Pune', 'Maharashtra', days=3))
+    db.session.commit()
+    export_archive(start=START, end=START + timedelta(days=10), root_dir=str(tmp_path))
+    monkeypatch.setattr(aggregation, 'read_archive', partial(read_archive, root_dir=str(tmp_path)))
+    # Raw rows past the retention period only remain in the archive
+    db.session.query(AQIData).filter(AQIData.last_update < START + timedelta(days=10)).delete()
+    db.session.commit()
+    
+    stats = aggregate_aqi('Delhi', bucket='week', percentiles=[90])
+    expected = expected_stats(records, 'W-SUN', 90)
+    
+    assert stats['reading_count'].tolist() == expected['reading_count'].tolist()
+    assert stats['pollutant_p90'].tolist() == pytest.approx(expected['pollutant_quantile'].tolist())
+
+def test_records_are_json_ready(app):
+    upsert_aqi_records([aqi_record(last_update=START, aqi_value=None)])
+    db.session.commit()
+    
+    records = to_records(aggregate_aqi('Delhi', bucket='hour', start=START, end=START + timedelta(days=1)))
+    
+    assert records[0]['bucket_start'] == records[0]['last_update'] == START.isoformat()
+    assert (records[0]['reading_count'], records[0]['aqi_value'], records[0]['aqi_p95']) == (1, None, None)
+    assert to_records(aggregate_aqi('Nowhere')) == []
+
+@pytest.mark.parametrize('arguments', [{'bucket': 'year'}, {'percentiles': [101]}, {'percentiles': [1, 2, 3, 4, 5, 6]}])
+def test_invalid_aggregations_are_rejected(app, arguments):
+    with pytest.raises(ValueError):
+        aggregate_aqi('Delhi', **arguments)
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_data import (
+    AQIData, AQIForecast, LatestAQI, Location, StationSnapshot, WeatherData, POLLUTANTS, AQI_CATEGORY_NAMES
+)
+from src.models.aqi_repository import (
+    upsert_aqi_records, upsert_forecasts, insert_weather_records, rebuild_latest_aqi, refresh_station_snapshots,
+    resolve_location_ids, filter_by_location, get_watermarks, advance_watermarks
+)
+
+NOW = datetime(2024, 1, 1, 10, 0)
+
+def snapshot(last_update: datetime, stations: int = 3, pollutant_avg: float = 50.0) -> list:
+    return [
+        aqi_record(station=f'Station {station}', pollutant_id=pollutant_id, last_update=last_update,
+                   pollutant_avg=pollutant_avg + station, aqi_value=int(pollutant_avg) + station + offset)
+        for station in range(stations) for offset, pollutant_id in enumerate(('PM2.5', 'PM10', 'NO2'))
+    ]
+
+def test_writing_the_same_snapshot_again_updates_rows(app):
+    for _ in range(3):
+        assert upsert_aqi_records(snapshot(NOW)) == 9
+        db.session.commit()
+    
+    upsert_aqi_records(snapshot(NOW, pollutant_avg=80.0))
+    db.session.commit()
+    
+    assert AQIData.query.count() == 9
+    assert sorted({row.pollutant_avg for row in AQIData.query.filter_by(pollutant_id='PM10')}) == [80.0, 81.0, 82.0]
+
+def test_records_without_a_key_or_with_unknown_pollutants_are_skipped(app):
+    records = snapshot(NOW, stations=1) + [aqi_record(station='', last_update=NOW),
+                                           aqi_record(last_update=None),
+                                           aqi_record(pollutant_id='Pollen', last_update=NOW)]
+    
+    assert upsert_aqi_records(records) == 3
+
+def test_pollutants_and_categories_are_stored_as_codes(app):
+    upsert_aqi_records([aqi_record(pollutant_id='NO2', last_update=NOW)])
+    db.session.commit()
+    
+    stored = db.session.execute(text('SELECT pollutant_id, aqi_category FROM aqi_data')).one()
+    assert stored == (POLLUTANTS.index('NO2'), AQI_CATEGORY_NAMES.index('Moderate'))
+    assert AQIData.query.one().to_dict()['pollutant_id'] == 'NO2'
+    assert AQIData.query.filter(AQIData.pollutant_id == 'NO2').count() == 1
+
+def test_latest_snapshot_only_moves_forward(app):
+    upsert_aqi_records(snapshot(NOW - timedelta(hours=1), pollutant_avg=10.0))
+    upsert_aqi_records(snapshot(NOW, stations=2, pollutant_avg=20.0))
+    # Replaying older data leaves the newer readings in place
+    upsert_aqi_records(snapshot(NOW - timedelta(days=3), pollutant_avg=99.0))
+    db.session.commit()
+    
+    latest = {(row.station, row.pollutant_id): row for row in LatestAQI.query}
+    assert len(latest) == 9
+    assert latest[('Station 0', 'PM10')].pollutant_avg == 20.0
+    assert latest[('Station 2', 'PM10')].last_update == NOW - timedelta(hours=1)
+    
+    incremental = sorted((row.station, row.pollutant_id, row.last_update, row.pollutant_avg) for row in latest.values())
+    db.session.query(LatestAQI).delete()
+    rebuild_latest_aqi()
+    assert sorted((row.station, row.pollutant_id, row.last_update, row.pollutant_avg)
+                  for row in LatestAQI.query) == incremental
+
+def test_station_snapshot_pivots_the_latest_readings(app):
+    upsert_aqi_records(snapshot(NOW, stations=2))
+    upsert_aqi_records([aqi_record(station='Station 0', pollutant_id='SO2', last_update=NOW - timedelta(days=1),
+                                   pollutant_avg=5.0, aqi_value=400)])
+    db.session.commit()
+    
+    station = StationSnapshot.query.filter_by(station='Station 0').one().to_dict()
+    assert (station['aqi_value'], station['dominant_pollutant']) == (400, 'SO2')
+    assert station['sub_indices'] == {'PM2.5': 50, 'PM10': 51, 'NO2': 52, 'SO2': 400}
+    assert station['concentrations']['PM10'] == 50.0
+    assert station['last_update'] == NOW.isoformat()
+    
+    db.session.query(StationSnapshot).delete()
+    assert refresh_station_snapshots() == 2
+
+@pytest.mark.parametrize('city, state, match, expected', [
+    (' DELHI ', None, 'exact', ['Delhi']),
+    ('del', None, 'exact', []),
+    ('Navi', 'maha', 'prefix', ['Navi Mumbai']),
+    ('mumbai', None, 'exact', ['Mumbai']),
+    ('mumbai', None, 'contains', ['Mumbai', 'Navi Mumbai']),
+    ('100%', None, 'contains', [])
+])
+def test_location_filters_use_the_lookup_keys(app, city, state, match, expected):
+    upsert_aqi_records([
+        aqi_record(city='Delhi', station='A', last_update=NOW),
+        aqi_record(city='Mumbai', state='Maharashtra', station='B', last_update=NOW),
+        aqi_record(city='Navi Mumbai', state='Maharashtra', station='C', last_update=NOW)
+    ])
+    insert_weather_records([{'city': name, 'state': region, 'temperature': 30.0, 'recorded_at': NOW}
+                            for name, region in (('Delhi', 'Delhi'), ('Mumbai', 'Maharashtra'),
+                                                 ('Navi Mumbai', 'Maharashtra'))])
+    db.session.commit()
+    
+    for model in (AQIData, WeatherData):
+        rows = filter_by_location(model.query, model, city, state, match).all()
+        assert sorted(row.city for row in rows) == expected
+
+def test_unknown_match_mode_is_rejected(app):
+    with pytest.raises(ValueError):
+        filter_by_location(AQIData.query, AQIData, 'Delhi', match='fuzzy')
+
+def test_locations_are_created_once_and_get_coordinates_later(app):
+    first = resolve_location_ids([{'city': 'Pune', 'state': 'Maharashtra'}])
+    second = resolve_location_ids([{'city': ' pune', 'state': 'MAHARASHTRA ', 'latitude': 18.5, 'longitude': 73.8}])
+    
+    assert first == second == {('pune', 'maharashtra'): Location.query.one().id}
+    assert (Location.query.one().latitude, Location.query.one().longitude) == (18.5, 73.8)
+
+def test_forecasts_are_replaced_per_day_and_model_version(app):
+    forecast = {'city': 'Delhi', 'state': 'Delhi', 'forecast_date': datetime(2024, 6, 1, 10),
+                'predicted_category': 'Moderate'}
+    upsert_forecasts([dict(forecast, predicted_aqi=150)])
+    upsert_forecasts([dict(forecast, predicted_aqi=160, forecast_date=datetime(2024, 6, 1, 18))])
+    upsert_forecasts([dict(forecast, predicted_aqi=170, model_version='2.0')])
+    db.session.commit()
+    
+    rows = [(row.forecast_date, row.model_version, row.predicted_aqi)
+            for row in AQIForecast.query.order_by(AQIForecast.predicted_aqi)]
+    assert rows == [(datetime(2024, 6, 1), 'default', 160), (datetime(2024, 6, 1), '2.0', 170)]
+
+def test_watermarks_never_move_back(app):
+    advance_watermarks('cpcb', {'Delhi': NOW, 'Pune': None})
+    advance_watermarks('cpcb', {'Delhi': NOW - timedelta(hours=1), 'Mumbai': NOW})
+    db.session.commit()
+    
+    assert get_watermarks('cpcb') == {'Delhi': NOW, 'Mumbai': NOW}
+    assert get_watermarks('openweather') == {}
@@ -0,0 +1,165 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_repository import upsert_aqi_records
+from src.data_ingestion.cpcb_ingestion import CPCB_UTC_OFFSET
+import src.routes.aqi_routes as aqi_routes
+
+START = datetime(2024, 1, 1)
+
+class RecordingExecutor:
+    """Stands in for the refresh executor, running submitted refreshes on demand"""
+    
+    def __init__(self):
+        self.submitted = []
+    
+    def submit(self, function, *args):
+        self.submitted.append((function, args))
+    
+    def run_all(self):
+        while self.submitted:
+            function, args = self.submitted.pop(0)
+            function(*args)
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = RecordingExecutor()
+    monkeypatch.setattr(aqi_routes, 'refresh_executor', executor)
+    monkeypatch.setattr(aqi_routes, 'refreshes_in_flight', set())
+    return executor
+
+def store(records: list):
+    upsert_aqi_records(records)
+    db.session.commit()
+
+def test_stale_realtime_data_is_served_and_refreshed_in_the_background(client, executor, monkeypatch):
+    store([aqi_record(city='Pune', state='Maharashtra', last_update=START, aqi_value=90)])
+    fresh_update = (datetime.utcnow() + CPCB_UTC_OFFSET).replace(microsecond=0)
+    fetched = []
+    
+    def fetch_realtime_aqi(state=None, city=None, limit=100):
+        fetched.append(city)
+        return [{'country': 'India', 'state': 'Maharashtra', 'city': 'Pune', 'station': 'Anand Vihar',
+                 'pollutant_id': 'PM10', 'pollutant_avg': '60', 'last_update': fresh_update.strftime('%d-%m-%Y %H:%M:%S')}]
+    monkeypatch.setattr(aqi_routes.cpcb_ingestion, 'fetch_realtime_aqi', fetch_realtime_aqi)
+    
+    stale = client.get('/api/aqi/realtime?city=Pune').get_json()
+    duplicate = client.get('/api/aqi/realtime?city=Pune&limit=10').get_json()
+    
+    assert (stale['count'], stale['stale'], stale['refresh_scheduled']) == (1, True, True)
+    assert duplicate['refresh_scheduled'] and len(executor.submitted) == 1
+    assert fetched == []
+    
+    executor.run_all()
+    # The refresh committed from its own session, end the snapshot held by the test's one
+    db.session.remove()
+    refreshed = client.get('/api/aqi/realtime?city=Pune').get_json()
+    
+    assert fetched == ['Pune']
+    assert aqi_routes.refreshes_in_flight == set()
+    assert (refreshed['count'], refreshed['stale'], refreshed['refresh_scheduled']) == (2, False, False)
+    assert refreshed['data'][0]['last_update'] == fresh_update.isoformat()
+
+def test_no_refresh_is_scheduled_while_the_circuit_is_open(client, executor, monkeypatch):
+    monkeypatch.setattr(aqi_routes.http_client, 'is_available', lambda url: False)
+    
+    body = client.get('/api/aqi/realtime?city=Pune').get_json()
+    
+    assert (body['count'], body['stale'], body['refresh_scheduled']) == (0, True, False)
+    assert executor.submitted == []
+
+def test_unfiltered_realtime_requests_never_refresh(client, executor):
+    store([aqi_record(last_update=START)])
+    
+    body = client.get('/api/aqi/realtime').get_json()
+    
+    assert (body['count'], body['stale'], body['refresh_scheduled']) == (1, False, False)
+    assert executor.submitted == []
+
+@pytest.mark.parametrize('path', ['/api/aqi/realtime?', '/api/aqi/historical?city=Delhi&start_date=2024-01-01&'
+                                  'end_date=2024-01-02&', '/api/aqi/historical?city=Delhi&start_date=2024-01-01&'
+                                  'end_date=2024-01-02&granularity=hour&'])
+def test_columnar_format_holds_the_same_values_as_rows(client, path):
+    store([aqi_record(station=f'Station {index}', last_update=START + timedelta(minutes=10 * index),
+                      aqi_value=100 + index) for index in range(5)])
+    
+    rows = client.get(path + 'format=rows').get_json()
+    columns = client.get(path + 'format=columnar').get_json()
+    
+    assert columns['format'] == 'columnar' and columns['count'] == rows['count']
+    fields = set(columns['data']) & set(rows['data'][0])
+    assert {field: [row[field] for row in rows['data']] for field in fields} == \
+        {field: columns['data'][field] for field in fields}
+    assert client.get(path + 'format=xml').status_code == 400
+
+def test_map_snapshot_filters_by_bounding_box(client):
+    records = [aqi_record(station=f'Station {index}', last_update=START, aqi_value=index) for index in range(4)]
+    for index, record in enumerate(records):
+        record['latitude'], record['longitude'] = 10.0 + index, 70.0 + index
+    store(records)
+    
+    everything = client.get('/api/aqi/map-snapshot').get_json()
+    inside = client.get('/api/aqi/map-snapshot?bbox=70.5,10.5,72.5,12.5').get_json()
+    
+    assert everything['count'] == 4 and everything['last_update'] == START.isoformat()
+    assert [station['station'] for station in inside['data']] == ['Station 1', 'Station 2']
+    assert inside['data'][0]['sub_indices'] == {'PM2.5': 1}
+
+@pytest.mark.parametrize('bbox', ['1,2,3', 'a,b,c,d', '5,0,1,1', '0,5,1,1'])
+def test_map_snapshot_rejects_invalid_bounding_boxes(client, bbox):
+    assert client.get(f'/api/aqi/map-snapshot?bbox={bbox}').status_code == 400
+
+def export_readings():
+    return [aqi_record(station=f'Station {index % 2}', pollutant_id=('PM10', 'NO2')[index % 2],
+                       last_update=START + timedelta(minutes=20 * index), aqi_value=index) for index in range(12)]
+
+def test_export_streams_ndjson_oldest_first(client):
+    store(export_readings())
+    
+    response = client.get('/api/aqi/export?city=Delhi&start_date=2024-01-01&end_date=2024-01-02&pollutant=PM10')
+    rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="aqi_Delhi_raw_20240101_20240102.ndjson"'
+    assert [row['aqi_value'] for row in rows] == [0, 2, 4, 6, 8, 10]
+    assert list(rows[0]) == list(aqi_routes.AQI_FIELDS)
+
+def test_export_of_rollups_as_gzipped_csv(client):
+    store(export_readings())
+    
+    response = client.get('/api/aqi/export?city=Delhi&start_date=2024-01-01&end_date=2024-01-02'
+                          '&granularity=hour&format=csv&gzip=true')
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.data).decode('utf-8'))))
+    
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert [row['bucket_start'] for row in rows] == sorted(row['bucket_start'] for row in rows)
+    assert len(rows) == 8 and sum(int(row['reading_count']) for row in rows) == 12
+    # Rollup means are rounded like AQIRollup.to_dict()
+    assert (rows[0]['pollutant_id'], rows[0]['aqi_value']) == ('PM10', '1')
+
+@pytest.mark.parametrize('query', ['', 'city=Delhi&format=xml', 'city=Delhi&granularity=week',
+                                   'city=Delhi&granularity=hour&station=A', 'city=Delhi&pollutant=Pollen'])
+def test_export_rejects_invalid_parameters(client, query):
+    assert client.get(f'/api/aqi/export?{query}').status_code == 400
+
+def test_aggregate_endpoint_returns_columns_or_rows(client):
+    store(export_readings())
+    url = '/api/aqi/aggregate?city=Delhi&start_date=2024-01-01&end_date=2024-01-02&bucket=hour&pollutants=PM10'
+    
+    rows = client.get(url).get_json()
+    columns = client.get(url + '&format=columnar&percentiles=50,90').get_json()
+    
+    assert rows['count'] == columns['count'] == 4
+    assert rows['data'][0]['reading_count'] == 2 and 'aqi_p95' in rows['data'][0]
+    assert columns['data']['aqi_p50'][:2] == [1.0, 4.0]
+
+@pytest.mark.parametrize('query', ['city=Delhi&bucket=year', 'city=Delhi&percentiles=x', 'city=Delhi&percentiles=101',
+                                   'city=Delhi&pollutants=PM10,Pollen', 'bucket=day'])
+def test_aggregate_endpoint_rejects_invalid_parameters(client, query):
+    assert client.get(f'/api/aqi/aggregate?{query}').status_code == 400
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup, WeatherData
+from src.models.aqi_repository import upsert_aqi_records, insert_weather_records
+from src.models.compaction import compact_observations
+from src.models.parquet_archive import export_archive, parquet_available
+
+NOW = datetime(2024, 3, 1, 12, 0)
+FIRST_READING = NOW - timedelta(days=40)
+
+def store_readings():
+    """Hourly readings over the last 40 days, stored without rollups"""
+    upsert_aqi_records([
+        aqi_record(pollutant_id='PM10', last_update=FIRST_READING + timedelta(hours=hour), pollutant_avg=float(hour % 24),
+                   aqi_value=hour % 24)
+        for hour in range(24 * 40)
+    ], update_rollups=False)
+    db.session.commit()
+
+def test_raw_readings_are_kept_until_they_are_archived(app):
+    store_readings()
+    
+    stats = compact_observations(raw_days=30, hourly_days=35, now=NOW)
+    
+    assert stats['aqi_data'] == 0
+    assert AQIData.query.count() == 24 * 40
+
+@pytest.mark.skipif(not parquet_available(), reason='pyarrow is not installed')
+def test_only_archived_readings_are_deleted_after_their_rollups_exist(app, tmp_path):
+    store_readings()
+    # The archive ends before the raw retention cutoff (2024-01-31), so it bounds the purge
+    export_archive(start=datetime(2024, 1, 21), end=datetime(2024, 1, 28), datasets=['aqi_data'],
+                   root_dir=str(tmp_path))
+    
+    stats = compact_observations(raw_days=30, hourly_days=35, batch_size=50, now=NOW)
+    
+    assert stats['aqi_data'] == 12 + 24 * 6
+    assert AQIData.query.order_by(AQIData.last_update).first().last_update == datetime(2024, 1, 28)
+    # Hourly rollups were computed for every deleted hour, then those past the hourly retention dropped
+    assert stats['aqi_rollup_hour'] == 12 + 24 * 4
+    assert AQIRollup.query.filter_by(granularity='hour').count() == 24 * 2
+    day = AQIRollup.query.filter_by(granularity='day', bucket_start=datetime(2024, 1, 22)).one()
+    assert (day.reading_count, day.aqi_min, day.aqi_max) == (24, 0, 23)
+    assert day.aqi_mean == pytest.approx(11.5)
+
+def test_interrupted_runs_resume(app):
+    insert_weather_records([{'city': 'Delhi', 'state': 'Delhi', 'temperature': 20.0, 'wind_direction': 350.0,
+                             'recorded_at': FIRST_READING + timedelta(minutes=30 * half_hour + 10)}
+                            for half_hour in range(2 * 24 * 5)])
+    db.session.commit()
+    
+    first = compact_observations(raw_days=30, hourly_days=60, batch_size=20, max_batches=2, now=NOW)
+    second = compact_observations(raw_days=30, hourly_days=60, batch_size=20, now=NOW)
+    
+    assert first['weather_data_hour'] == 20
+    assert first['weather_data_hour'] + second['weather_data_hour'] == 24 * 5
+    assert WeatherData.query.count() == 24 * 5
+
+def test_weather_is_averaged_per_hour_then_per_day(app):
+    # Two rows per hour, the last 40 days, with wind from either side of north
+    insert_weather_records([
+        {'city': 'Delhi', 'state': 'Delhi', 'temperature': 20.0 + half_hour % 2, 'humidity': None,
+         'wind_direction': (350.0, 10.0)[half_hour % 2], 'recorded_at': FIRST_READING + timedelta(minutes=30 * half_hour + 5)}
+        for half_hour in range(2 * 24 * 40)
+    ])
+    db.session.commit()
+    
+    stats = compact_observations(raw_days=30, hourly_days=35, now=NOW)
+    again = compact_observations(raw_days=30, hourly_days=35, now=NOW)
+    
+    rows = WeatherData.query.order_by(WeatherData.recorded_at).all()
+    daily = [row for row in rows if row.recorded_at < datetime(2024, 1, 26)]
+    hourly = [row for row in rows if datetime(2024, 1, 26) <= row.recorded_at < datetime(2024, 1, 31)]
+    assert [row.recorded_at for row in daily[:2]] == [datetime(2024, 1, 21), datetime(2024, 1, 22)]
+    assert len(hourly) == 24 * 5 and hourly[0].recorded_at == datetime(2024, 1, 26)
+    assert (hourly[0].temperature, hourly[0].humidity) == (20.5, None)
+    assert hourly[0].wind_direction == pytest.approx(0.0, abs=1e-6)
+    assert stats['rows_reclaimed'] == 2 * 24 * 40 - len(rows)
+    assert again['rows_reclaimed'] == 0
+
+def test_hourly_retention_cannot_be_shorter_than_raw(app):
+    with pytest.raises(ValueError):
+        compact_observations(raw_days=30, hourly_days=7, now=NOW)
@@ -0,0 +1,125 @@
+import random
+from datetime import datetime
+import numpy as np
+import pytest
+
+from src.data_ingestion.cpcb_ingestion import (
+    CPCBDataIngestion, TimestampParser, calculate_aqi_batch, NAQI_BREAKPOINTS
+)
+
+def raw_record(station: str = 'Anand Vihar', pollutant_id: str = 'PM10', pollutant_avg='120',
+               last_update: str = '01-01-2024 10:00:00', **fields) -> dict:
+    return dict({'country': 'India', 'state': 'Delhi', 'city': 'Delhi', 'station': station,
+                 'pollutant_id': pollutant_id, 'pollutant_avg': pollutant_avg, 'last_update': last_update}, **fields)
+
+def test_batch_aqi_matches_the_scalar_calculation():
+    ingestion = CPCBDataIngestion('test-key')
+    rng = random.Random(1)
+    pollutants = list(NAQI_BREAKPOINTS) + ['Pollen', '']
+    # Every breakpoint edge, plus random and invalid concentrations
+    edges = [value for segments in NAQI_BREAKPOINTS.values() for segment in segments for value in segment[:2]
+             if value != float('inf')]
+    concentrations = edges + [None, -1.0, 0.0, 1e9, float('nan')] + [rng.uniform(0, 2000) for _ in range(5000)]
+    pollutant_ids = [rng.choice(pollutants) for _ in concentrations]
+    
+    aqi, categories = calculate_aqi_batch(pollutant_ids, [np.nan if value is None else value for value in concentrations])
+    
+    for pollutant, concentration, batch_aqi, category in zip(pollutant_ids, concentrations, aqi, categories):
+        expected = ingestion._calculate_aqi(pollutant, concentration)
+        assert (None if np.isnan(batch_aqi) else int(batch_aqi)) == expected, (pollutant, concentration)
+        assert category == ingestion._get_aqi_category(expected)
+
+def test_batch_rows_match_single_record_processing():
+    ingestion = CPCBDataIngestion('test-key')
+    records = [
+        raw_record(),
+        raw_record(station='Punjabi Bagh', pollutant_id='NO2', pollutant_avg='NA', latitude='28.67'),
+        raw_record(pollutant_id='CO', pollutant_avg='', last_update='2024-01-01 11:00:00'),
+        raw_record(pollutant_id='OZONE', pollutant_avg=None, last_update='not a date'),
+        {'pollutant_id': 'PM2.5', 'pollutant_avg': 45}
+    ]
+    
+    assert ingestion.process_aqi_records(records) == [ingestion.process_aqi_record(record) for record in records]
+
+def test_batch_deduplicates_on_the_natural_key():
+    batch = CPCBDataIngestion('test-key').process_aqi_batch([
+        raw_record(pollutant_avg='100'),
+        raw_record(pollutant_id='NO2'),
+        raw_record(pollutant_avg='200'),
+        raw_record(station=''),
+        raw_record(last_update='')
+    ])
+    
+    rows = batch.deduplicate(('station', 'pollutant_id', 'last_update')).to_rows()
+    
+    assert [(row['pollutant_id'], row['pollutant_avg']) for row in rows] == [('NO2', 120.0), ('PM10', 200.0)]
+
+def test_batch_take_keeps_the_decoded_values():
+    batch = CPCBDataIngestion('test-key').process_aqi_batch([raw_record(station='A'), raw_record(station='B')])
+    
+    selected = batch.take(batch.column('station') == 'B')
+    
+    assert len(selected) == 1
+    assert selected.to_rows()[0]['station'] == 'B'
+    assert selected.column('last_update')[0] == np.datetime64('2024-01-01T10:00:00')
+
+def test_timestamp_parser_promotes_the_matching_format():
+    parser = TimestampParser()
+    
+    assert parser.parse('01-02-2024 10:30:00') == datetime(2024, 2, 1, 10, 30)
+    assert parser.formats[0] == '%d-%m-%Y %H:%M:%S'
+    assert parser.parse('2024-02-01') == datetime(2024, 2, 1)
+    assert parser.parse('garbage') is None and parser.parse('') is None
+
+def test_timestamp_parser_parses_columns_once_per_distinct_string(monkeypatch):
+    parser = TimestampParser()
+    calls = []
+    parse_uncached = parser._parse_uncached
+    monkeypatch.setattr(parser, '_parse_uncached', lambda value: calls.append(value) or parse_uncached(value))
+    
+    parsed = parser.parse_many(['01-02-2024 10:00:00'] * 500 + [None, 'garbage', '01-02-2024 11:00:00'])
+    
+    assert sorted(calls) == ['01-02-2024 10:00:00', '01-02-2024 11:00:00', 'garbage']
+    assert parsed.dtype == np.dtype('datetime64[us]')
+    assert parsed[0] == np.datetime64('2024-02-01T10:00:00')
+    assert np.isnat(parsed[500]) and np.isnat(parsed[501])
+
+def test_all_records_are_streamed_page_by_page():
+    ingestion = CPCBDataIngestion('test-key')
+    total = 2350
+    offsets = []
+    
+    def fetch_page(offset, limit, filters):
+        offsets.append(offset)
+        # The API caps pages at 500 records whatever the requested limit
+        count = max(0, min(limit, 500, total - offset))
+        return {'total': total, 'records': [raw_record(station=f'S{offset + index}') for index in range(count)]}
+    ingestion._fetch_page = fetch_page
+    
+    stations = [record['station'] for record in ingestion.iter_all_records(page_size=1000)]
+    
+    assert len(stations) == len(set(stations)) == total
+    assert offsets == [0, 500, 1000, 1500, 2000]
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_streaming_stops_at_a_failed_page(prefetch):
+    ingestion = CPCBDataIngestion('test-key')
+    pages = {0: {'records': [raw_record()] * 10}, 10: None}
+    ingestion._fetch_page = lambda offset, limit, filters: pages[offset]
+    
+    assert len(list(ingestion.iter_all_records(page_size=10, prefetch=prefetch))) == 10
+
+def test_fetch_many_yields_every_city():
+    ingestion = CPCBDataIngestion('test-key')
+    
+    def fetch_realtime_aqi(state=None, city=None, limit=100):
+        if city == 'Pune':
+            raise RuntimeError('connection reset')
+        return [raw_record(city=city)]
+    ingestion.fetch_realtime_aqi = fetch_realtime_aqi
+    
+    results = dict(ingestion.fetch_many(['Delhi', {'city': 'Mumbai', 'state': 'Maharashtra'}, 'Pune']))
+    
+    assert results['Delhi'][0]['city'] == 'Delhi'
+    assert len(results['Mumbai']) == 1
+    assert results['Pune'] == []
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+from src.data_ingestion.http_client import (
+    ResilientHTTPClient, RateLimiter, RetryPolicy, CircuitBreaker, CircuitOpenError, TokenBucket
+)
+
+@pytest.fixture
+def server():
+    """Local API answering with the statuses queued in server.statuses, then 200"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        
+        def do_GET(self):
+            status = server.statuses.pop(0) if server.statuses else 200
+            body = json.dumps({'status': status}).encode('utf-8')
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '0.2')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.statuses = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/resource'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+def client(**kwargs) -> ResilientHTTPClient:
+    kwargs.setdefault('retry_policy', RetryPolicy(max_retries=2, backoff_base=0.01))
+    return ResilientHTTPClient(rate_limiter=RateLimiter({}, default_limit=(1000.0, 1000)), **kwargs)
+
+def test_throttled_requests_wait_for_retry_after(server):
+    http = client()
+    server.statuses = [429, 503]
+    
+    started = time.monotonic()
+    response = http.get(server.url)
+    
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.2
+    stats = http.stats()
+    assert (stats['requests'], stats['throttled'], stats['retried'], stats['failed']) == (3, 1, 2, 0)
+
+def test_exhausted_retries_return_the_last_response(server):
+    http = client()
+    server.statuses = [500, 502, 503]
+    
+    assert http.get(server.url).status_code == 503
+    assert http.stats()['failed'] == 1
+
+def test_circuit_opens_after_repeated_failures_and_recovers(server):
+    http = client(retry_policy=RetryPolicy(max_retries=0),
+                  circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    server.statuses = [500, 500]
+    http.get(server.url)
+    http.get(server.url)
+    
+    with pytest.raises(CircuitOpenError):
+        http.get(server.url)
+    assert not http.is_available(server.url)
+    assert http.stats()['circuits'] == {'127.0.0.1': 'open'}
+    
+    # After the reset timeout one trial call goes through and closes the circuit
+    time.sleep(0.25)
+    assert http.get(server.url).status_code == 200
+    assert http.stats()['circuits'] == {'127.0.0.1': 'closed'}
+    assert http.stats()['rejected'] == 1
+
+def test_half_open_circuit_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure('api')
+    assert not breaker.allow('api')
+    
+    time.sleep(0.06)
+    assert breaker.allow('api')
+    assert not breaker.allow('api')
+    
+    breaker.record_failure('api')
+    assert breaker.is_open('api')
+
+def test_token_bucket_allows_a_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    
+    waits = [bucket.reserve() for _ in range(5)]
+    
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.2, abs=0.01)
+
+def test_paused_bucket_holds_back_requests():
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    bucket.pause(0.5)
+    
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+
+@pytest.mark.parametrize('value, expected', [('3', 3.0), ('-1', 0.0), ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+                                             ('soon', None), (None, None)])
+def test_retry_after_header_parsing(value, expected):
+    assert RetryPolicy.parse_retry_after(value) == expected
+
+def test_backoff_respects_the_ceiling_and_retry_after():
+    policy = RetryPolicy(backoff_base=0.5, backoff_max=4.0)
+    
+    assert all(0 <= policy.backoff(attempt) <= min(4.0, 0.5 * 2 ** attempt) for attempt in range(6) for _ in range(20))
+    assert policy.backoff(0, retry_after=2.0) >= 2.0
+    assert policy.backoff(0, retry_after=60.0) == 4.0
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup, WeatherData
+from src.data_ingestion.cpcb_ingestion import CPCBDataIngestion
+from src.data_ingestion.weather_ingestion import WeatherDataIngestion
+from src.models.ingestion_scheduler import IngestionScheduler, CPCB_CITY_LIMIT
+
+CITIES = [{'city': 'Delhi', 'state': 'Delhi'}]
+
+class FakeCPCB(CPCBDataIngestion):
+    """Serves the raw records of self.responses instead of calling the API"""
+    def __init__(self):
+        super().__init__('test-key')
+        self.responses = []
+        self.limits = []
+    
+    def fetch_many(self, cities, limit=100, max_concurrency=None):
+        self.limits.append(limit)
+        yield 'Delhi', self.responses
+
+class FakeWeather(WeatherDataIngestion):
+    """Processes the OpenWeatherMap payloads of self.responses instead of calling the API"""
+    def __init__(self):
+        super().__init__('test-key')
+        self.responses = []
+    
+    def collect_current_weather(self, cities=None, max_concurrency=10, timeout=10):
+        return [self._process_openweather_record(data, 'Delhi', 'Delhi') for data in self.responses]
+
+def raw_reading(station: str, last_update: str, pollutant_id: str = 'PM10') -> dict:
+    return {'country': 'India', 'state': 'Delhi', 'city': 'Delhi', 'station': station,
+            'pollutant_id': pollutant_id, 'pollutant_avg': '50', 'last_update': last_update}
+
+def weather_payload(dt: int, temperature: float = 30.0) -> dict:
+    return {'dt': dt, 'coord': {'lat': 28.6, 'lon': 77.2}, 'main': {'temp': temperature}, 'wind': {}}
+
+def scheduler(app, cpcb=None, weather=None) -> IngestionScheduler:
+    return IngestionScheduler(app, cpcb or FakeCPCB(), weather or FakeWeather(), cities=CITIES,
+                              export_interval=0, compaction_interval=0)
+
+def test_cpcb_run_stores_late_stations(app):
+    cpcb = FakeCPCB()
+    jobs = scheduler(app, cpcb=cpcb)
+    
+    cpcb.responses = [raw_reading('A', '01-01-2024 10:00:00'), raw_reading('B', '01-01-2024 09:00:00')]
+    assert jobs.run_cpcb_once()['stored'] == 2
+    
+    # Station B reports a reading older than A's latest one, which is still new for B
+    cpcb.responses = [raw_reading('A', '01-01-2024 10:00:00'), raw_reading('B', '01-01-2024 09:30:00'),
+                      raw_reading('B', '01-01-2024 09:30:00', 'NO2')]
+    result = jobs.run_cpcb_once()
+    
+    assert (result['stored'], result['skipped']) == (2, 1)
+    assert db.session.query(AQIData).count() == 4
+    assert cpcb.limits == [CPCB_CITY_LIMIT, CPCB_CITY_LIMIT]
+    # Rollups are refreshed after the run commits: PM10 at 09:00 and 10:00, NO2 at 09:00
+    assert AQIRollup.query.filter_by(granularity='hour').count() == 3
+
+def test_weather_run_skips_unchanged_observations(app):
+    weather = FakeWeather()
+    jobs = scheduler(app, weather=weather)
+    
+    weather.responses = [weather_payload(1717236000)]
+    assert jobs.run_weather_once()['stored'] == 1
+    
+    # Polling again before OpenWeatherMap publishes a new observation stores nothing
+    assert jobs.run_weather_once() == {'source': 'openweather', 'stored': 0, 'skipped': 1}
+    
+    weather.responses = [weather_payload(1717236000 + 600, temperature=31.0)]
+    assert jobs.run_weather_once()['stored'] == 1
+    
+    rows = db.session.query(WeatherData.recorded_at, WeatherData.temperature).order_by(WeatherData.recorded_at).all()
+    assert rows == [(datetime(2024, 6, 1, 10, 0), 30.0), (datetime(2024, 6, 1, 10, 10), 31.0)]
+
+def test_weather_record_falls_back_to_the_fetch_time_without_dt():
+    record = WeatherDataIngestion()._process_openweather_record({'main': {'temp': 30.0}}, 'Delhi', 'Delhi',
+                                                               recorded_at=datetime(2024, 6, 1, 10, 5))
+    
+    assert record['recorded_at'] == datetime(2024, 6, 1, 10, 5)
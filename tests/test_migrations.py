@@ -0,0 +1,57 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import inspect, text
+
+from src.models.user import db
+from src.models.aqi_data import AQIForecast, SchemaVersion
+from src.models.aqi_repository import SCHEMA_VERSION, migrate, schema_version
+
+@pytest.fixture
+def empty_database(app):
+    db.drop_all()
+    return app
+
+def create_legacy_forecasts() -> None:
+    """aqi_forecast as created before forecasts were keyed on a location"""
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE aqi_forecast (id INTEGER PRIMARY KEY, city VARCHAR(100), state VARCHAR(100), "
+            "latitude FLOAT, longitude FLOAT, forecast_date DATETIME, predicted_aqi INTEGER, "
+            "predicted_category VARCHAR(50), confidence_score FLOAT, model_version VARCHAR(50), created_at DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO aqi_forecast (city, state, forecast_date, predicted_aqi, predicted_category, model_version, "
+            "created_at) VALUES "
+            "('Delhi', 'Delhi', '2024-01-02 00:00:00.000000', 150, 'Moderate', NULL, '2024-01-01 06:00:00.000000'), "
+            "('Delhi', 'Delhi', '2024-01-02 00:00:00.000000', 180, 'Moderate', NULL, '2024-01-01 12:00:00.000000'), "
+            "('Pune', 'Maharashtra', '2024-01-02 00:00:00.000000', 90, 'Satisfactory', 'v2', "
+            "'2024-01-01 12:00:00.000000')"
+        ))
+
+def test_migrate_creates_a_fresh_database(empty_database):
+    assert schema_version() is None
+    
+    assert migrate() is True
+    
+    assert schema_version() == SCHEMA_VERSION
+    assert inspect(db.engine).has_table(AQIForecast.__tablename__)
+
+def test_migrate_is_idempotent(empty_database):
+    migrate()
+    
+    assert migrate() is False
+    assert db.session.query(SchemaVersion).count() == 1
+
+def test_migrate_upgrades_legacy_tables(empty_database):
+    create_legacy_forecasts()
+    
+    migrate()
+    
+    rows = db.session.query(AQIForecast).order_by(AQIForecast.forecast_date, AQIForecast.predicted_aqi).all()
+    # NULL model versions become the default and collide, so only the newest Delhi forecast is kept
+    assert [(row.city, row.predicted_aqi, row.model_version) for row in rows] == [
+        ('Pune', 90, 'v2'), ('Delhi', 180, 'default')
+    ]
+    assert rows[0].forecast_date == datetime(2024, 1, 2)
+    assert not any(column['nullable'] for column in inspect(db.engine).get_columns('aqi_forecast')
+                   if column['name'] == 'model_version')
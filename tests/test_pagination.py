@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_data import AQIData
+from src.models.aqi_repository import upsert_aqi_records
+from src.routes.aqi_routes import MAX_LIMIT
+from src.routes.pagination import decode_cursor, encode_cursor, paginate_keyset
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def readings(app):
+    # Two stations per timestamp, so pages split rows sharing a timestamp
+    upsert_aqi_records([
+        aqi_record(station=f'Station {index % 2}', last_update=START + timedelta(hours=index // 2))
+        for index in range(9)
+    ])
+    db.session.commit()
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(datetime(2024, 1, 2, 3, 4, 5), 42)
+    
+    assert decode_cursor(cursor) == (datetime(2024, 1, 2, 3, 4, 5), 42)
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor')
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_pages_cover_every_row_once(readings, descending):
+    expected = db.session.query(AQIData.id).count()
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = paginate_keyset(AQIData.query, AQIData.last_update, AQIData.id, 2, cursor, descending)
+        seen += [(row.last_update, row.id) for row in rows]
+        if cursor is None:
+            break
+    
+    assert len(seen) == len(set(seen)) == expected
+    assert seen == sorted(seen, reverse=descending)
+
+def test_rows_inserted_while_paging_do_not_shift_pages(readings):
+    first, cursor = paginate_keyset(AQIData.query, AQIData.last_update, AQIData.id, 3)
+    
+    upsert_aqi_records([aqi_record(station='New', last_update=START + timedelta(days=1))])
+    db.session.commit()
+    second, _ = paginate_keyset(AQIData.query, AQIData.last_update, AQIData.id, 3, cursor)
+    
+    assert second[0].last_update <= first[-1].last_update
+    assert not {row.id for row in first} & {row.id for row in second}
+
+def test_limit_below_one_is_rejected(app):
+    with pytest.raises(ValueError):
+        paginate_keyset(AQIData.query, AQIData.last_update, AQIData.id, 0)
+
+@pytest.mark.parametrize('limit', ['0', '-5', 'many', str(MAX_LIMIT + 1)])
+@pytest.mark.parametrize('endpoint', ['/api/aqi/realtime', '/api/aqi/historical', '/api/aqi/forecast'])
+def test_endpoints_reject_invalid_limits(client, endpoint, limit):
+    response = client.get(f'{endpoint}?city=Delhi&limit={limit}')
+    
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+def test_historical_pages_follow_the_cursor(client, readings):
+    url = '/api/aqi/historical?city=Delhi&start_date=2023-12-31&end_date=2024-01-02&limit=4'
+    first = client.get(url).get_json()
+    second = client.get(f"{url}&cursor={first['next_cursor']}").get_json()
+    
+    assert first['count'] == 4
+    assert {row['id'] for row in first['data']}.isdisjoint(row['id'] for row in second['data'])
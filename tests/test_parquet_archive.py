@@ -0,0 +1,66 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_repository import upsert_aqi_records, insert_weather_records
+from src.models.parquet_archive import (
+    export_archive, archived_until, read_archive, read_recent, parquet_available, AQI_DATASET, WEATHER_DATASET
+)
+
+pytestmark = pytest.mark.skipif(not parquet_available(), reason='pyarrow is not installed')
+
+START = datetime(2024, 3, 1)
+
+def store_observations(days: int = 3):
+    upsert_aqi_records([
+        aqi_record(city=city, station=f'{city} 1', pollutant_id=pollutant_id, last_update=START + timedelta(hours=hour),
+                   pollutant_avg=float(hour), aqi_value=hour)
+        for city in ('Delhi', 'Pune') for pollutant_id in ('PM10', 'NO2') for hour in range(24 * days)
+    ], update_rollups=False)
+    insert_weather_records([{'city': 'Delhi', 'state': 'Delhi', 'temperature': 20.0 + hour % 10, 'humidity': 50.0,
+                             'recorded_at': START + timedelta(hours=hour)} for hour in range(24 * days)])
+    db.session.commit()
+
+def test_exported_days_read_back_like_the_database(app, tmp_path):
+    store_observations()
+    
+    stats = export_archive(start=START, end=START + timedelta(days=3), root_dir=str(tmp_path))
+    
+    assert stats == {AQI_DATASET: 288, WEATHER_DATASET: 72}
+    assert sorted(os.listdir(tmp_path / AQI_DATASET)) == ['date=2024-03-01', 'date=2024-03-02', 'date=2024-03-03']
+    assert archived_until(AQI_DATASET) == START + timedelta(days=3)
+    
+    for dataset, order in ((AQI_DATASET, ['city', 'pollutant_id', 'last_update']), (WEATHER_DATASET, ['recorded_at'])):
+        archived = read_archive(dataset, root_dir=str(tmp_path)).sort_values(order).reset_index(drop=True)
+        recent = read_recent(dataset).sort_values(order).reset_index(drop=True)
+        assert archived.astype(object).where(archived.notna(), None).values.tolist() == \
+            recent.astype(object).where(recent.notna(), None).values.tolist()
+
+def test_reads_prune_by_time_and_filters(app, tmp_path):
+    store_observations()
+    export_archive(start=START, end=START + timedelta(days=3), root_dir=str(tmp_path))
+    
+    frame = read_archive(AQI_DATASET, ['city', 'aqi_value', 'last_update'], start=START + timedelta(days=1, hours=6),
+                         end=START + timedelta(days=2), filters=[('city', 'in', ['Pune'])], root_dir=str(tmp_path))
+    
+    assert list(frame.columns) == ['city', 'aqi_value', 'last_update']
+    assert len(frame) == 18 * 2
+    assert set(frame['city']) == {'Pune'}
+    assert frame['last_update'].min() == START + timedelta(days=1, hours=6)
+
+def test_exports_continue_after_the_last_exported_day(app, tmp_path):
+    store_observations()
+    export_archive(start=START, end=START + timedelta(days=1), root_dir=str(tmp_path))
+    
+    stats = export_archive(end=START + timedelta(days=3), root_dir=str(tmp_path))
+    
+    assert stats == {AQI_DATASET: 192, WEATHER_DATASET: 48}
+    assert export_archive(end=START + timedelta(days=3), root_dir=str(tmp_path)) == {AQI_DATASET: 0, WEATHER_DATASET: 0}
+    assert len(read_archive(AQI_DATASET, ['city'], root_dir=str(tmp_path))) == 288
+
+def test_missing_archive_reads_as_empty(tmp_path):
+    frame = read_archive(AQI_DATASET, ['city', 'aqi_value'], root_dir=str(tmp_path))
+    
+    assert frame.empty and list(frame.columns) == ['city', 'aqi_value']
@@ -0,0 +1,94 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+from src.models.aqi_data import AQIData, WeatherData
+from src.data_ingestion.cpcb_ingestion import CPCBDataIngestion
+from src.data_ingestion.weather_ingestion import WeatherDataIngestion
+from src.data_ingestion.raw_archive import (
+    RawResponseArchive, replay_archive, CPCB_SOURCE, OPENWEATHER_CURRENT_SOURCE, INDEX_FILE
+)
+
+DAY_ONE = datetime(2024, 6, 1, 10, 0)
+DAY_TWO = datetime(2024, 6, 2, 10, 0)
+
+def cpcb_payload(station: str, last_update: str) -> dict:
+    return {'records': [{'country': 'India', 'state': 'Delhi', 'city': 'Delhi', 'station': station,
+                         'pollutant_id': 'PM10', 'pollutant_avg': '50', 'last_update': last_update}]}
+
+def read_index(root, source: str, day: str) -> list:
+    with open(os.path.join(root, source, day, INDEX_FILE), encoding='utf-8') as index_file:
+        return json.load(index_file)['segments']
+
+def test_appends_only_rewrite_the_index_of_their_day(tmp_path):
+    archive = RawResponseArchive(str(tmp_path))
+    archive.append(CPCB_SOURCE, cpcb_payload('A', '01-06-2024 10:00:00'), fetched_at=DAY_ONE)
+    day_one_index = os.path.join(tmp_path, CPCB_SOURCE, '2024-06-01', INDEX_FILE)
+    written_at = os.stat(day_one_index).st_mtime_ns
+    
+    for minute in range(3):
+        archive.append(CPCB_SOURCE, cpcb_payload('A', '02-06-2024 10:00:00'), fetched_at=DAY_TWO.replace(minute=minute))
+    
+    assert os.stat(day_one_index).st_mtime_ns == written_at
+    assert [segment['entries'] for segment in read_index(tmp_path, CPCB_SOURCE, '2024-06-01')] == [1]
+    [segment] = read_index(tmp_path, CPCB_SOURCE, '2024-06-02')
+    assert (segment['entries'], segment['first_fetched_at'], segment['last_fetched_at']) == (
+        3, '2024-06-02T10:00:00', '2024-06-02T10:02:00'
+    )
+
+def test_writers_sharing_an_archive_see_each_others_segments(tmp_path):
+    first = RawResponseArchive(str(tmp_path))
+    second = RawResponseArchive(str(tmp_path))
+    
+    first.append(CPCB_SOURCE, cpcb_payload('A', '01-06-2024 10:00:00'), fetched_at=DAY_ONE)
+    second.append(CPCB_SOURCE, cpcb_payload('B', '01-06-2024 10:05:00'), fetched_at=DAY_ONE.replace(minute=5))
+    first.append(CPCB_SOURCE, cpcb_payload('C', '01-06-2024 10:10:00'), fetched_at=DAY_ONE.replace(minute=10))
+    
+    assert len(read_index(tmp_path, CPCB_SOURCE, '2024-06-01')) == 2
+    stations = [entry['payload']['records'][0]['station'] for entry in RawResponseArchive(str(tmp_path)).iter_entries()]
+    assert sorted(stations) == ['A', 'B', 'C']
+
+def test_entries_are_filtered_by_source_and_time(tmp_path):
+    archive = RawResponseArchive(str(tmp_path), max_segment_bytes=1)
+    archive.append(CPCB_SOURCE, cpcb_payload('A', '01-06-2024 10:00:00'), fetched_at=DAY_ONE)
+    archive.append(CPCB_SOURCE, cpcb_payload('B', '02-06-2024 10:00:00'), fetched_at=DAY_TWO)
+    archive.append(CPCB_SOURCE, cpcb_payload('C', '02-06-2024 11:00:00'), fetched_at=DAY_TWO.replace(hour=11))
+    archive.append(OPENWEATHER_CURRENT_SOURCE, {'main': {'temp': 30.0}}, fetched_at=DAY_TWO)
+    
+    # Every append rotates the segment past max_segment_bytes
+    assert len(archive.segments()) == 4
+    assert len(archive.segments(CPCB_SOURCE, first_day='2024-06-02')) == 2
+    
+    entries = archive.iter_entries(CPCB_SOURCE, start=DAY_TWO, end=DAY_TWO.replace(hour=10, minute=30))
+    assert [entry['payload']['records'][0]['station'] for entry in entries] == ['B']
+
+def test_api_keys_are_not_archived(tmp_path):
+    archive = RawResponseArchive(str(tmp_path))
+    archive.append(CPCB_SOURCE, {'records': []}, request={'api-key': 'SECRET', 'offset': 0}, fetched_at=DAY_ONE)
+    
+    [segment] = archive.segments()
+    with gzip.open(os.path.join(tmp_path, segment['path']), 'rt', encoding='utf-8') as segment_file:
+        entry = json.loads(segment_file.read())
+    assert entry['request'] == {'offset': 0}
+
+def test_replaying_twice_adds_no_rows(app, tmp_path):
+    archive = RawResponseArchive(str(tmp_path))
+    archive.append(CPCB_SOURCE, cpcb_payload('A', '01-06-2024 10:00:00'), fetched_at=DAY_ONE)
+    request = {'city': 'Delhi', 'state': 'Delhi'}
+    # Two polls of the same observation and one response without an observation time
+    for minute in (2, 7):
+        archive.append(OPENWEATHER_CURRENT_SOURCE, {'dt': 1717236000, 'main': {'temp': 30.0}}, request=request,
+                       fetched_at=DAY_ONE.replace(minute=minute))
+    archive.append(OPENWEATHER_CURRENT_SOURCE, {'main': {'temp': 31.0}}, request=request,
+                   fetched_at=DAY_ONE.replace(minute=12))
+    
+    first = replay_archive(archive, CPCBDataIngestion('test-key'), WeatherDataIngestion('test-key'))
+    second = replay_archive(archive, CPCBDataIngestion('test-key'), WeatherDataIngestion('test-key'))
+    
+    assert (first[CPCB_SOURCE], first[OPENWEATHER_CURRENT_SOURCE]) == (1, 2)
+    assert second[OPENWEATHER_CURRENT_SOURCE] == 0
+    assert AQIData.query.count() == 1
+    assert sorted(row.recorded_at for row in WeatherData.query) == [
+        datetime(2024, 6, 1, 10, 0), datetime(2024, 6, 1, 10, 12)
+    ]
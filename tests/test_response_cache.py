@@ -0,0 +1,96 @@
+import gzip
+import time
+from datetime import datetime
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_repository import upsert_aqi_records
+from src.routes.response_cache import ResponseCache, response_cache
+
+def store(aqi_value: int, last_update: datetime = datetime(2024, 1, 1, 10)):
+    upsert_aqi_records([aqi_record(last_update=last_update, aqi_value=aqi_value)])
+    db.session.commit()
+
+def test_unchanged_data_is_not_sent_again(client):
+    store(100)
+    first = client.get('/api/aqi/realtime?limit=5')
+    
+    again = client.get('/api/aqi/realtime?limit=5', headers={'If-None-Match': first.headers['ETag']})
+    since = client.get('/api/aqi/realtime?limit=5', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'no-cache'
+    assert (again.status_code, again.data) == (304, b'')
+    assert since.status_code == 304
+    assert response_cache.stats['not_modified'] >= 2
+
+def test_commits_invalidate_the_responses_built_from_their_tables(client):
+    store(100)
+    first = client.get('/api/aqi/realtime?limit=5')
+    hits = response_cache.stats['hits']
+    assert client.get('/api/aqi/realtime?limit=5').get_json()['data'] == first.get_json()['data']
+    assert response_cache.stats['hits'] == hits + 1
+    
+    store(250, last_update=datetime(2024, 1, 1, 11))
+    changed = client.get('/api/aqi/realtime?limit=5', headers={'If-None-Match': first.headers['ETag']})
+    
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json()['data'][0]['aqi_value'] == 250
+
+def test_rebuilt_entries_keep_their_validators(client, monkeypatch):
+    store(100)
+    monkeypatch.setattr(response_cache, 'ttl', 0.05)
+    first = client.get('/api/aqi/realtime?limit=5')
+    time.sleep(0.1)
+    
+    # The body is rebuilt with a new timestamp but the same data
+    rebuilt = client.get('/api/aqi/realtime?limit=5')
+    time.sleep(0.1)
+    revalidated = client.get('/api/aqi/realtime?limit=5', headers={'If-None-Match': first.headers['ETag']})
+    
+    assert rebuilt.get_json()['timestamp'] != first.get_json()['timestamp']
+    assert (rebuilt.headers['ETag'], rebuilt.headers['Last-Modified']) == (first.headers['ETag'],
+                                                                           first.headers['Last-Modified'])
+    assert revalidated.status_code == 304
+
+def test_query_parameters_are_normalized(client):
+    store(100)
+    client.get('/api/aqi/realtime?limit=5&pollutant=PM2.5')
+    hits = response_cache.stats['hits']
+    
+    client.get('/api/aqi/realtime?pollutant=%20PM2.5%20&state=&limit=5')
+    
+    assert response_cache.stats['hits'] == hits + 1
+
+def test_errors_are_not_cached(client):
+    assert client.get('/api/aqi/realtime?pollutant=Pollen').status_code == 400
+    assert 'ETag' not in client.get('/api/aqi/realtime?pollutant=Pollen').headers
+
+def test_gzipped_bodies_have_their_own_etag(client):
+    upsert_aqi_records([aqi_record(station=f'Station {index}', last_update=datetime(2024, 1, 1), aqi_value=index)
+                        for index in range(50)])
+    db.session.commit()
+    
+    plain = client.get('/api/aqi/map-snapshot')
+    compressed = client.get('/api/aqi/map-snapshot', headers={'Accept-Encoding': 'gzip'})
+    
+    assert plain.headers.get('Content-Encoding') is None
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert client.get('/api/aqi/map-snapshot', headers={'Accept-Encoding': 'gzip',
+                                                        'If-None-Match': compressed.headers['ETag']}).status_code == 304
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(ttl=60, max_entries=2)
+    for key in ('a', 'b'):
+        cache.put(key, {'versions': cache.versions(['t']), 'stored_at': time.monotonic()})
+    
+    assert cache.get('a', ['t']) is not None
+    cache.put('c', {'versions': cache.versions(['t']), 'stored_at': time.monotonic()})
+    
+    assert cache.peek('b') is None
+    assert cache.get('a', ['t']) is not None
+    cache.invalidate(['t'])
+    assert cache.get('a', ['t']) is None and cache.peek('a') is not None
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+
+from conftest import aqi_record
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup
+import src.models.aqi_repository as repository
+from src.models.aqi_repository import (
+    upsert_aqi_records, aqi_rollup_buckets, refresh_deferred_rollups, rebuild_aqi_rollups, merge_rollup_stats
+)
+
+START = datetime(2024, 1, 1)
+
+def readings():
+    """Two days of hourly readings from three stations"""
+    return [
+        aqi_record(station=f'Station {station}', last_update=START + timedelta(hours=hour, minutes=15 * station),
+                   pollutant_avg=float(10 + hour * 3 + station * 7 % 11))
+        for hour in range(48) for station in range(3)
+    ]
+
+def rollup(granularity: str, bucket_start: datetime) -> AQIRollup:
+    return AQIRollup.query.filter_by(granularity=granularity, city_key='delhi', pollutant_id='PM2.5',
+                                     bucket_start=bucket_start).one()
+
+def test_rollups_match_the_raw_readings(app):
+    upsert_aqi_records(readings())
+    db.session.commit()
+    
+    values = [value for (value,) in db.session.query(AQIData.pollutant_avg)]
+    first_hour = sorted(record['pollutant_avg'] for record in readings()[:3])
+    
+    hour = rollup('hour', START)
+    assert (hour.reading_count, hour.pollutant_min, hour.pollutant_max) == (3, first_hour[0], first_hour[-1])
+    assert hour.pollutant_mean == pytest.approx(sum(first_hour) / 3)
+    
+    month = rollup('month', START)
+    assert (month.reading_count, month.pollutant_min, month.pollutant_max) == (144, min(values), max(values))
+    assert month.pollutant_mean == pytest.approx(sum(values) / len(values))
+    
+    days = AQIRollup.query.filter_by(granularity='day').order_by(AQIRollup.bucket_start).all()
+    assert [day.reading_count for day in days] == [72, 72]
+
+def test_rewriting_readings_does_not_double_count(app):
+    upsert_aqi_records(readings())
+    upsert_aqi_records(readings()[:3] + [aqi_record(station='Station 0', last_update=START, pollutant_avg=500.0)])
+    db.session.commit()
+    
+    assert rollup('hour', START).reading_count == 3
+    assert rollup('hour', START).pollutant_max == 500.0
+    assert rollup('month', START).reading_count == 144
+
+def test_deferred_refresh_matches_the_inline_one(app):
+    records = readings()
+    upsert_aqi_records(records, update_rollups=False)
+    db.session.commit()
+    assert AQIRollup.query.count() == 0
+    
+    written = refresh_deferred_rollups(aqi_rollup_buckets(records))
+    deferred = {(row.granularity, row.bucket_start): row.pollutant_p95 for row in AQIRollup.query}
+    
+    assert written == len(deferred) == 48 + 2 + 1
+    assert rebuild_aqi_rollups() == written
+    assert {(row.granularity, row.bucket_start): row.pollutant_p95 for row in AQIRollup.query} == deferred
+
+def test_failed_deferred_refresh_keeps_the_readings(app, monkeypatch):
+    records = readings()[:3]
+    upsert_aqi_records(records, update_rollups=False)
+    db.session.commit()
+    
+    def fail(touched):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(repository, 'refresh_aqi_rollups', fail)
+    
+    assert refresh_deferred_rollups(aqi_rollup_buckets(records)) == 0
+    assert AQIData.query.count() == 3
+
+def test_rollup_buckets_skip_unknown_pollutants_and_times():
+    buckets = aqi_rollup_buckets([
+        aqi_record(last_update=START + timedelta(minutes=40)),
+        aqi_record(last_update=START + timedelta(minutes=5), pollutant_id='NO2'),
+        aqi_record(last_update=START, pollutant_id='Pollen'),
+        aqi_record(last_update=None)
+    ])
+    
+    assert buckets == {('delhi', 'delhi', 'PM2.5', START), ('delhi', 'delhi', 'NO2', START)}
+
+def test_merge_rollup_stats_weights_by_reading_count():
+    frame = pd.DataFrame({
+        'bucket': ['a', 'a', 'a', 'b'],
+        'reading_count': [1, 1, 98, 4],
+        'pollutant_min': [5.0, 1.0, 8.0, 2.0],
+        'pollutant_max': [12.0, 25.0, 31.0, 3.0],
+        'pollutant_mean': [10.0, 20.0, 30.0, None],
+        'pollutant_p95': [10.0, 20.0, 30.0, None],
+        'aqi_min': [None] * 4,
+        'aqi_max': [None] * 4,
+        'aqi_mean': [None] * 4,
+        'aqi_p95': [None] * 4
+    })
+    
+    merged = merge_rollup_stats(frame, ['bucket'])
+    
+    a = merged.loc['a']
+    assert (a['reading_count'], a['pollutant_min'], a['pollutant_max']) == (100, 1.0, 31.0)
+    assert a['pollutant_mean'] == pytest.approx((10 + 20 + 30 * 98) / 100)
+    assert a['pollutant_p95'] == 30.0
+    assert pd.isna(a['aqi_mean']) and pd.isna(a['aqi_p95'])
+    assert merged.loc['b', 'reading_count'] == 4 and pd.isna(merged.loc['b', 'pollutant_mean'])
+
+@pytest.mark.parametrize('weights, expected', [([98, 1, 1], 10.0), ([1, 1, 98], 30.0), ([1, 1, 1], 30.0),
+                                               ([10, 85, 5], 20.0)])
+def test_weighted_p95_is_the_value_reaching_95_percent_of_readings(weights, expected):
+    # Weights are given for the values 10, 20 and 30, the rows are out of order
+    frame = pd.DataFrame({
+        'bucket': ['a'] * 3,
+        'reading_count': [weights[2], weights[0], weights[1]],
+        'pollutant_p95': [30.0, 10.0, 20.0]
+    })
+    
+    p95 = repository._weighted_quantile(frame, ['bucket'], 'pollutant_p95', 'reading_count', 0.95)
+    
+    assert p95['a'] == expected
@@ -0,0 +1,59 @@
+import gzip
+import json
+from datetime import datetime
+import numpy as np
+import pytest
+
+import src.routes.serialization as serialization
+from src.routes.serialization import FastJSONProvider, columnar, stream_export
+
+PAYLOAD = {
+    'success': True,
+    'data': [{'station': 'Anand Vihar', 'aqi_value': np.int64(180), 'last_update': datetime(2024, 1, 1, 10, 0),
+              'city': 'Delhi', 'pollutant_avg': 95.5}],
+    'count': 1
+}
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_responses_sort_keys_like_the_default_provider(app, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    elif serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    
+    body = FastJSONProvider(app).response(PAYLOAD).get_data()
+    
+    assert list(json.loads(body)) == ['count', 'data', 'success']
+    assert list(json.loads(body)['data'][0]) == ['aqi_value', 'city', 'last_update', 'pollutant_avg', 'station']
+    assert json.loads(body)['data'][0]['last_update'] == '2024-01-01T10:00:00'
+
+def test_both_encoders_produce_the_same_bytes(app, monkeypatch):
+    if serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    fast = FastJSONProvider(app).response(PAYLOAD).get_data()
+    
+    monkeypatch.setattr(serialization, 'orjson', None)
+    fallback = FastJSONProvider(app).response(PAYLOAD).get_data()
+    
+    assert fast == fallback
+
+def test_columnar_transposes_rows():
+    assert columnar([('Delhi', 180), ('Pune', 90)], ['city', 'aqi']) == {'city': ['Delhi', 'Pune'], 'aqi': [180, 90]}
+    assert columnar([], ['city', 'aqi']) == {'city': [], 'aqi': []}
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_exports_keep_the_field_order(compress):
+    chunks = [[('Delhi', 180, datetime(2024, 1, 1))], [('Pune', 90, None)]]
+    
+    body = b''.join(stream_export(chunks, ['city', 'aqi_value', 'last_update'], 'ndjson', compress))
+    if compress:
+        body = gzip.decompress(body)
+    
+    rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert [list(row) for row in rows] == [['city', 'aqi_value', 'last_update']] * 2
+    assert rows[0]['last_update'] == '2024-01-01T00:00:00'
+
+def test_csv_export_starts_with_the_header():
+    body = b''.join(stream_export([[('Delhi', 180, datetime(2024, 1, 1))]], ['city', 'aqi', 'time'], 'csv'))
+    
+    assert body.decode('utf-8').splitlines() == ['city,aqi,time', 'Delhi,180,2024-01-01T00:00:00']
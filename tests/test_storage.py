@@ -0,0 +1,50 @@
+from sqlalchemy import text
+
+from src.models.user import db
+from src.models.aqi_data import AQIData, AQIRollup
+from src.models.storage import database_settings
+import src.routes.aqi_routes as aqi_routes
+
+def raw_readings(city: str) -> list:
+    return [{'country': 'India', 'state': 'State', 'city': city, 'station': f'{city} {index}', 'pollutant_id': 'PM10',
+             'pollutant_avg': '50', 'last_update': '01-01-2024 10:00:00'} for index in range(3)]
+
+def test_failed_city_leaves_the_other_cities_rows(client, monkeypatch):
+    def fetch_many(cities, limit=100, max_concurrency=None):
+        for city in cities:
+            yield city, raw_readings(city)
+    
+    upsert = aqi_routes.upsert_aqi_records
+    def upsert_failing_mumbai(batch, **kwargs):
+        written = upsert(batch, **kwargs)
+        # Fail after the city's rows were written, so only the savepoint can undo them
+        if batch.to_rows()[0]['city'] == 'Mumbai':
+            raise RuntimeError('constraint failed')
+        return written
+    
+    monkeypatch.setattr(aqi_routes.cpcb_ingestion, 'fetch_many', fetch_many)
+    monkeypatch.setattr(aqi_routes, 'upsert_aqi_records', upsert_failing_mumbai)
+    
+    body = client.post('/api/aqi/refresh-data', json={'cities': ['Delhi', 'Mumbai', 'Pune']}).get_json()
+    
+    assert body['refreshed_records'] == 6
+    assert len(body['errors']) == 1 and 'Mumbai' in body['errors'][0]
+    db.session.remove()
+    assert sorted(city for (city,) in db.session.query(AQIData.city).distinct()) == ['Delhi', 'Pune']
+    assert sorted(city for (city,) in db.session.query(AQIRollup.city).distinct()) == ['Delhi', 'Pune']
+
+def test_sqlite_connections_are_tuned(app):
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        # Transactions are begun by SQLAlchemy, not by pysqlite
+        assert connection.connection.dbapi_connection.isolation_level is None
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+
+def test_database_settings_from_the_environment():
+    settings = database_settings('/data/app.db', env={'DATABASE_URL': 'postgres://user:secret@db:5432/air'})
+    assert (settings['backend'], settings['uri']) == ('postgresql', 'postgresql://user:secret@db:5432/air')
+    
+    settings = database_settings('/data/app.db', env={'SQLITE_SYNCHRONOUS': 'FULL'})
+    assert settings['uri'] == 'sqlite:////data/app.db'
+    assert settings['pragmas']['synchronous'] == 'FULL'
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.data_ingestion.http_client import ResilientHTTPClient, RetryPolicy
+from src.data_ingestion.weather_ingestion import WeatherDataIngestion
+
+# Seconds the fake OpenWeatherMap server takes to answer for each city
+DELAYS = {'Delhi': 0.4, 'Mumbai': 0.1, 'Pune': 0.1, 'Chennai': 0.1, 'Kolkata': 0.1, 'Jaipur': 0.1, 'Slow': 3.0}
+
+def weather_server(stats: dict) -> web.Application:
+    """Fake /weather endpoint counting the requests in flight"""
+    async def weather(request):
+        city = request.query['q'].split(',')[0]
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        try:
+            await asyncio.sleep(DELAYS[city])
+        finally:
+            stats['in_flight'] -= 1
+        
+        return web.json_response({
+            'name': city,
+            'coord': {'lat': 28.6, 'lon': 77.2},
+            'main': {'temp': 31.5, 'humidity': 40, 'pressure': 1008},
+            'wind': {'speed': 2.5, 'deg': 270},
+            'visibility': 4000
+        })
+    
+    app = web.Application()
+    app.router.add_get('/weather', weather)
+    return app
+
+def collect(cities, max_concurrency: int, timeout: float):
+    """Run iter_current_weather_async against the fake server"""
+    stats = {'in_flight': 0, 'max_in_flight': 0}
+    
+    async def run():
+        async with TestServer(weather_server(stats)) as server:
+            ingestion = WeatherDataIngestion(
+                openweather_api_key='test-key',
+                openweather_base_url=str(server.make_url('')).rstrip('/'),
+                http_client=ResilientHTTPClient(retry_policy=RetryPolicy(max_retries=0))
+            )
+            started = time.monotonic()
+            received = []
+            async for record in ingestion.iter_current_weather_async(cities, max_concurrency, timeout):
+                received.append((record, time.monotonic() - started))
+            return received
+    
+    return asyncio.run(run()), stats
+
+def test_concurrency_is_bounded():
+    cities = [{'city': city, 'state': 'State'} for city in DELAYS if city != 'Slow']
+    
+    received, stats = collect(cities, max_concurrency=2, timeout=5)
+    
+    assert sorted(record['city'] for record, _ in received) == sorted(city['city'] for city in cities)
+    assert stats['max_in_flight'] == 2
+
+def test_timeout_applies_to_each_request():
+    cities = [{'city': city, 'state': 'State'} for city, delay in DELAYS.items() if delay < 0.2] + [
+        {'city': 'Slow', 'state': 'State'}
+    ]
+    
+    # Requests wait for the single slot, so the batch outlasts the timeout
+    received, _ = collect(cities, max_concurrency=1, timeout=0.3)
+    
+    assert [record['city'] for record, _ in received] == [city['city'] for city in cities[:-1]]
+    assert received[-1][1] > 0.3
+
+def test_records_are_yielded_as_responses_complete():
+    cities = [{'city': city, 'state': 'State'} for city in ('Delhi', 'Mumbai', 'Pune')]
+    
+    received, _ = collect(cities, max_concurrency=3, timeout=5)
+    
+    # Delhi is requested first but answers last
+    assert [record['city'] for record, _ in received][-1] == 'Delhi'
+    assert received[0][1] < DELAYS['Delhi']
+    
+    record = received[0][0]
+    assert record['state'] == 'State'
+    assert record['temperature'] == 31.5
+    assert record['wind_direction'] == 270
+    assert record['visibility'] == 4.0
@@ -1,8 +1,16 @@
 import requests
 import json
+import asyncio
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, AsyncIterator, Tuple
 import logging
+from src.data_ingestion.http_client import ResilientHTTPClient, CircuitOpenError
+from src.data_ingestion.raw_archive import OPENWEATHER_CURRENT_SOURCE, OPENWEATHER_FORECAST_SOURCE
+
+try:
+    import aiohttp
+except ImportError:  # Only needed by the async batch collector
+    aiohttp = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,9 +21,14 @@ class WeatherDataIngestion:
     Data ingestion class for weather data from various sources
     """
     
-    def __init__(self, openweather_api_key: Optional[str] = None):
+    def __init__(self, openweather_api_key: Optional[str] = None,
+                 openweather_base_url: str = "https://api.openweathermap.org/data/2.5",
+                 archive=None,
+                 http_client: Optional[ResilientHTTPClient] = None):
         self.openweather_api_key = openweather_api_key
-        self.openweather_base_url = "https://api.openweathermap.org/data/2.5"
+        self.openweather_base_url = openweather_base_url
+        self.archive = archive
+        self.http = http_client or ResilientHTTPClient()
         self.headers = {
             'User-Agent': 'AirQualityApp/1.0'
         }
@@ -49,7 +62,7 @@ class WeatherDataIngestion:
         }
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.openweather_base_url}/weather", 
                 params=params, 
                 headers=self.headers, 
@@ -58,6 +71,7 @@ class WeatherDataIngestion:
             response.raise_for_status()
             
             data = response.json()
+            self._archive_response(OPENWEATHER_CURRENT_SOURCE, data, params, city, state)
             
             processed_data = self._process_openweather_record(data, city, state)
             logger.info(f"Successfully fetched weather data for {city}")
@@ -101,7 +115,7 @@ class WeatherDataIngestion:
         }
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.openweather_base_url}/forecast", 
                 params=params, 
                 headers=self.headers, 
@@ -110,6 +124,7 @@ class WeatherDataIngestion:
             response.raise_for_status()
             
             data = response.json()
+            self._archive_response(OPENWEATHER_FORECAST_SOURCE, data, params, city, state)
             
             forecasts = []
             if 'list' in data:
@@ -129,6 +144,140 @@ class WeatherDataIngestion:
             logger.error(f"Error parsing weather forecast JSON for {city}: {e}")
             return []
     
+    async def iter_current_weather_async(self,
+                                         cities: Optional[List[Dict]] = None,
+                                         max_concurrency: int = 10,
+                                         timeout: float = 10) -> AsyncIterator[Dict]:
+        """
+        Fetch current weather for many cities concurrently
+        
+        Args:
+            cities: City dictionaries with 'city' and 'state' keys (defaults to major cities)
+            max_concurrency: Maximum number of requests in flight
+            timeout: Per-request timeout in seconds
+            
+        Yields:
+            Processed weather records, in order of completion
+        """
+        async for city_info, data in self._iter_openweather_async(
+                'weather', cities, {}, max_concurrency, timeout):
+            yield self._process_openweather_record(data, city_info['city'], city_info.get('state'))
+    
+    async def iter_weather_forecast_async(self,
+                                          cities: Optional[List[Dict]] = None,
+                                          days: int = 5,
+                                          max_concurrency: int = 10,
+                                          timeout: float = 10) -> AsyncIterator[Tuple[Dict, List[Dict]]]:
+        """
+        Fetch weather forecasts for many cities concurrently
+        
+        Args:
+            cities: City dictionaries with 'city' and 'state' keys (defaults to major cities)
+            days: Number of days to forecast (max 5 for free tier)
+            max_concurrency: Maximum number of requests in flight
+            timeout: Per-request timeout in seconds
+            
+        Yields:
+            Tuples of (city dictionary, list of weather forecast records), in order of completion
+        """
+        async for city_info, data in self._iter_openweather_async(
+                'forecast', cities, {'cnt': days * 8}, max_concurrency, timeout):
+            forecasts = [
+                self._process_openweather_forecast_record(
+                    forecast_item, city_info['city'], city_info.get('state'), data.get('city', {})
+                )
+                for forecast_item in data.get('list', [])
+            ]
+            yield city_info, forecasts
+    
+    def collect_current_weather(self,
+                                cities: Optional[List[Dict]] = None,
+                                max_concurrency: int = 10,
+                                timeout: float = 10) -> List[Dict]:
+        """
+        Blocking wrapper around iter_current_weather_async
+        
+        Returns:
+            List of processed weather records for the cities that succeeded
+        """
+        async def collect():
+            return [record async for record in self.iter_current_weather_async(cities, max_concurrency, timeout)]
+        
+        return asyncio.run(collect())
+    
+    async def _iter_openweather_async(self,
+                                      endpoint: str,
+                                      cities: Optional[List[Dict]],
+                                      extra_params: Dict,
+                                      max_concurrency: int,
+                                      timeout: float) -> AsyncIterator[Tuple[Dict, Dict]]:
+        """
+        Run one OpenWeatherMap request per city with bounded concurrency
+        
+        Yields:
+            Tuples of (city dictionary, decoded response) for successful requests
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for async weather collection")
+        
+        if not self.openweather_api_key:
+            logger.error("OpenWeatherMap API key not provided")
+            return
+        
+        cities = cities if cities is not None else self.get_major_indian_cities()
+        url = f"{self.openweather_base_url}/{endpoint}"
+        archive_source = OPENWEATHER_FORECAST_SOURCE if endpoint == 'forecast' else OPENWEATHER_CURRENT_SOURCE
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async with aiohttp.ClientSession(headers=self.headers,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            
+            async def fetch(city_info: Dict) -> Tuple[Dict, Optional[Dict]]:
+                params = self._openweather_params(city_info['city'], city_info.get('state'))
+                params.update(extra_params)
+                
+                async with semaphore:
+                    try:
+                        data = await self.http.get_json_async(session, url, params=params)
+                        self._archive_response(archive_source, data, params, city_info['city'], city_info.get('state'))
+                        return city_info, data
+                    except asyncio.TimeoutError:
+                        logger.error(f"Timed out fetching {endpoint} data for {city_info['city']}")
+                    except (aiohttp.ClientError, CircuitOpenError) as e:
+                        logger.error(f"Error fetching {endpoint} data for {city_info['city']}: {e}")
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Error parsing {endpoint} JSON for {city_info['city']}: {e}")
+                    return city_info, None
+            
+            tasks = [asyncio.ensure_future(fetch(city_info)) for city_info in cities]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    city_info, data = await next_done
+                    if data is not None:
+                        yield city_info, data
+            finally:
+                for task in tasks:
+                    task.cancel()
+    
+    def _archive_response(self, source: str, data: Dict, params: Dict, city: str, state: Optional[str]):
+        """Append a raw response to the archive, if one is configured"""
+        if self.archive is not None:
+            self.archive.append(source, data, request=dict(params, city=city, state=state))
+    
+    def _openweather_params(self, city: str, state: Optional[str] = None) -> Dict:
+        """Build the common OpenWeatherMap query parameters for a city"""
+        query = city
+        if state:
+            query += f",{state},IN"  # IN for India
+        else:
+            query += ",IN"
+        
+        return {
+            'q': query,
+            'appid': self.openweather_api_key,
+            'units': 'metric'  # Celsius
+        }
+    
     def fetch_weather_from_indian_api(self, city: str) -> Optional[Dict]:
         """
         Fetch weather data from Indian Weather API (indianapi.in)
@@ -145,7 +294,8 @@ class WeatherDataIngestion:
         logger.info(f"Indian Weather API integration for {city} - placeholder implementation")
         return None
     
-    def _process_openweather_record(self, data: Dict, city: str, state: str = None) -> Dict:
+    def _process_openweather_record(self, data: Dict, city: str, state: str = None,
+                                    recorded_at: Optional[datetime] = None) -> Dict:
         """
         Process OpenWeatherMap current weather record
         
@@ -153,6 +303,8 @@ class WeatherDataIngestion:
             data: Raw weather data from OpenWeatherMap
             city: City name
             state: State name
+            recorded_at: Observation time used when the response has no 'dt' (defaults to now,
+                archive replays pass the fetch time)
             
         Returns:
             Processed weather record
@@ -172,7 +324,8 @@ class WeatherDataIngestion:
             'wind_speed': wind.get('speed'),
             'wind_direction': wind.get('deg'),
             'visibility': data.get('visibility', 0) / 1000 if data.get('visibility') else None,  # Convert to km
-            'recorded_at': datetime.utcnow()
+            # 'dt' is the observation time, so polling an unchanged observation yields the same record
+            'recorded_at': datetime.utcfromtimestamp(data['dt']) if data.get('dt') else recorded_at or datetime.utcnow()
         }
     
     def _process_openweather_forecast_record(self, forecast_item: Dict, city: str, state: str, city_data: Dict) -> Dict: